@@ -0,0 +1,371 @@
+"""
+Benchmark the torrents function handler: latency percentiles, allocations
+and backend reads per request for every action, plus the latency/read
+budgets declared in backend/torrents/tests.json.
+
+Usage:
+    python backend/benchmark_handler.py [--size N] [--iterations N] [--only NAME]
+
+The handler runs in-process against the in-memory storage engine
+(STORAGE_ENGINE=memory) seeded with a synthetic catalog of --size torrents,
+so backend reads are counted exactly and no network is involved. Steam
+lookups go to a local stub server that serves canned appdetails responses.
+
+Latency is measured first, then every scenario is replayed once more under
+tracemalloc so allocation tracking does not skew the timings.
+The exit status is 1 when any tests.json case fails its status, body shape
+or budget check.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'torrents')
+TESTS_FILE = os.path.join(FUNCTION_DIR, 'tests.json')
+
+CATEGORIES = [
+    ('RPG', 'rpg'), ('Экшен', 'action'), ('Гонки', 'racing'), ('Стратегии', 'strategy'),
+    ('Инди', 'indie'), ('Симуляторы', 'simulator'), ('Хорроры', 'horror'), ('Спорт', 'sport')
+]
+
+TITLE_WORDS = [
+    'dark', 'souls', 'legend', 'space', 'empire', 'racing', 'night', 'city', 'dragon', 'quest',
+    'shadow', 'star', 'war', 'forest', 'metro', 'witcher', 'farm', 'craft', 'hunter', 'storm'
+]
+
+BENCH_PASSWORD = 'benchmark'
+
+
+class SteamStub(BaseHTTPRequestHandler):
+    """Canned Steam appdetails responses; app ids ending in 0 are 'not found'"""
+    
+    def do_GET(self):
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        app_id = params.get('appids', ['0'])[0]
+        if app_id.endswith('0'):
+            payload = {app_id: {'success': False}}
+        else:
+            payload = {app_id: {'success': True, 'data': {
+                'name': f'Stub game {app_id}',
+                'short_description': 'Stub description',
+                'header_image': f'https://example.com/{app_id}.jpg',
+                'screenshots': [{'path_full': f'https://example.com/{app_id}/{i}.jpg'} for i in range(8)],
+                'release_date': {'date': '1 Jan, 2020'},
+                'genres': [{'description': 'Action'}],
+                'recommendations': {'total': 1000},
+                'metacritic': {'score': 80}
+            }}}
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_steam_stub() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SteamStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_handler(steam_url: str):
+    """Import the function module configured for the in-memory engine"""
+    os.environ['STORAGE_ENGINE'] = 'memory'
+    os.environ['STEAM_API_URL'] = steam_url
+    os.environ.pop('STEAM_CACHE_FILE', None)
+    os.environ.setdefault('SESSION_SECRET', 'benchmark-session-secret')
+    sys.path.insert(0, FUNCTION_DIR)
+    import index
+    return index
+
+
+def seed(index, size: int, rng: random.Random) -> Dict[str, Any]:
+    """Fill the in-memory catalog with size torrents, categories and a user"""
+    import counters
+    import search_index
+    import snapshot
+    
+    db = index.get_db()
+    store = index.Storage(db)
+    slugs = [slug for _, slug in CATEGORIES]
+    
+    batch = store.batch()
+    for name, slug in CATEGORIES:
+        store.categories.create({'name': name, 'slug': slug, 'icon': 'Gamepad2'}, batch)
+    batch.commit()
+    
+    torrent_ids = []
+    category_counts: Dict[str, int] = {}
+    for start in range(0, size, 200):
+        batch = store.batch()
+        for i in range(start, min(start + 200, size)):
+            categories = rng.sample(slugs, rng.randint(1, 3))
+            data = {
+                'title': ' '.join(rng.sample(TITLE_WORDS, 3)).title() + f' {i}',
+                'poster': f'https://example.com/poster/{i}.jpg',
+                'downloads': rng.randint(0, 50000),
+                'size': round(rng.uniform(1, 120), 1),
+                'category': categories,
+                'description': ' '.join(rng.choices(TITLE_WORDS, k=30)),
+                'steam_deck': rng.random() < 0.3,
+                'steam_rating': rng.randint(0, 100000),
+                'metacritic_score': rng.randint(40, 99),
+                'created_at': '2025-01-01T00:00:00'
+            }
+            torrent_id = store.torrents.create(data, batch)
+            search_index.index_torrent(db, torrent_id, data, batch)
+            torrent_ids.append(torrent_id)
+            for slug in categories:
+                category_counts[slug] = category_counts.get(slug, 0) + 1
+        batch.commit()
+    
+    admin = {
+        'username': 'bench',
+        'email': 'bench@example.com',
+        'password_hash': index.hash_password(BENCH_PASSWORD),
+        'avatar': '',
+        'first_name': 'bench',
+        'created_at': '2025-01-01T00:00:00',
+        'is_admin': True
+    }
+    batch = store.batch()
+    admin_id = store.users.create(admin, batch)
+    store.users.claim(admin_id, admin, batch)
+    batch.commit()
+    
+    counters.reset(db, counters.CATEGORY_COUNTS, category_counts)
+    counters.reset(db, counters.TOTALS, {'games': size, 'users': 1, 'comments': 0})
+    snapshot.rebuild(db, store)
+    
+    return {'torrent_ids': torrent_ids, 'slugs': slugs, 'admin_token': index.sessions.issue(admin_id, True)}
+
+
+def event(
+    method: str,
+    path: str,
+    body: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """Synthetic platform event for a path like '/?action=stats'"""
+    query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(path).query))
+    return {
+        'httpMethod': method,
+        'queryStringParameters': query,
+        'headers': headers or {},
+        'body': json.dumps(body) if body is not None else None
+    }
+
+
+def scenarios(dataset: Dict[str, Any], rng: random.Random) -> Dict[str, Callable[[int], Dict[str, Any]]]:
+    """name -> factory of the i-th event for that scenario"""
+    torrent_ids = dataset['torrent_ids']
+    slugs = dataset['slugs']
+    admin = {'Authorization': f"Bearer {dataset['admin_token']}"}
+    # Torrents removed by the delete scenario are never touched by the others
+    deletable = torrent_ids[len(torrent_ids) // 2:]
+    
+    def torrent_body(i: int) -> Dict[str, Any]:
+        return {
+            'title': f'Benchmark torrent {i}',
+            'poster': 'https://example.com/poster.jpg',
+            'downloads': i,
+            'size': 10,
+            'categories': rng.sample(slugs, 2),
+            'description': 'benchmark'
+        }
+    
+    return {
+        'options': lambda i: event('OPTIONS', '/'),
+        'list': lambda i: event('GET', '/'),
+        'list compressed': lambda i: event('GET', '/', headers={'Accept-Encoding': 'gzip, br'}),
+        'list card page': lambda i: event('GET', '/?fields=card&limit=24'),
+        'list category': lambda i: event('GET', f'/?category={slugs[i % len(slugs)]}'),
+        'top': lambda i: event('GET', '/?action=top'),
+        'search': lambda i: event('GET', '/?action=search&q=' + urllib.parse.quote(rng.choice(TITLE_WORDS))),
+        'categories': lambda i: event('GET', '/?action=categories'),
+        'stats': lambda i: event('GET', '/?action=stats'),
+        'users': lambda i: event('GET', '/?action=users', headers=admin),
+        'auth login': lambda i: event('POST', '/?action=auth', {
+            'action': 'login', 'email': 'bench@example.com', 'password': BENCH_PASSWORD
+        }),
+        'auth register': lambda i: event('POST', '/?action=auth', {
+            'action': 'register', 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'secret'
+        }),
+        'create torrent': lambda i: event('POST', '/', torrent_body(i), admin),
+        'update torrent': lambda i: event('PUT', f'/?action={torrent_ids[i % len(deletable)]}', torrent_body(i), admin),
+        'delete torrent': lambda i: event('DELETE', f'/?id={deletable[i % len(deletable)]}', headers=admin),
+        'steam cached': lambda i: event('GET', '/?action=steam&appId=731'),
+        'steam miss': lambda i: event('GET', f'/?action=steam&appId={100001 + i * 10 + 1}')
+    }
+
+
+def invoke(index, request: Dict[str, Any]) -> Dict[str, Any]:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return index.handler(request, None)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[position]
+
+
+def run_scenario(index, make_event: Callable[[int], Dict[str, Any]], iterations: int, offset: int = 0) -> Dict[str, Any]:
+    db = index.get_db()
+    latencies = []
+    reads = []
+    statuses = set()
+    for i in range(offset, offset + iterations):
+        request = make_event(i)
+        db.reset_stats()
+        started = time.perf_counter()
+        response = invoke(index, request)
+        latencies.append((time.perf_counter() - started) * 1000)
+        reads.append(db.reads)
+        statuses.add(response['statusCode'])
+    
+    return {
+        'p50': statistics.median(latencies),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'reads': statistics.mean(reads),
+        'max_reads': max(reads),
+        'statuses': sorted(statuses)
+    }
+
+
+def measure_allocations(index, make_event: Callable[[int], Dict[str, Any]], iterations: int, offset: int) -> Dict[str, float]:
+    """Mean bytes still held after a request and peak traced memory during it"""
+    retained = []
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(offset, offset + iterations):
+            request = make_event(i)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            snapshot = tracemalloc.take_snapshot()
+            invoke(index, request)
+            after, peak = tracemalloc.get_traced_memory()
+            stats = tracemalloc.take_snapshot().compare_to(snapshot, 'filename')
+            retained.append(sum(stat.size_diff for stat in stats if stat.size_diff > 0))
+            peaks.append(peak - before)
+    finally:
+        tracemalloc.stop()
+    return {'retained_kib': statistics.mean(retained) / 1024, 'peak_kib': statistics.mean(peaks) / 1024}
+
+
+def type_matches(value: Any, expected: Any) -> bool:
+    if expected == 'array':
+        return isinstance(value, list)
+    if expected == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected == 'string':
+        return isinstance(value, str)
+    if expected == 'boolean':
+        return isinstance(value, bool)
+    if expected == 'object':
+        return isinstance(value, dict)
+    return value == expected
+
+
+def check_test(test: Dict[str, Any], response: Dict[str, Any], result: Dict[str, Any]) -> List[str]:
+    """Failures of one tests.json case: status, body shape and budgets"""
+    failures = []
+    if response['statusCode'] != test.get('expectedStatus', 200):
+        failures.append(f"status {response['statusCode']} != {test.get('expectedStatus', 200)}")
+    
+    expected_body = test.get('expectedBody')
+    if expected_body:
+        body = json.loads(response['body']) if response.get('body') else {}
+        for key, expected in expected_body.items():
+            if key not in body or not type_matches(body[key], expected):
+                failures.append(f'body.{key} is not {expected}')
+        if test.get('bodyMatcher', 'partial') == 'exact' and set(body) != set(expected_body):
+            failures.append(f'body keys {sorted(body)} != {sorted(expected_body)}')
+    
+    budget = test.get('budget', {})
+    for key in ('p50', 'p95', 'p99'):
+        limit = budget.get(f'{key}Ms')
+        if limit is not None and result[key] > limit:
+            failures.append(f'{key} {result[key]:.2f} ms > {limit} ms')
+    if budget.get('maxReads') is not None and result['max_reads'] > budget['maxReads']:
+        failures.append(f"reads {result['max_reads']} > {budget['maxReads']}")
+    return failures
+
+
+def print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'scenario':<34}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'reads':>9}{'retained KiB':>14}{'peak KiB':>10}  status")
+    for name, result in results.items():
+        print(
+            f"{name:<34}{result['p50']:>9.2f}{result['p95']:>9.2f}{result['p99']:>9.2f}"
+            f"{result['reads']:>9.1f}{result.get('retained_kib', 0):>14.1f}{result.get('peak_kib', 0):>10.1f}"
+            f"  {','.join(map(str, result['statuses']))}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=2000, help='torrents in the synthetic catalog')
+    parser.add_argument('--iterations', type=int, default=50, help='requests per scenario')
+    parser.add_argument('--only', help='run scenarios and tests whose name contains this string')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    server = start_steam_stub()
+    index = load_handler(f'http://127.0.0.1:{server.server_port}')
+    
+    started = time.perf_counter()
+    dataset = seed(index, args.size, rng)
+    print(f'seeded {args.size} torrents in {time.perf_counter() - started:.1f} s, '
+          f'{args.iterations} requests per scenario\n')
+    
+    results = {}
+    for name, make_event in scenarios(dataset, rng).items():
+        if args.only and args.only not in name:
+            continue
+        # Allocation pass uses fresh event numbers so writes never collide
+        results[name] = run_scenario(index, make_event, args.iterations)
+        results[name].update(measure_allocations(index, make_event, min(args.iterations, 10), args.iterations))
+    
+    with open(TESTS_FILE, encoding='utf-8') as f:
+        tests = json.load(f)['tests']
+    
+    failed = 0
+    test_results = {}
+    for test in tests:
+        if args.only and args.only not in test['name']:
+            continue
+        make_event = lambda i, test=test: event(test['method'], test['path'], test.get('body'), test.get('headers'))
+        response = invoke(index, make_event(0))
+        result = run_scenario(index, make_event, args.iterations)
+        test_results[f"test: {test['name']}"] = result
+        failures = check_test(test, response, result)
+        if failures:
+            failed += 1
+            print(f"FAIL {test['name']}: " + '; '.join(failures))
+    
+    print_table({**results, **test_results})
+    print(f'\n{len(test_results) - failed}/{len(test_results)} tests.json cases passed')
+    server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Micro-benchmark of listing serialization: the original per-request path
+(serialize_torrent() per document, then json.dumps of the whole list)
+against serialization.py fragments, cold (every fragment encoded) and
+warm (every fragment cached), with orjson and with the stdlib encoder.
+
+Usage:
+    python backend/benchmark_serialization.py [--size N] [--iterations N] [--fields card]
+
+Only encoding is measured: the documents are synthetic and built once, no
+handler or storage is involved. orjson rows are skipped when it is not
+installed.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'torrents')
+sys.path.insert(0, FUNCTION_DIR)
+os.environ.setdefault('STORAGE_ENGINE', 'memory')
+
+import serialization  # noqa: E402
+from index import FIELD_PRESETS, parse_fields, serialize_torrent  # noqa: E402
+
+WORDS = ['dark', 'souls', 'legend', 'space', 'империя', 'гонки', 'night', 'city', 'dragon', 'quest']
+
+
+def documents(size: int) -> List[Tuple[str, Dict[str, Any]]]:
+    rng = random.Random(42)
+    stamp = datetime.utcnow().isoformat()
+    return [
+        (f'torrent_{n:06d}', {
+            'title': ' '.join(rng.choice(WORDS) for _ in range(3)),
+            'poster': f'https://cdn.example.com/posters/{n}.jpg',
+            'downloads': rng.randint(0, 100_000),
+            'size': round(rng.uniform(0.5, 150), 1),
+            'category': rng.sample(['rpg', 'action', 'indie', 'racing', 'strategy'], 2),
+            'description': ' '.join(rng.choice(WORDS) for _ in range(60)),
+            'steam_deck': rng.random() < 0.5,
+            'steam_rating': rng.randint(0, 100),
+            'metacritic_score': rng.randint(40, 99),
+            'updated_at': stamp
+        })
+        for n in range(size)
+    ]
+
+
+def measure(run: Callable[[], Any], iterations: int, before: Optional[Callable[[], None]] = None) -> List[float]:
+    timings = []
+    for _ in range(iterations):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=5000, help='torrents per listing')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--fields', default=None, help=f"fields= projection, e.g. {', '.join(FIELD_PRESETS)}")
+    args = parser.parse_args()
+
+    docs = documents(args.size)
+    fields = parse_fields(args.fields)
+
+    def stdlib_listing() -> str:
+        return json.dumps({'torrents': [serialize_torrent(doc_id, data, fields) for doc_id, data in docs]})
+
+    def fragment_listing() -> str:
+        return serialization.body({'torrents': serialization.array(docs, fields, serialize_torrent)})
+
+    orjson = serialization._orjson
+    encoders = [('json', None)] + ([('orjson', orjson)] if orjson is not None else [])
+    rows = [('dict + json.dumps (before)', measure(stdlib_listing, args.iterations))]
+    for name, module in encoders:
+        serialization._orjson = module
+        rows.append((f'fragments cold, {name}', measure(fragment_listing, args.iterations, serialization.clear)))
+        serialization.clear()
+        fragment_listing()
+        rows.append((f'fragments warm, {name}', measure(fragment_listing, args.iterations)))
+    serialization._orjson = orjson
+
+    # Same document set must produce the same JSON on every path
+    expected = json.loads(stdlib_listing())
+    assert json.loads(fragment_listing()) == expected
+
+    print(f'{args.size} torrents, fields={args.fields or "all"}, {args.iterations} iterations, '
+          f'{len(stdlib_listing().encode("utf-8")) / 1024:.0f} KiB per listing')
+    print(f'{"path":<32} {"p50 ms":>8} {"p95 ms":>8} {"speedup":>8}')
+    baseline = statistics.median(rows[0][1])
+    for name, timings in rows:
+        p50 = statistics.median(timings)
+        p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+        print(f'{name:<32} {p50:>8.2f} {p95:>8.2f} {baseline / p50:>7.1f}x')
+    if orjson is None:
+        print('orjson is not installed: orjson rows skipped')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Exercise the Steam upstream client (backend/torrents/steam_client.py)
+against a local stub of the appdetails API:
+
+- sequential lookups: a new urllib connection per call (the previous
+  fetch path) against pooled keep-alive connections
+- single flight: concurrent lookups of one app share one upstream request
+- outage: 503s and 429s are retried, then the circuit breaker opens and
+  lookups fail fast until a probe after the cooldown succeeds
+
+Usage:
+    python backend/benchmark_steam_client.py [--lookups N] [--latency MS] [--concurrency N]
+
+Nothing leaves the machine; the stub listens on 127.0.0.1. Each scenario
+asserts the behaviour it measures, so a regression exits with an error.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'torrents')
+sys.path.insert(0, FUNCTION_DIR)
+
+from steam_client import CircuitBreaker, SteamClient, SteamUnavailable  # noqa: E402
+
+
+class StubState:
+    """Shared knobs and counters of the stub server"""
+
+    def __init__(self):
+        self.latency = 0.0
+        self.status = 200
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+def start_stub(state: StubState) -> ThreadingHTTPServer:
+    class SteamStub(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out as separate writes; without this the
+            # stub would stall keep-alive clients on delayed ACKs
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            state.count('connections')
+
+        def do_GET(self):
+            state.count('requests')
+            time.sleep(state.latency)
+            app_id = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query).get('appids', ['0'])[0]
+            if state.status == 200:
+                body = json.dumps({app_id: {'success': True, 'data': {'name': f'Stub game {app_id}'}}}).encode('utf-8')
+            else:
+                body = b'{}'
+            self.send_response(state.status)
+            if state.status == 429:
+                self.send_header('Retry-After', '0')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SteamStub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed(run: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    run()
+    return (time.perf_counter() - started) * 1000
+
+
+def urllib_lookup(base_url: str, app_id: str) -> Dict[str, Any]:
+    """The previous fetch path: one urllib connection per lookup"""
+    request = urllib.request.Request(f'{base_url}/appdetails?appids={app_id}&l=russian', headers={'User-Agent': 'Mozilla/5.0'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lookups', type=int, default=200, help='sequential lookups per path')
+    parser.add_argument('--latency', type=float, default=50, help='stub latency in ms for the concurrency scenario')
+    parser.add_argument('--concurrency', type=int, default=20, help='concurrent lookups of one app')
+    args = parser.parse_args()
+
+    state = StubState()
+    server = start_stub(state)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    rows: List[List[str]] = []
+
+    # Sequential lookups of distinct apps
+    before = state.connections
+    urllib_ms = timed(lambda: [urllib_lookup(base_url, str(n)) for n in range(args.lookups)])
+    rows.append(['sequential, urllib (before)', f'{urllib_ms:.0f}', str(args.lookups), str(state.connections - before)])
+
+    client = SteamClient(base_url)
+    before = state.connections
+    pooled_ms = timed(lambda: [client.appdetails(str(n), 'russian') for n in range(args.lookups)])
+    opened = state.connections - before
+    rows.append(['sequential, pooled client', f'{pooled_ms:.0f}', str(args.lookups), str(opened)])
+    assert opened == 1, f'expected one pooled connection, opened {opened}'
+
+    # Concurrent lookups of one app
+    state.latency = args.latency / 1000
+    before = state.requests
+    results: List[Any] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(client.appdetails('730', 'russian')))
+        for _ in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    coalesced_ms = (time.perf_counter() - started) * 1000
+    upstream = state.requests - before
+    rows.append([f'{args.concurrency} concurrent, one app', f'{coalesced_ms:.0f}', str(upstream), '-'])
+    assert len(results) == args.concurrency and upstream == 1, f'{upstream} upstream requests for one app'
+    state.latency = 0
+
+    # Outage: retries, then the breaker opens and lookups fail fast
+    breaker = CircuitBreaker(threshold=3, cooldown=0.5)
+    client = SteamClient(base_url, retries=2, base_delay=0.01, max_delay=0.05, breaker=breaker)
+    for status in (503, 429):
+        state.status = status
+        breaker.success()
+        before = state.requests
+        failures = 0
+        started = time.perf_counter()
+        for n in range(10):
+            try:
+                client.appdetails(f'9{n}', 'russian')
+            except Exception:
+                failures += 1
+        outage_ms = (time.perf_counter() - started) * 1000
+        upstream = state.requests - before
+        rows.append([f'10 lookups during {status}s', f'{outage_ms:.0f}', str(upstream), '-'])
+        assert failures == 10 and upstream == breaker.threshold, f'{upstream} upstream requests during the outage'
+        assert breaker.state == 'open'
+        try:
+            client.appdetails('1', 'russian')
+            raise AssertionError('open circuit let a lookup through')
+        except SteamUnavailable as e:
+            assert e.retry_after > 0
+
+    # Recovery: after the cooldown one probe closes the circuit again
+    state.status = 200
+    time.sleep(breaker.cooldown)
+    assert breaker.state == 'half-open'
+    client.appdetails('2', 'russian')
+    assert breaker.state == 'closed'
+    rows.append(['probe after cooldown', '-', '1', '-'])
+
+    server.shutdown()
+
+    print(f'{"scenario":<32} {"ms":>8} {"upstream":>9} {"conns":>6}')
+    for name, ms, upstream, connections in rows:
+        print(f'{name:<32} {ms:>8} {upstream:>9} {connections:>6}')
+    print(f'client stats: {client.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Measure cold-start cost of the torrents function: module import time and
+latency of the first requests in a fresh interpreter, for the working tree
+and (optionally) a baseline git revision.
+
+Usage:
+    python backend/measure_cold_start.py [--baseline REV] [--runs N]
+
+Each run starts a new Python process, so every number is a true cold start.
+Firebase is initialized with a generated throwaway service account, which is
+enough for credential parsing and client construction (no network I/O).
+The Steam upstream is replaced with a canned response so only handler
+overhead is measured.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+FUNCTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'torrents')
+
+PROBE = r'''
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+results = {}
+
+t = time.perf_counter()
+import index
+results['import_ms'] = (time.perf_counter() - t) * 1000
+
+index.fetch_steam_data = lambda app_id, lang='russian': {'name': 'stub', 'appId': app_id}
+
+def timed(name, event):
+    t = time.perf_counter()
+    response = index.handler(event, None)
+    results[name] = (time.perf_counter() - t) * 1000
+    return response
+
+timed('first_options_ms', {'httpMethod': 'OPTIONS'})
+timed('first_steam_ms', {'httpMethod': 'GET', 'queryStringParameters': {'action': 'steam', 'appId': '730'}})
+timed('warm_options_ms', {'httpMethod': 'OPTIONS'})
+
+results['firebase_loaded_before_firestore_route'] = 'firebase_admin' in sys.modules
+
+setup = getattr(index, 'get_db', None) or getattr(index, 'get_firestore', None)
+if setup:
+    t = time.perf_counter()
+    setup()
+    results['firestore_setup_ms'] = (time.perf_counter() - t) * 1000
+print(json.dumps(results))
+'''
+
+
+def fake_credentials() -> str:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('ascii')
+    return json.dumps({
+        'type': 'service_account',
+        'project_id': 'cold-start-probe',
+        'private_key_id': 'probe',
+        'private_key': pem,
+        'client_email': 'probe@cold-start-probe.iam.gserviceaccount.com',
+        'client_id': '0',
+        'token_uri': 'https://oauth2.googleapis.com/token'
+    })
+
+
+def export_revision(rev: str, target: str) -> str:
+    """Extract backend/torrents at a git revision into target, returns its path"""
+    archive = subprocess.run(
+        ['git', 'archive', rev, 'backend/torrents'],
+        cwd=os.path.dirname(os.path.dirname(FUNCTION_DIR)),
+        check=True,
+        capture_output=True
+    ).stdout
+    subprocess.run(['tar', '-x', '-C', target], input=archive, check=True)
+    return os.path.join(target, 'backend', 'torrents')
+
+
+def measure(function_dir: str, runs: int, env: dict) -> dict:
+    samples = []
+    # First run compiles bytecode and is discarded, as a deployed function ships warm .pyc
+    for run in range(runs + 1):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, function_dir],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout
+        if run:
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+    
+    report = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples]
+        if isinstance(values[0], bool):
+            report[key] = values[0]
+        else:
+            report[key] = round(statistics.median(values), 1)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--baseline', help='git revision to compare against, e.g. HEAD~1')
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            FIREBASE_CREDENTIALS=fake_credentials(),
+            STEAM_CACHE_FILE=os.path.join(tmp, 'steam_cache.json')
+        )
+        
+        variants = [('current', FUNCTION_DIR)]
+        if args.baseline:
+            variants.insert(0, (args.baseline, export_revision(args.baseline, tmp)))
+        
+        reports = {name: measure(path, args.runs, env) for name, path in variants}
+    
+    keys = []
+    for report in reports.values():
+        keys += [key for key in report if key not in keys]
+    
+    print(f"median of {args.runs} cold starts")
+    print(f"{'metric':<40}" + ''.join(f'{name:>16}' for name in reports))
+    for key in keys:
+        print(f'{key:<40}' + ''.join(f"{str(report.get(key, '-')):>16}" for report in reports.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,80 +1,61 @@
 """
-Script to migrate data from PostgreSQL to Firebase Firestore
-Run this once to transfer all existing data
-"""
-import json
-import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+Migrate data from PostgreSQL to Firebase Firestore.
 
-# Initialize Firebase
-cred_json = os.environ.get('FIREBASE_CREDENTIALS')
-if cred_json:
-    cred_dict = json.loads(cred_json)
-    cred = credentials.Certificate(cred_dict)
-    firebase_admin.initialize_app(cred)
+Usage:
+    python backend/migrate_to_firebase.py --dump dump.sql[.gz] [options]
+    python backend/migrate_to_firebase.py --csv-dir exports/ [options]
+    python backend/migrate_to_firebase.py --sqlite copy.db [options]
+    python backend/migrate_to_firebase.py --seed [options]
 
-db = firestore.client()
+Reads the categories, users, torrents and comments tables (schema of
+db_migrations/V0001-V0011) as a stream from a plain pg_dump, CSV exports
+(<table>.csv with a header row) or a SQLite copy, and writes them with
+deterministic document ids in parallel batches. Progress is kept in the
+checkpoint file: run the same command again after an interruption to resume.
+Credentials come from FIREBASE_CREDENTIALS; STORAGE_ENGINE=memory performs a
+dry run against the in-process store.
+"""
+import argparse
+import os
+import sys
 
-# Data from PostgreSQL
-categories_data = [
-    {'name': 'RPG', 'slug': 'RPG', 'icon': 'Sword'},
-    {'name': 'Экшен', 'slug': 'Action', 'icon': 'Zap'},
-    {'name': 'Гонки', 'slug': 'Racing', 'icon': 'Car'}
-]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'torrents'))
 
-users_data = [
-    {
-        'username': 'Kot',
-        'email': 'igorkochetkow@yandex.ru',
-        'password_hash': '497c0f6767166ad2242e9266d9ce34409ac43cd2a9e22b548aa7b1a6329a68d7',
-        'avatar': 'https://api.dicebear.com/7.x/avataaars/svg?seed=Kot',
-        'first_name': 'Kot',
-        'created_at': '2025-11-05T16:27:55.463905',
-        'is_admin': False
-    }
-]
+import migration
+from storage import Storage, create_client
 
-torrents_data = [
-    {
-        'title': 'Counter-Strike 2',
-        'poster': 'https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/730/ss_0f8cf82d019c614760fd20801f2bb4001da7ea77.1920x1080.jpg?t=1749053861',
-        'downloads': 0,
-        'size': 16.0,
-        'category': ['action', 'RPG'],
-        'description': 'Более двух десятилетий Counter-Strike служит примером первоклассной соревновательной игры, путь развития которой определяют миллионы игроков со всего мира. Теперь пришло время нового этапа — Counter-Strike 2.',
-        'steam_deck': True,
-        'steam_rating': 4755307,
-        'metacritic_score': None
-    }
-]
 
-def migrate():
-    print("Starting migration to Firebase Firestore...")
-    
-    # Migrate categories
-    print(f"\nMigrating {len(categories_data)} categories...")
-    for cat in categories_data:
-        doc_ref = db.collection('categories').add(cat)
-        print(f"  ✓ Added category: {cat['name']} (ID: {doc_ref[1].id})")
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Migrate PostgreSQL data to Firestore')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dump', help='plain-format pg_dump file (.sql or .sql.gz)')
+    source.add_argument('--csv-dir', help='directory with <table>.csv exports')
+    source.add_argument('--sqlite', help='SQLite copy of the database')
+    source.add_argument('--seed', action='store_true', help='the built-in seed rows')
+    parser.add_argument('--tables', nargs='+', choices=migration.TABLES, default=list(migration.TABLES))
+    parser.add_argument('--checkpoint', default='migration_checkpoint.json', help='resume state file')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    parser.add_argument('--workers', type=int, default=4, help='batches committed in parallel')
+    parser.add_argument('--skip-snapshot', action='store_true', help='do not rebuild the catalog snapshot')
+    args = parser.parse_args()
     
-    # Migrate users
-    print(f"\nMigrating {len(users_data)} users...")
-    for user in users_data:
-        doc_ref = db.collection('users').add(user)
-        print(f"  ✓ Added user: {user['username']} (ID: {doc_ref[1].id})")
+    rows = migration.open_source(args.dump, args.csv_dir, args.sqlite)
+    try:
+        checkpoint = migration.Checkpoint(args.checkpoint, rows.name, restart=args.restart)
+    except ValueError as e:
+        parser.error(str(e))
+    db = create_client()
+    migrator = migration.Migrator(db, Storage(db), rows, checkpoint, workers=args.workers)
     
-    # Migrate torrents
-    print(f"\nMigrating {len(torrents_data)} torrents...")
-    for torrent in torrents_data:
-        doc_ref = db.collection('torrents').add(torrent)
-        print(f"  ✓ Added torrent: {torrent['title']} (ID: {doc_ref[1].id})")
+    print(f"Starting migration from {rows.name} to Firebase Firestore...")
+    result = migrator.run(tuple(args.tables), rebuild_snapshot=not args.skip_snapshot)
     
     print("\n✅ Migration completed successfully!")
-    print("\nCollections created:")
-    print(f"  - categories: {len(categories_data)} documents")
-    print(f"  - users: {len(users_data)} documents")
-    print(f"  - torrents: {len(torrents_data)} documents")
+    print("\nCollections now hold:")
+    for name, count in result['totals'].items():
+        print(f"  - {name}: {count} documents")
+    return 0
+
 
 if __name__ == '__main__':
-    migrate()
+    sys.exit(main())
@@ -0,0 +1,161 @@
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import catalog
+import counters
+import search_index
+
+# Bulk torrent mutations (action=bulk).
+# Every operation is validated before anything is written, then operations
+# are committed in WriteBatches together with their search index entries,
+# the aggregated counter deltas and the catalog version bump, so each batch
+# is all-or-nothing and counters never drift from the documents.
+
+MAX_BATCH_WRITES = 500
+MAX_OPERATIONS = 2000
+
+# Torrent document, search index entry and (for deletes) the change feed
+# tombstone per operation; category counters, totals and catalog version
+# once per batch
+WRITES_PER_OPERATION = 3
+WRITES_PER_BATCH = 3
+OPERATIONS_PER_BATCH = (MAX_BATCH_WRITES - WRITES_PER_BATCH) // WRITES_PER_OPERATION
+
+OPERATIONS = ('create', 'update', 'delete')
+
+
+def plan(
+    operations: Any,
+    existing: Dict[str, Dict[str, Any]],
+    to_document: Callable[[Dict[str, Any], bool], Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Validate request operations against the existing torrents they target.
+    Returns (planned operations, errors); errors carry the operation index.
+    to_document maps an API body to Firestore fields, partial for updates,
+    and raises ValueError for invalid values.
+    """
+    if not isinstance(operations, list) or not operations:
+        return [], [{'index': None, 'error': 'operations must be a non-empty list'}]
+    if len(operations) > MAX_OPERATIONS:
+        return [], [{'index': None, 'error': f'At most {MAX_OPERATIONS} operations per request'}]
+    
+    planned = []
+    errors = []
+    seen_ids = set()
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            errors.append({'index': index, 'error': f"op must be one of {', '.join(OPERATIONS)}"})
+            continue
+        
+        op = operation['op']
+        torrent_id = operation.get('id')
+        if op == 'create':
+            torrent_id = None
+        elif not isinstance(torrent_id, str) or not torrent_id:
+            errors.append({'index': index, 'error': 'id is required'})
+            continue
+        elif torrent_id in seen_ids:
+            errors.append({'index': index, 'error': f'Duplicate id in request: {torrent_id}'})
+            continue
+        elif torrent_id not in existing:
+            errors.append({'index': index, 'error': f'Torrent not found: {torrent_id}'})
+            continue
+        
+        data = None
+        if op != 'delete':
+            body = operation.get('data')
+            if not isinstance(body, dict):
+                errors.append({'index': index, 'error': 'data must be an object'})
+                continue
+            try:
+                data = to_document(body, op == 'update')
+            except (TypeError, ValueError) as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+        
+        if torrent_id:
+            seen_ids.add(torrent_id)
+        planned.append({
+            'index': index,
+            'op': op,
+            'id': torrent_id,
+            'data': data,
+            'old': existing.get(torrent_id) if torrent_id else None
+        })
+    
+    return planned, errors
+
+
+def target_ids(operations: Any) -> List[str]:
+    """Ids referenced by update/delete operations, for fetching them in one round-trip"""
+    if not isinstance(operations, list):
+        return []
+    return list({
+        operation['id'] for operation in operations
+        if isinstance(operation, dict) and operation.get('op') in ('update', 'delete')
+        and isinstance(operation.get('id'), str) and operation['id']
+    })
+
+
+def _add(totals: Dict[str, int], deltas: Dict[str, int]) -> None:
+    for key, delta in deltas.items():
+        totals[key] = totals.get(key, 0) + delta
+
+
+def run(db, store, planned: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str], int]:
+    """
+    Commit planned operations in batches.
+    Returns (per-operation results, ids of changed torrents, committed batches).
+    A failed commit leaves its batch unwritten and stops the run; later
+    operations are reported as not attempted.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(planned)
+    changed_ids: List[str] = []
+    commits = 0
+    
+    for start in range(0, len(planned), OPERATIONS_PER_BATCH):
+        chunk = planned[start:start + OPERATIONS_PER_BATCH]
+        batch = store.batch()
+        category_deltas: Dict[str, int] = {}
+        games = 0
+        ids = []
+        
+        for operation in chunk:
+            op, data, old = operation['op'], operation['data'], operation['old'] or {}
+            if op == 'create':
+                torrent_id = store.torrents.create(data, batch)
+                search_index.index_torrent(db, torrent_id, data, batch)
+                _add(category_deltas, counters.category_deltas([], data.get('category')))
+                games += 1
+            elif op == 'update':
+                torrent_id = operation['id']
+                store.torrents.update(torrent_id, data, batch)
+                search_index.index_torrent(db, torrent_id, dict(old, **data), batch)
+                if 'category' in data:
+                    _add(category_deltas, counters.category_deltas(old.get('category'), data['category']))
+            else:
+                torrent_id = operation['id']
+                store.torrents.delete(torrent_id, batch)
+                search_index.remove_torrent(db, torrent_id, batch)
+                _add(category_deltas, counters.category_deltas(old.get('category'), []))
+                games -= 1
+            ids.append(torrent_id)
+        
+        counters.increment(db, counters.CATEGORY_COUNTS, category_deltas, batch)
+        counters.increment(db, counters.TOTALS, {'games': games}, batch)
+        catalog.bump(db, batch)
+        
+        try:
+            batch.commit()
+        except Exception as e:
+            for position, operation in enumerate(planned[start:], start):
+                error = f'Batch commit failed: {str(e)}' if position < start + len(chunk) else 'Not attempted'
+                results[position] = {'index': operation['index'], 'op': operation['op'], 'ok': False, 'error': error}
+            break
+        
+        commits += 1
+        changed_ids.extend(ids)
+        for position, (operation, torrent_id) in enumerate(zip(chunk, ids), start):
+            results[position] = {'index': operation['index'], 'op': operation['op'], 'ok': True, 'id': torrent_id}
+    
+    return results, changed_ids, commits
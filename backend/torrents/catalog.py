@@ -0,0 +1,77 @@
+import hashlib
+import os
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from storage import field_values
+
+# Catalog version stamp for conditional GETs.
+# meta/catalog holds a version number incremented by every write that can
+# change a catalog response (torrents, categories, category counts), in the
+# same batch as the write itself. Listing and category responses carry an
+# ETag derived from the version and the query, so clients and a CDN can
+# revalidate with If-None-Match for the price of a single document read.
+# Download counts move the version too, but only as often as the downloads
+# roll-up folds them in (DOWNLOAD_ROLLUP_INTERVAL, see downloads.py).
+
+META_COLLECTION = 'meta'
+CATALOG_DOC = 'catalog'
+
+# Browsers always revalidate; a shared cache may serve a response for
+# CATALOG_CDN_MAX_AGE seconds and keep serving it while revalidating.
+CATALOG_CDN_MAX_AGE = int(os.environ.get('CATALOG_CDN_MAX_AGE', '30'))
+CATALOG_STALE_WHILE_REVALIDATE = int(os.environ.get('CATALOG_STALE_WHILE_REVALIDATE', '60'))
+
+CACHE_CONTROL = (
+    f'public, max-age=0, s-maxage={CATALOG_CDN_MAX_AGE}, '
+    f'stale-while-revalidate={CATALOG_STALE_WHILE_REVALIDATE}'
+)
+
+
+def _ref(db):
+    return db.collection(META_COLLECTION).document(CATALOG_DOC)
+
+
+def bump(db, batch=None, fields: Optional[Dict[str, Any]] = None) -> None:
+    """Advance the catalog version, inside batch when given; fields are stored alongside"""
+    data = dict(fields or {}, version=field_values(db).Increment(1), updated_at=datetime.utcnow().isoformat())
+    if batch is not None:
+        batch.set(_ref(db), data, merge=True)
+    else:
+        _ref(db).set(data, merge=True)
+
+
+def read(db) -> Dict[str, Any]:
+    """The meta/catalog document: version plus the fields bump() stored"""
+    doc = _ref(db).get()
+    return (doc.to_dict() or {}) if doc.exists else {}
+
+
+def read_version(db) -> int:
+    return int(read(db).get('version', 0))
+
+
+def etag(version: int, query_params: Dict[str, Any]) -> str:
+    """Strong ETag for a response fully determined by the catalog version and the query"""
+    query = '&'.join(f'{key}={query_params[key]}' for key in sorted(query_params))
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+def matches(if_none_match: Optional[str], tag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == tag:
+            return True
+    return False
+
+
+def headers(tag: str) -> Dict[str, str]:
+    return {'ETag': tag, 'Cache-Control': CACHE_CONTROL}
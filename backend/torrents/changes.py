@@ -0,0 +1,161 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple
+
+import catalog
+import fanout
+
+# Delta sync (action=changes).
+# TorrentRepository stamps every created or updated torrent with `revision`,
+# the commit timestamp of its write (SERVER_TIMESTAMP), and a delete leaves
+# torrent_tombstones/{id} stamped the same way. Commit timestamps follow
+# commit order and a query sees every commit stamped before it runs, so the
+# feed is read as "torrents and tombstones after position (revision, id)".
+# A position is the last change a page returned or, once a client has caught
+# up, a watermark CHANGES_SETTLE_SECONDS before the request to absorb clock
+# skew between the function and Firestore; changes inside that window may be
+# sent twice, which is harmless since applying them is idempotent.
+# Tombstones older than TOMBSTONE_TTL are compacted (action=changes-compact,
+# run on a schedule). meta/changes.compacted_before records the cutoff first,
+# and a client whose position is older gets resync: true and a fresh copy of
+# the catalog instead of a delta that could miss deletions.
+# A fresh copy (first sync or resync) is paged in document id order, limit
+# torrents per response; its positions carry the watermark taken when it
+# started and the last id sent ('s'). After the last page the feed
+# continues from that watermark, so changes made while paging, including
+# deletions of torrents already sent, arrive as an ordinary delta.
+
+META_DOC = 'changes'
+
+CHANGES_PAGE_SIZE = 500
+MAX_CHANGES_PAGE_SIZE = 1000
+CHANGES_SETTLE_SECONDS = float(os.environ.get('CHANGES_SETTLE_SECONDS', '5'))
+TOMBSTONE_TTL = float(os.environ.get('TOMBSTONE_TTL', str(30 * 24 * 3600)))
+
+MAX_BATCH_WRITES = 500
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+Document = Tuple[str, Dict[str, Any]]
+
+
+def to_micros(value: datetime) -> int:
+    """Revision as integer microseconds since the epoch, the form tokens carry"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+def _now() -> int:
+    return to_micros(datetime.now(timezone.utc))
+
+
+def _ref(db):
+    return db.collection(catalog.META_COLLECTION).document(META_DOC)
+
+
+def compacted_before(db) -> int:
+    doc = _ref(db).get()
+    return (doc.to_dict() or {}).get('compacted_before', 0) if doc.exists else 0
+
+
+def check_position(position: Optional[Dict[str, Any]]) -> None:
+    """Reject tokens that are not change feed positions"""
+    if position is None:
+        return
+    revision = position.get('r')
+    if (
+        not isinstance(revision, int) or isinstance(revision, bool)
+        or not isinstance(position.get('id', ''), str)
+        or not isinstance(position.get('s', ''), str)
+    ):
+        raise ValueError('Invalid since token')
+
+
+def fetch(db, store, position: Optional[Dict[str, Any]], limit: int = CHANGES_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Changes after a position from a previous response (None for a first sync).
+    Returns upserts (documents), deleted (ids), the next position, whether
+    more changes are waiting, and resync when the client must drop its copy
+    before applying upserts (the first page of a fresh copy).
+    """
+    watermark = _now() - int(CHANGES_SETTLE_SECONDS * 1_000_000)
+    
+    if position is None or position['r'] < compacted_before(db):
+        # Everything committed before the watermark is in the pages read from here on
+        return _copy_page(store, watermark, None, limit, resync=True)
+    if position.get('s'):
+        return _copy_page(store, position['r'], position['s'], limit, resync=False)
+    
+    after = {'revision': from_micros(position['r']), 'id': position.get('id') or ''}
+    upserted, deleted = fanout.gather([
+        lambda: store.torrents.changed_since(after, limit + 1),
+        lambda: store.torrents.deleted_since(after, limit + 1)
+    ])
+    
+    merged = sorted(
+        [(to_micros(data['revision']), torrent_id, data) for torrent_id, data in upserted]
+        + [(to_micros(data['revision']), torrent_id, None) for torrent_id, data in deleted],
+        key=lambda change: change[:2]
+    )
+    page = merged[:limit]
+    more = len(merged) > limit
+    
+    # Latest change per torrent wins: a torrent re-created after a delete is an upsert
+    latest: Dict[str, Optional[Dict[str, Any]]] = {}
+    for _, torrent_id, data in page:
+        latest.pop(torrent_id, None)
+        latest[torrent_id] = data
+    
+    if more:
+        revision, torrent_id, _ = page[-1]
+        next_position = {'r': revision, 'id': torrent_id}
+    else:
+        next_position = {'r': max(watermark, position['r']), 'id': ''}
+    
+    return {
+        'resync': False,
+        'upserts': [(torrent_id, data) for torrent_id, data in latest.items() if data is not None],
+        'deleted': [torrent_id for torrent_id, data in latest.items() if data is None],
+        'position': next_position,
+        'more': more
+    }
+
+
+def _copy_page(store, watermark: int, after: Optional[str], limit: int, resync: bool) -> Dict[str, Any]:
+    """
+    One page of a fresh copy, torrents in id order after the id `after`.
+    more stays true after the last page: the changes made since the copy
+    began follow as a delta.
+    """
+    torrents = store.torrents.by_id(after, limit + 1)
+    next_position: Dict[str, Any] = {'r': watermark, 'id': ''}
+    if len(torrents) > limit:
+        torrents = torrents[:limit]
+        next_position['s'] = torrents[-1][0]
+    return {'resync': resync, 'upserts': torrents, 'deleted': [], 'position': next_position, 'more': True}
+
+
+def compact(db, store, ttl: float = TOMBSTONE_TTL) -> Dict[str, Any]:
+    """Delete tombstones older than ttl seconds; older positions must resync from now on"""
+    cutoff = _now() - int(ttl * 1_000_000)
+    if cutoff > compacted_before(db):
+        # Recorded before anything is deleted, so no client misses a deletion
+        _ref(db).set({'compacted_before': cutoff}, merge=True)
+    
+    purged = 0
+    while True:
+        expired = store.torrents.expired_tombstones(from_micros(cutoff), MAX_BATCH_WRITES)
+        if not expired:
+            break
+        batch = store.batch()
+        for torrent_id in expired:
+            store.torrents.purge_tombstone(torrent_id, batch)
+        batch.commit()
+        purged += len(expired)
+    
+    return {'purged': purged, 'compacted_before': cutoff}
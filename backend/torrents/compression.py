@@ -0,0 +1,141 @@
+import base64
+import gzip
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import tracing
+
+# Response compression negotiated from Accept-Encoding.
+# Bodies of at least COMPRESSION_MIN_BYTES are sent as br (when the brotli
+# package is installed) or gzip, base64-encoded with isBase64Encoded: True
+# as the platform requires for binary bodies. Compressed responses that
+# carry an ETag are kept in an in-process LRU keyed by (ETag, encoding):
+# the ETag already pins the catalog version and the query, so a repeated
+# request is answered without rebuilding or recompressing the body.
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+COMPRESSION_CACHE_BYTES = int(os.environ.get('COMPRESSION_CACHE_BYTES', str(32 * 1024 * 1024)))
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+_brotli = None
+_brotli_checked = False
+
+_cache: 'OrderedDict[Tuple[str, str], Dict[str, Any]]' = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def _brotli_module():
+    global _brotli, _brotli_checked
+    if not _brotli_checked:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = None
+        _brotli_checked = True
+    return _brotli
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Preferred supported coding ('br' or 'gzip') from an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+    
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding] = quality
+    
+    candidates = ['br', 'gzip'] if _brotli_module() is not None else ['gzip']
+    best = None
+    for coding in candidates:
+        quality = weights.get(coding, weights.get('*', 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (coding, quality)
+    return best[0] if best else None
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    if coding == 'br':
+        return _brotli_module().compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _weak(tag: str) -> str:
+    # Different bytes per coding: the strong validator becomes weak
+    return tag if tag.startswith('W/') else f'W/{tag}'
+
+
+def cached(accept_encoding: Optional[str], tag: str) -> Optional[Dict[str, Any]]:
+    """Previously compressed response for this ETag and the negotiated coding"""
+    coding = negotiate(accept_encoding)
+    if coding is None:
+        return None
+    
+    with _cache_lock:
+        response = _cache.get((tag, coding))
+        if response is None:
+            return None
+        _cache.move_to_end((tag, coding))
+    
+    return dict(response, headers=dict(response['headers']))
+
+
+def _remember(tag: str, coding: str, response: Dict[str, Any]) -> None:
+    global _cache_bytes
+    size = len(response['body'])
+    if size > COMPRESSION_CACHE_BYTES:
+        return
+    
+    with _cache_lock:
+        previous = _cache.pop((tag, coding), None)
+        if previous is not None:
+            _cache_bytes -= len(previous['body'])
+        _cache[(tag, coding)] = response
+        _cache_bytes += size
+        while _cache_bytes > COMPRESSION_CACHE_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted['body'])
+
+
+def apply(accept_encoding: Optional[str], response: Dict[str, Any]) -> Dict[str, Any]:
+    """Compress the response body when the client accepts it and it is large enough"""
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    headers = dict(response.get('headers') or {})
+    headers['Vary'] = 'Accept-Encoding'
+    response = dict(response, headers=headers)
+    
+    data = body.encode('utf-8')
+    coding = negotiate(accept_encoding)
+    if coding is None or len(data) < COMPRESSION_MIN_BYTES:
+        return response
+    
+    with tracing.span('compress'):
+        encoded = base64.b64encode(compress(data, coding)).decode('ascii')
+    
+    headers['Content-Encoding'] = coding
+    tag = headers.get('ETag')
+    if tag:
+        headers['ETag'] = _weak(tag)
+    response.update(body=encoded, isBase64Encoded=True)
+    
+    if tag and response.get('statusCode') == 200:
+        _remember(tag, coding, dict(response, headers=dict(headers)))
+    
+    return response
@@ -0,0 +1,102 @@
+import random
+import time
+from typing import Dict, Any, Iterable, Optional
+
+from storage import field_values
+
+# Sharded counters: counters/{name}/shards/{0..NUM_SHARDS-1}
+# Each write increments one random shard, so a counter sustains
+# NUM_SHARDS times Firestore's per-document write rate. Reading a counter
+# costs NUM_SHARDS document reads regardless of what it counts.
+
+COUNTERS_COLLECTION = 'counters'
+NUM_SHARDS = 10
+
+CATEGORY_COUNTS = 'category_counts'
+TOTALS = 'totals'
+
+# name -> (expires_at, values); lives as long as the warm function instance
+_cache: Dict[str, Any] = {}
+
+
+def _shards(db, name: str):
+    return db.collection(COUNTERS_COLLECTION).document(name).collection('shards')
+
+
+def increment(db, name: str, deltas: Dict[str, int], batch=None) -> None:
+    """Add deltas (field -> amount) to a random shard of the counter"""
+    increment_by = field_values(db).Increment
+    data = {field: increment_by(delta) for field, delta in deltas.items() if delta}
+    if not data:
+        return
+    
+    ref = _shards(db, name).document(str(random.randrange(NUM_SHARDS)))
+    if batch is not None:
+        batch.set(ref, data, merge=True)
+    else:
+        ref.set(data, merge=True)
+    invalidate(name)
+
+
+def read(db, name: str) -> Dict[str, int]:
+    """Sum all shards of the counter"""
+    totals: Dict[str, int] = {}
+    for shard in _shards(db, name).stream():
+        for field, value in (shard.to_dict() or {}).items():
+            totals[field] = totals.get(field, 0) + (value or 0)
+    return totals
+
+
+def read_cached(db, name: str, ttl: float) -> Dict[str, int]:
+    """read() memoized in-process for ttl seconds, ttl <= 0 disables caching"""
+    if ttl <= 0:
+        return read(db, name)
+    
+    now = time.monotonic()
+    cached = _cache.get(name)
+    if cached and cached[0] > now:
+        return cached[1]
+    
+    values = read(db, name)
+    _cache[name] = (now + ttl, values)
+    return values
+
+
+def invalidate(name: str) -> None:
+    """Drop the in-process cached value of a counter"""
+    _cache.pop(name, None)
+
+
+def reset(db, name: str, values: Dict[str, int]) -> None:
+    """Replace the counter with exact values, e.g. after a full recount"""
+    batch = db.batch()
+    shards = _shards(db, name)
+    for i in range(NUM_SHARDS):
+        batch.delete(shards.document(str(i)))
+    batch.set(shards.document('0'), values)
+    batch.commit()
+    invalidate(name)
+
+
+def count_collection(db, collection: str) -> int:
+    """Server-side aggregation count, billed per 1000 index entries instead of per document"""
+    result = db.collection(collection).count().get()
+    return int(result[0][0].value)
+
+
+def category_deltas(old: Optional[Iterable[str]], new: Optional[Iterable[str]]) -> Dict[str, int]:
+    """Per-category count changes when a torrent's category list goes from old to new"""
+    old_set = set(old or [])
+    new_set = set(new or [])
+    deltas = {slug: 1 for slug in new_set - old_set}
+    deltas.update({slug: -1 for slug in old_set - new_set})
+    return deltas
+
+
+def count_categories(torrents: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Count torrents per category slug from torrent documents"""
+    counts: Dict[str, int] = {}
+    for torrent_data in torrents:
+        for slug in set(torrent_data.get('category') or []):
+            counts[slug] = counts.get(slug, 0) + 1
+    return counts
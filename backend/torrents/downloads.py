@@ -0,0 +1,243 @@
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import catalog
+import search_index
+from storage import field_values
+
+# Download counting (action=download).
+# Downloads never touch the torrent document on the request path: each warm
+# instance buffers them in-process and flushes the aggregated increments
+# every DOWNLOAD_FLUSH_INTERVAL seconds as one write to a random shard of
+# the current time bucket, download_shards/{bucket}_{shard}, whose fields
+# are torrent id -> pending downloads. Load spreads over DOWNLOAD_SHARDS
+# documents per bucket, far below Firestore's sustained per-document write
+# rate. The roll-up (action=downloads-rollup, run on a schedule) folds
+# closed buckets, which no instance writes to any more, into the
+# `downloads` field the listings order on. Each commit adds the increments
+# and clears the shard fields it applied together, so a failed or repeated
+# roll-up never double counts.
+# Folding bumps the catalog version, which invalidates every ETag and the
+# snapshot, so a roll-up within DOWNLOAD_ROLLUP_INTERVAL seconds of the
+# last fold leaves the shards for a later run: listings catch up with
+# downloads at most that often however frequently the schedule fires.
+# A buffer is flushed by the first request to end after it is due, or by a
+# timer armed when it starts filling if the instance goes idle. A buffer
+# still unflushed when an instance is recycled is lost; set
+# DOWNLOAD_FLUSH_INTERVAL=0 to write every download straight to a shard.
+
+PENDING_COLLECTION = 'download_shards'
+
+DOWNLOAD_SHARDS = int(os.environ.get('DOWNLOAD_SHARDS', '10'))
+DOWNLOAD_BUCKET_SECONDS = int(os.environ.get('DOWNLOAD_BUCKET_SECONDS', '60'))
+DOWNLOAD_FLUSH_INTERVAL = float(os.environ.get('DOWNLOAD_FLUSH_INTERVAL', '1'))
+DOWNLOAD_ROLLUP_INTERVAL = float(os.environ.get('DOWNLOAD_ROLLUP_INTERVAL', '600'))
+
+# Distinct torrents buffered before flushing regardless of the interval
+MAX_PENDING_TORRENTS = 200
+
+MAX_BATCH_WRITES = 500
+
+# Torrent document + search index entry per torrent, the shard document per
+# shard piece, the catalog version once per batch
+WRITES_PER_TORRENT = 2
+TORRENTS_PER_PIECE = (MAX_BATCH_WRITES - 2) // WRITES_PER_TORRENT
+
+_TORRENT_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+_pending: Dict[str, int] = {}
+_pending_since = 0.0
+_pending_lock = threading.Lock()
+_flush_timer: Optional[threading.Timer] = None
+
+
+def _collection(db):
+    return db.collection(PENDING_COLLECTION)
+
+
+def valid_id(torrent_id: Any) -> bool:
+    """Torrent ids are stored as shard field names, so only plain ids are accepted"""
+    return isinstance(torrent_id, str) and bool(_TORRENT_ID_RE.match(torrent_id))
+
+
+def bucket(now: Optional[float] = None) -> int:
+    return int((time.time() if now is None else now) // DOWNLOAD_BUCKET_SECONDS)
+
+
+def _shard_id(bucket_number: int, shard: int) -> str:
+    # Zero-padded so shard ids sort by bucket
+    return f'{bucket_number:012d}_{shard}'
+
+
+def _arm_timer(db) -> None:
+    """Flush the buffer once DOWNLOAD_FLUSH_INTERVAL has passed; call with _pending_lock held"""
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(DOWNLOAD_FLUSH_INTERVAL, _flush_from_timer, (db,))
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def _flush_from_timer(db) -> None:
+    global _flush_timer
+    with _pending_lock:
+        _flush_timer = None
+    try:
+        flush(db)
+    except Exception as e:
+        print(f"DOWNLOADS: timed flush failed: {str(e)}")
+        with _pending_lock:
+            if _pending:
+                _arm_timer(db)
+
+
+def record(db, torrent_id: str, count: int = 1) -> int:
+    """Buffer downloads of a torrent, flushing when due; returns downloads flushed"""
+    global _pending_since
+    now = time.monotonic()
+    with _pending_lock:
+        if not _pending:
+            _pending_since = now
+        _pending[torrent_id] = _pending.get(torrent_id, 0) + count
+        due = now - _pending_since >= DOWNLOAD_FLUSH_INTERVAL or len(_pending) >= MAX_PENDING_TORRENTS
+        if not due:
+            _arm_timer(db)
+    return flush(db) if due else 0
+
+
+def flush_due(db) -> int:
+    """flush() if the buffer has waited DOWNLOAD_FLUSH_INTERVAL; run at the end of every request"""
+    with _pending_lock:
+        due = bool(_pending) and time.monotonic() - _pending_since >= DOWNLOAD_FLUSH_INTERVAL
+    return flush(db) if due else 0
+
+
+def flush(db) -> int:
+    """Write the buffer to a random shard of the current bucket, returns downloads written"""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+    
+    ref = _collection(db).document(_shard_id(bucket(), random.randrange(DOWNLOAD_SHARDS)))
+    try:
+        ref.set({torrent_id: field_values(db).Increment(count) for torrent_id, count in pending.items()}, merge=True)
+    except Exception:
+        # Keep the downloads for the next flush
+        with _pending_lock:
+            for torrent_id, count in pending.items():
+                _pending[torrent_id] = _pending.get(torrent_id, 0) + count
+        raise
+    return sum(pending.values())
+
+
+def _pieces(docs) -> List[Tuple[Any, List[Tuple[str, int]], bool]]:
+    """(shard ref, [(torrent id, downloads)], last piece of the shard) small enough for one batch"""
+    pieces = []
+    for doc in docs:
+        items = [
+            (torrent_id, count) for torrent_id, count in sorted((doc.to_dict() or {}).items())
+            if isinstance(count, int) and not isinstance(count, bool)
+        ]
+        if not items:
+            pieces.append((doc.reference, [], True))
+            continue
+        for start in range(0, len(items), TORRENTS_PER_PIECE):
+            pieces.append((doc.reference, items[start:start + TORRENTS_PER_PIECE], start + TORRENTS_PER_PIECE >= len(items)))
+    return pieces
+
+
+def rollup(
+    db,
+    store,
+    rolled_at: Optional[float] = None,
+    now: Optional[float] = None,
+    min_interval: float = DOWNLOAD_ROLLUP_INTERVAL
+) -> Dict[str, Any]:
+    """
+    Fold closed buckets into torrent documents and their search index entries.
+    rolled_at is when the last fold committed (downloads_rolled_at of the
+    catalog document); until min_interval has passed the run is skipped.
+    Returns counts plus 'changed_ids' and 'commits' for the snapshot refresh;
+    a failed commit stops the run and leaves its shards for the next one.
+    Downloads of torrents deleted in the meantime are dropped.
+    """
+    values = field_values(db)
+    now = time.time() if now is None else now
+    result: Dict[str, Any] = {'shards': 0, 'downloads': 0, 'dropped': 0, 'commits': 0, 'changed_ids': [], 'skipped': False}
+    if rolled_at is not None and now - rolled_at < min_interval:
+        result['skipped'] = True
+        return result
+    
+    # Writers use the current bucket, or the previous one when their clock
+    # lags; everything older is closed
+    cutoff = _collection(db).document(_shard_id(bucket(now) - 1, 0))
+    docs = list(_collection(db).where('__name__', '<', cutoff).stream())
+    pieces = _pieces(docs)
+    
+    result['shards'] = len(docs)
+    changed = set()
+    position = 0
+    while position < len(pieces):
+        # Pack whole pieces while they fit, one write for the catalog version
+        chunk = []
+        writes = 1
+        while position < len(pieces):
+            cost = WRITES_PER_TORRENT * len(pieces[position][1]) + 1
+            if chunk and writes + cost > MAX_BATCH_WRITES:
+                break
+            chunk.append(pieces[position])
+            writes += cost
+            position += 1
+        
+        deltas: Dict[str, int] = {}
+        for _, items, _ in chunk:
+            for torrent_id, count in items:
+                deltas[torrent_id] = deltas.get(torrent_id, 0) + count
+        existing = store.torrents.get_many(list(deltas)) if deltas else {}
+        # Only entries that exist: a merge set would leave a stub without
+        # posting lists for a torrent the index never saw
+        indexed = {
+            doc.id for doc in db.get_all(
+                [db.collection(search_index.SEARCH_COLLECTION).document(torrent_id) for torrent_id in existing],
+                field_paths=['downloads']
+            ) if doc.exists
+        } if existing else set()
+        
+        batch = store.batch()
+        for torrent_id, count in deltas.items():
+            if torrent_id in existing and count:
+                store.torrents.update(torrent_id, {'downloads': values.Increment(count)}, batch)
+                if torrent_id in indexed:
+                    batch.update(
+                        db.collection(search_index.SEARCH_COLLECTION).document(torrent_id),
+                        {'downloads': values.Increment(count)}
+                    )
+        for ref, items, last in chunk:
+            if last:
+                batch.delete(ref)
+            else:
+                batch.set(ref, {torrent_id: values.DELETE_FIELD for torrent_id, _ in items}, merge=True)
+        catalog.bump(db, batch, {'downloads_rolled_at': now})
+        
+        try:
+            batch.commit()
+        except Exception as e:
+            print(f"DOWNLOADS: roll-up commit failed: {str(e)}")
+            break
+        
+        result['commits'] += 1
+        for torrent_id, count in deltas.items():
+            if torrent_id in existing:
+                result['downloads'] += count
+                changed.add(torrent_id)
+            else:
+                result['dropped'] += count
+    
+    result['changed_ids'] = sorted(changed)
+    return result
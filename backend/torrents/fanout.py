@@ -0,0 +1,86 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+
+import tracing
+
+# Concurrent independent reads for the synchronous handler.
+# gather() runs blocking storage calls under an asyncio event loop on a
+# shared worker pool, at most FANOUT_CONCURRENCY at a time, so a fan-out
+# costs its slowest read instead of the sum of all of them. The handler
+# stays synchronous: each gather() drives its own short-lived loop.
+# Calls see the request's context (tracing spans, read counts).
+# Every fan-out is bounded by what is left of the REQUEST_DEADLINE budget,
+# measured from the start of the request; DeadlineExceeded is raised when
+# it runs out (reads already in flight finish in the background and are
+# discarded). Calls run one after another when concurrency is disabled,
+# inside a worker (no nested pools) or when an event loop is already
+# running in this thread.
+
+FANOUT_CONCURRENCY = int(os.environ.get('FANOUT_CONCURRENCY', '8'))
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', '25'))
+
+_WORKER_PREFIX = 'fanout'
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of its REQUEST_DEADLINE budget"""
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(FANOUT_CONCURRENCY, 1), thread_name_prefix=_WORKER_PREFIX)
+        return _executor
+
+
+def remaining() -> float:
+    """Seconds left of the current request's deadline"""
+    return REQUEST_DEADLINE - tracing.elapsed()
+
+
+def _sequential() -> bool:
+    if FANOUT_CONCURRENCY <= 1 or threading.current_thread().name.startswith(_WORKER_PREFIX):
+        return True
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+async def _gather(calls: Sequence[Callable[[], Any]], timeout: float) -> List[Any]:
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    
+    async def run(call: Callable[[], Any]) -> Any:
+        async with semaphore:
+            return await loop.run_in_executor(_pool(), contextvars.copy_context().run, call)
+    
+    tasks = [asyncio.ensure_future(run(call)) for call in calls]
+    done, pending = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    for task in tasks:
+        if task in done and task.exception() is not None:
+            raise task.exception()
+    if pending:
+        raise DeadlineExceeded(f'Request deadline of {REQUEST_DEADLINE:g}s exceeded')
+    return [task.result() for task in tasks]
+
+
+def gather(calls: Sequence[Callable[[], Any]]) -> List[Any]:
+    """Results of independent zero-argument calls, in order; the first failure is raised"""
+    timeout = remaining()
+    if timeout <= 0:
+        raise DeadlineExceeded(f'Request deadline of {REQUEST_DEADLINE:g}s exceeded')
+    if len(calls) <= 1 or _sequential():
+        return [call() for call in calls]
+    return asyncio.run(_gather(calls, timeout))
@@ -1,20 +1,494 @@
 import json
+import math
 import os
 import re
-import urllib.request
-import urllib.parse
 import hashlib
-from typing import Dict, Any, Optional
-import firebase_admin
-from firebase_admin import credentials, firestore
+import base64
+import uuid
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
+import search_index
+import counters
+import bulk
+import downloads
+import catalog
+import changes
+import compression
+import fanout
+import query_planner
+import serialization
+import sessions
+import snapshot
+import tracing
+from steam_cache import SteamCache, SteamAppUnavailable, FirestoreStore, FileStore
+from steam_client import SteamClient, SteamUnavailable
+from steam_import import ImportRejected, SteamImport, TokenBucket, rate_limited
+from storage import Storage, FirebaseNotConfigured, already_exists, create_client, normalize_username
 
-# Initialize Firebase (will be done in handler)
+# Storage is initialized lazily by get_db() on the first route that needs it:
+# firebase_admin and google.cloud.firestore are heavy imports that OPTIONS
+# preflights and Steam lookups never use.
+
+_db = None
+
+# Seconds a warm instance may serve stats without re-reading counter shards
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', '5'))
+
+# Base URL of the Steam store API, overridable to point at a stub server
+STEAM_API_URL = os.environ.get('STEAM_API_URL', 'https://store.steampowered.com/api')
+
+_steam_cache: Optional[SteamCache] = None
+_steam_client: Optional[SteamClient] = None
+
+# Bulk import: shared upstream budget across all workers of an invocation
+STEAM_IMPORT_WORKERS = int(os.environ.get('STEAM_IMPORT_WORKERS', '8'))
+STEAM_IMPORT_RATE = float(os.environ.get('STEAM_IMPORT_RATE', '4'))
+STEAM_IMPORT_BURST = float(os.environ.get('STEAM_IMPORT_BURST', '8'))
+STEAM_IMPORT_TIME_BUDGET = float(os.environ.get('STEAM_IMPORT_TIME_BUDGET', '20'))
+MAX_IMPORT_ITEMS = 1000
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# API field name -> Firestore field name
+TORRENT_FIELDS = {
+    'title': 'title',
+    'poster': 'poster',
+    'downloads': 'downloads',
+    'size': 'size',
+    'category': 'category',
+    'description': 'description',
+    'steamDeck': 'steam_deck',
+    'steamRating': 'steam_rating',
+    'metacriticScore': 'metacritic_score'
+}
+
+FIELD_PRESETS = {
+    'card': ['title', 'poster', 'downloads', 'size', 'category']
+}
+
+# User fields of the admin listing; API and Firestore names are the same
+USER_FIELDS = ['username', 'email', 'avatar', 'first_name', 'created_at', 'is_admin']
+USERS_PAGE_SIZE = 50
+
+# action=dashboard sections= values
+DASHBOARD_SECTIONS = ('stats', 'torrents', 'users', 'categories')
 
 def hash_password(password: str) -> str:
     """Hash password using SHA256"""
     return hashlib.sha256(password.encode()).hexdigest()
 
+def serialize_torrent(doc_id: str, torrent_data: Dict[str, Any], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Convert Firestore torrent document to API format, optionally projected"""
+    torrent = {
+        'id': doc_id,
+        'title': torrent_data.get('title'),
+        'poster': torrent_data.get('poster'),
+        'downloads': torrent_data.get('downloads', 0),
+        'size': float(torrent_data.get('size', 0) or 0),
+        'category': torrent_data.get('category', []),
+        'description': torrent_data.get('description', ''),
+        'steamDeck': bool(torrent_data.get('steam_deck', False)),
+        'steamRating': torrent_data.get('steam_rating'),
+        'metacriticScore': torrent_data.get('metacritic_score')
+    }
+    
+    if fields is None:
+        return torrent
+    
+    return {key: torrent[key] for key in ['id'] + fields}
+
+
+def serialize_user(user_id: str, user_data: Dict[str, Any], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Convert Firestore user document to the admin listing format, optionally projected"""
+    user = {
+        'id': user_id,
+        'username': user_data.get('username'),
+        'email': user_data.get('email'),
+        'avatar': user_data.get('avatar'),
+        'first_name': user_data.get('first_name'),
+        'created_at': user_data.get('created_at'),
+        'is_admin': user_data.get('is_admin', False)
+    }
+    
+    if fields is None:
+        return user
+    
+    return {key: user[key] for key in ['id'] + fields}
+
+
+# POST actions open to anonymous callers; every other write, the user
+# listing and the dashboard need an admin session token
+PUBLIC_POST_ACTIONS = {'auth', 'download'}
+ADMIN_GET_ACTIONS = {'users', 'dashboard'}
+
+
+def requires_admin(action: str, method: str) -> bool:
+    if method == 'GET':
+        return action in ADMIN_GET_ACTIONS
+    if method == 'POST':
+        return action not in PUBLIC_POST_ACTIONS
+    return method in ('PUT', 'DELETE')
+
+
+def check_admin(event: Dict[str, Any], db) -> Optional[Dict[str, Any]]:
+    """Error response unless the request carries a valid admin token; no reads beyond the cached revocation list"""
+    try:
+        claims = sessions.verify(db, sessions.bearer(get_header(event, 'Authorization')))
+    except sessions.SessionSecretMissing:
+        return session_secret_missing()
+    
+    if claims is None:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': tracing.dumps({'error': 'Требуется авторизация'})
+        }
+    if not claims.get('adm'):
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': tracing.dumps({'error': 'Недостаточно прав'})
+        }
+    return None
+
+
+def session_secret_missing() -> Dict[str, Any]:
+    return {
+        'statusCode': 503,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': tracing.dumps({
+            'error': 'Session secret not configured. Please add SESSION_SECRET secret.',
+            'hint': 'Any long random string; changing it signs every user out'
+        })
+    }
+
+
+def user_exists() -> Dict[str, Any]:
+    return {
+        'statusCode': 400,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': tracing.dumps({'error': 'Пользователь с таким email или username уже существует'})
+    }
+
+
+def torrent_document(body_data: Dict[str, Any], partial: bool = False) -> Dict[str, Any]:
+    """
+    Map a torrent request body to Firestore fields.
+    partial keeps only the fields present in the body (bulk updates).
+    Raises ValueError for values that cannot be stored.
+    """
+    if not partial:
+        return {
+            'title': body_data.get('title'),
+            'poster': body_data.get('poster'),
+            'downloads': int(body_data.get('downloads', 0)),
+            'size': float(body_data.get('size')),
+            'category': body_data.get('categories', []),
+            'description': body_data.get('description', ''),
+            'steam_deck': body_data.get('steamDeck', False),
+            'steam_rating': body_data.get('steamRating'),
+            'metacritic_score': body_data.get('metacriticScore')
+        }
+    
+    document = {}
+    for name, value in body_data.items():
+        if name == 'categories':
+            document['category'] = value
+        elif name == 'downloads':
+            document['downloads'] = int(value)
+        elif name == 'size':
+            document['size'] = float(value)
+        elif name in TORRENT_FIELDS and name != 'category':
+            document[TORRENT_FIELDS[name]] = value
+        else:
+            raise ValueError(f'Unknown field: {name}')
+    return document
+
+
+def validate_categories(categories: Any) -> None:
+    if not (isinstance(categories, list) and all(isinstance(slug, str) for slug in categories)):
+        raise ValueError('categories must be a list of strings')
+
+
+def validate_torrent(document: Dict[str, Any], partial: bool = False) -> None:
+    """Reject documents the catalog cannot render; raises ValueError"""
+    if not partial or 'title' in document:
+        if not isinstance(document.get('title'), str) or not document['title'].strip():
+            raise ValueError('title is required')
+    if 'category' in document:
+        validate_categories(document['category'])
+    if document.get('size', 0) < 0 or document.get('downloads', 0) < 0:
+        raise ValueError('size and downloads must not be negative')
+
+
+def bulk_document(body_data: Dict[str, Any], partial: bool) -> Dict[str, Any]:
+    """torrent_document() plus validation, for bulk operations"""
+    document = torrent_document(body_data, partial)
+    validate_torrent(document, partial)
+    if not partial:
+        document['created_at'] = datetime.utcnow().isoformat()
+    return document
+
+
+def parse_fields(raw: Optional[str]) -> Optional[List[str]]:
+    """Parse fields= parameter into a list of API field names; presets may be mixed with names"""
+    if not raw:
+        return None
+    
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name in FIELD_PRESETS:
+            names = FIELD_PRESETS[name]
+        elif name in TORRENT_FIELDS:
+            names = [name]
+        else:
+            raise ValueError(f'Unknown field: {name}')
+        fields.extend(field for field in names if field not in fields)
+    
+    if not fields:
+        raise ValueError(f'Unknown fields: {raw}')
+    
+    return fields
+
+
+def parse_user_fields(raw: Optional[str]) -> Optional[List[str]]:
+    """Parse fields= parameter of the user listing"""
+    if not raw:
+        return None
+    
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in USER_FIELDS:
+            raise ValueError(f'Unknown field: {name}')
+        if name not in fields:
+            fields.append(name)
+    
+    if not fields:
+        raise ValueError(f'Unknown fields: {raw}')
+    
+    return fields
+
+
+def parse_bool(raw: Optional[str], name: str) -> Optional[bool]:
+    """Parse an optional true/false query parameter"""
+    if raw is None or raw == '':
+        return None
+    if raw.lower() in ('true', '1'):
+        return True
+    if raw.lower() in ('false', '0'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+
+def parse_limit(raw: Optional[str], default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    """Parse limit= parameter and clamp it to maximum"""
+    if not raw:
+        return default
+    
+    if not raw.isdigit() or int(raw) < 1:
+        raise ValueError('limit must be a positive integer')
+    
+    limit = int(raw)
+    
+    return min(limit, maximum)
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """Encode last-seen sort values into an opaque cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode cursor produced by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    
+    if not isinstance(values, dict) or 'id' not in values:
+        raise ValueError('Invalid cursor')
+    
+    return values
+
+
+def search_users(
+    store: Storage,
+    prefix: str,
+    limit: int,
+    cursor: Optional[Dict[str, Any]],
+    is_admin: Optional[bool],
+    fields: Optional[List[str]]
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], Optional[str]]:
+    """
+    Users whose username or email starts with prefix, from the username and
+    email claims merged in key order. The cursor keeps one position per claim
+    kind. A user matching by both is listed once, through its username.
+    Pages can come out shorter than limit when is_admin filters rows out.
+    """
+    after = cursor or {}
+    by_username, by_email = fanout.gather([
+        lambda: store.users.claims_with_prefix('usernames', prefix, after.get('u'), limit + 1),
+        lambda: store.users.claims_with_prefix('emails', prefix, after.get('e'), limit + 1)
+    ])
+    
+    user_ids = list({user_id for _, user_id in by_username + by_email if user_id})
+    selected = sorted(set(fields or USER_FIELDS) | {'username'})
+    users = store.users.get_many(user_ids, selected)
+    
+    hits = [(key, 'u', user_id) for key, user_id in by_username]
+    hits += [
+        (key, 'e', user_id) for key, user_id in by_email
+        if not normalize_username((users.get(user_id) or {}).get('username')).startswith(prefix)
+    ]
+    hits.sort()
+    page = hits[:limit]
+    
+    # Both positions advance to the last key served, skipped duplicates included
+    last_key = page[-1][0] if page else max((key for key, _ in by_username + by_email), default=None)
+    positions = {'u': after.get('u'), 'e': after.get('e')}
+    for kind, claims in (('u', by_username), ('e', by_email)):
+        for key, _ in claims:
+            if last_key is not None and key <= last_key:
+                positions[kind] = key
+    more = len(by_username) > limit or len(by_email) > limit or len(hits) > limit
+    
+    rows = []
+    for _, _, user_id in page:
+        data = users.get(user_id)
+        if data is None or (is_admin is not None and bool(data.get('is_admin', False)) != is_admin):
+            continue
+        rows.append((user_id, data))
+    
+    next_cursor = None
+    if more:
+        next_cursor = encode_cursor(dict(positions, id=page[-1][2] if page else ''))
+    return rows, next_cursor
+
+
+def page_users(
+    store: Storage,
+    limit: int,
+    cursor: Optional[Dict[str, Any]] = None,
+    is_admin: Optional[bool] = None,
+    fields: Optional[List[str]] = None
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], Optional[str]]:
+    """A page of the newest users and the cursor of the next one"""
+    users_docs = store.users.page(limit + 1, cursor, is_admin, fields)
+    if len(users_docs) <= limit:
+        return users_docs, None
+    users_docs = users_docs[:limit]
+    last_id, last_data = users_docs[-1]
+    return users_docs, encode_cursor({'created_at': last_data.get('created_at'), 'id': last_id})
+
+
+def serialize_category(category_id: str, cat_data: Dict[str, Any], category_counts: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        'id': category_id,
+        'name': cat_data.get('name'),
+        'slug': cat_data.get('slug'),
+        'icon': cat_data.get('icon', 'Gamepad2'),
+        'count': max(category_counts.get(cat_data.get('slug'), 0), 0)
+    }
+
+
+def parse_sections(raw: Optional[str]) -> List[str]:
+    """Parse sections= parameter of action=dashboard; all sections by default"""
+    if not raw:
+        return list(DASHBOARD_SECTIONS)
+    
+    sections = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in DASHBOARD_SECTIONS:
+            raise ValueError(f"Unknown section: {name}. Allowed: {', '.join(DASHBOARD_SECTIONS)}")
+        if name not in sections:
+            sections.append(name)
+    
+    if not sections:
+        raise ValueError('sections must not be empty')
+    
+    return sections
+
+
+def load_dashboard(db, store: Storage, sections: List[str]) -> Dict[str, Any]:
+    """
+    Dashboard sections from one concurrent round of reads. A single torrent
+    scan (the snapshot when it is current) serves the torrent list, the games
+    count and the category counts; counters are read only for what no scan
+    covers.
+    """
+    want_torrents = 'torrents' in sections
+    want_categories = 'categories' in sections
+    
+    meta = None
+    if want_torrents or want_categories:
+        meta = snapshot.load_meta(db, catalog.read_version(db))
+    
+    def scan_torrents() -> List[Tuple[str, Dict[str, Any]]]:
+        torrents = snapshot.load_torrents(db, meta) if meta is not None else None
+        return torrents if torrents is not None else store.torrents.list()
+    
+    calls: Dict[str, Any] = {}
+    if want_torrents:
+        calls['torrents'] = scan_torrents
+    if want_categories and meta is None:
+        calls['categories'] = store.categories.list
+        if not want_torrents:
+            calls['category_counts'] = lambda: counters.read(db, counters.CATEGORY_COUNTS)
+    if 'stats' in sections:
+        calls['totals'] = lambda: counters.read_cached(db, counters.TOTALS, STATS_CACHE_TTL)
+    if 'users' in sections:
+        calls['users'] = lambda: page_users(store, USERS_PAGE_SIZE)
+    
+    results = dict(zip(calls, fanout.gather(list(calls.values()))))
+    torrents = results.get('torrents')
+    
+    dashboard: Dict[str, Any] = {}
+    if 'stats' in sections:
+        totals = results['totals']
+        dashboard['stats'] = {
+            'games': len(torrents) if torrents is not None else max(totals.get('games', 0), 0),
+            'users': max(totals.get('users', 0), 0),
+            'comments': max(totals.get('comments', 0), 0)
+        }
+    if want_torrents:
+        dashboard['torrents'] = serialization.array(torrents, None, serialize_torrent)
+    if 'users' in sections:
+        users_docs, next_cursor = results['users']
+        dashboard['users'] = [serialize_user(user_id, user_data) for user_id, user_data in users_docs]
+        dashboard['usersNextCursor'] = next_cursor
+    if want_categories:
+        if meta is not None:
+            category_docs = [(cat['id'], cat) for cat in meta['categories']]
+            category_counts = {cat.get('slug'): cat.get('count', 0) for cat in meta['categories']}
+        else:
+            category_docs = results['categories']
+            if torrents is not None:
+                category_counts = counters.count_categories(data for _, data in torrents)
+            else:
+                category_counts = results['category_counts']
+        dashboard['categories'] = [
+            serialize_category(category_id, cat_data, category_counts) for category_id, cat_data in category_docs
+        ]
+    
+    return dashboard
+
+
 def extract_app_id(url: str) -> Optional[str]:
     """Extract Steam App ID from URL"""
     patterns = [
@@ -33,20 +507,13 @@ def extract_app_id(url: str) -> Optional[str]:
     return None
 
 
-def fetch_steam_data(app_id: str) -> Dict[str, Any]:
+def fetch_steam_data(app_id: str, lang: str = 'russian') -> Dict[str, Any]:
     """Fetch game data from Steam API"""
-    api_url = f'https://store.steampowered.com/api/appdetails?appids={app_id}&l=russian'
-    
-    req = urllib.request.Request(
-        api_url,
-        headers={'User-Agent': 'Mozilla/5.0'}
-    )
-    
-    with urllib.request.urlopen(req, timeout=10) as response:
-        data = json.loads(response.read().decode('utf-8'))
+    with tracing.span('steam'):
+        data = get_steam_client().appdetails(app_id, lang)
     
     if app_id not in data or not data[app_id].get('success'):
-        raise ValueError('Game not found or data unavailable')
+        raise SteamAppUnavailable('Game not found or data unavailable')
     
     game_data = data[app_id]['data']
     
@@ -92,6 +559,75 @@ def fetch_steam_data(app_id: str) -> Dict[str, Any]:
     return result
 
 
+def get_db():
+    """Storage client for STORAGE_ENGINE, created on first use and reused across warm invocations"""
+    global _db
+    
+    if _db is None:
+        _db = tracing.traced(create_client())
+    
+    return _db
+
+
+def get_steam_client() -> SteamClient:
+    """Module-level Steam API client; pooled connections and circuit state outlive an invocation"""
+    global _steam_client
+    
+    if _steam_client is None:
+        _steam_client = SteamClient(STEAM_API_URL)
+    
+    return _steam_client
+
+
+def get_steam_cache() -> SteamCache:
+    """Module-level Steam cache, reused across warm invocations"""
+    global _steam_cache
+    
+    if _steam_cache is None:
+        cache_file = os.environ.get('STEAM_CACHE_FILE')
+        persistent = FileStore(cache_file) if cache_file else FirestoreStore(get_db)
+        _steam_cache = SteamCache(
+            fetch_steam_data,
+            store=persistent,
+            ttl=float(os.environ.get('STEAM_CACHE_TTL', 6 * 3600)),
+            stale_ttl=float(os.environ.get('STEAM_CACHE_STALE_TTL', 24 * 3600)),
+            negative_ttl=float(os.environ.get('STEAM_CACHE_NEGATIVE_TTL', 3600)),
+            max_entries=int(os.environ.get('STEAM_CACHE_SIZE', 256))
+        )
+    
+    return _steam_cache
+
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Request header value, matched case-insensitively"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def not_modified(tag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'ETag', **catalog.headers(tag)},
+        'isBase64Encoded': False,
+        'body': ''
+    }
+
+
+def parse_action(query_params: Dict[str, Any], url: str) -> str:
+    """action= parameter, falling back to the last path segment"""
+    action = query_params.get('action', '')
+    
+    if not action and url:
+        path_parts = url.strip('/').split('/')
+        if len(path_parts) > 0:
+            action = path_parts[-1]
+    
+    return action
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для управления торрентами через Firebase Firestore
@@ -99,50 +635,41 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
           context - object с request_id, function_name
     Returns: HTTP response dict с данными торрентов, статистикой или данными из Steam
     '''
-    # Initialize Firebase
-    cred_json = os.environ.get('FIREBASE_CREDENTIALS', '')
-    
-    if not firebase_admin._apps:
-        if not cred_json or cred_json.strip() == '':
-            return {
-                'statusCode': 503,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({
-                    'error': 'Firebase credentials not configured. Please add FIREBASE_CREDENTIALS secret.',
-                    'hint': 'Add the JSON service account key from Firebase Console'
-                })
-            }
-        try:
-            cred_dict = json.loads(cred_json)
-            cred = credentials.Certificate(cred_dict)
-            firebase_admin.initialize_app(cred)
-        except json.JSONDecodeError as e:
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({
-                    'error': 'Invalid Firebase credentials JSON format',
-                    'details': str(e)
-                })
-            }
-    
-    db = firestore.client()
-    
+    trace = tracing.start(
+        event.get('httpMethod', 'GET'),
+        parse_action(event.get('queryStringParameters', {}) or {}, event.get('url', '')),
+        getattr(context, 'request_id', None)
+    )
+    try:
+        response = compression.apply(get_header(event, 'Accept-Encoding'), route(event, context))
+    except Exception:
+        tracing.discard(trace)
+        raise
+    finally:
+        flush_downloads()
+    return tracing.finish(trace, response)
+
+
+def flush_downloads() -> None:
+    """Write downloads buffered by this or earlier requests once they are due"""
+    if _db is None:
+        return
+    try:
+        downloads.flush_due(_db)
+    except Exception as e:
+        print(f"DOWNLOADS: flush failed: {str(e)}")
+
+
+def route(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     query_params = event.get('queryStringParameters', {}) or {}
     path_params = event.get('pathParams', {}) or {}
     url = event.get('url', '')
     
-    action = query_params.get('action', '')
-    
-    if not action and url:
-        path_parts = url.strip('/').split('/')
-        if len(path_parts) > 0:
-            action = path_parts[-1]
+    action = parse_action(query_params, url)
     
-    print(f"DEBUG: method={method}, action={action}, query_params={query_params}, url={url}, path_params={path_params}")
+    if tracing.DEBUG:
+        tracing.debug(f"method={method}, action={action}, query_params={query_params}, url={url}, path_params={path_params}")
     
     if method == 'OPTIONS':
         return {
@@ -150,7 +677,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Accept, Authorization, X-Requested-With',
+                'Access-Control-Allow-Headers': 'Content-Type, Accept, Authorization, X-Requested-With, If-None-Match',
                 'Access-Control-Max-Age': '86400',
                 'Content-Type': 'text/plain'
             },
@@ -158,84 +685,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
-    if action == 'migrate' and method == 'POST':
-        try:
-            # Data from PostgreSQL
-            categories_data = [
-                {'name': 'RPG', 'slug': 'RPG', 'icon': 'Sword'},
-                {'name': 'Экшен', 'slug': 'Action', 'icon': 'Zap'},
-                {'name': 'Гонки', 'slug': 'Racing', 'icon': 'Car'}
-            ]
-            
-            users_data = [
-                {
-                    'username': 'Kot',
-                    'email': 'igorkochetkow@yandex.ru',
-                    'password_hash': '497c0f6767166ad2242e9266d9ce34409ac43cd2a9e22b548aa7b1a6329a68d7',
-                    'avatar': 'https://api.dicebear.com/7.x/avataaars/svg?seed=Kot',
-                    'first_name': 'Kot',
-                    'created_at': '2025-11-05T16:27:55.463905',
-                    'is_admin': False
-                }
-            ]
-            
-            torrents_data = [
-                {
-                    'title': 'Counter-Strike 2',
-                    'poster': 'https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/730/ss_0f8cf82d019c614760fd20801f2bb4001da7ea77.1920x1080.jpg?t=1749053861',
-                    'downloads': 0,
-                    'size': 16.0,
-                    'category': ['action', 'RPG'],
-                    'description': 'Более двух десятилетий Counter-Strike служит примером первоклассной соревновательной игры, путь развития которой определяют миллионы игроков со всего мира. Теперь пришло время нового этапа — Counter-Strike 2.',
-                    'steam_deck': True,
-                    'steam_rating': 4755307,
-                    'metacritic_score': None
-                }
-            ]
-            
-            results = {
-                'categories': [],
-                'users': [],
-                'torrents': []
-            }
-            
-            # Migrate categories
-            for cat in categories_data:
-                doc_ref = db.collection('categories').add(cat)
-                results['categories'].append({'name': cat['name'], 'id': doc_ref[1].id})
-            
-            # Migrate users
-            for user in users_data:
-                doc_ref = db.collection('users').add(user)
-                results['users'].append({'username': user['username'], 'id': doc_ref[1].id})
-            
-            # Migrate torrents
-            for torrent in torrents_data:
-                doc_ref = db.collection('torrents').add(torrent)
-                results['torrents'].append({'title': torrent['title'], 'id': doc_ref[1].id})
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({
-                    'success': True,
-                    'message': 'Миграция завершена успешно',
-                    'migrated': {
-                        'categories': len(results['categories']),
-                        'users': len(results['users']),
-                        'torrents': len(results['torrents'])
-                    },
-                    'details': results
-                }, ensure_ascii=False)
-            }
-        except Exception as e:
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'error': f'Ошибка миграции: {str(e)}'})
-            }
+    if action == 'steam_cache' and method == 'GET':
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': tracing.dumps(dict(get_steam_cache().stats, upstream=get_steam_client().stats()))
+        }
     
     if action == 'steam' and method == 'GET':
         url_or_id = query_params.get('url') or query_params.get('appId')
@@ -248,7 +704,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Missing url or appId parameter'})
+                'body': tracing.dumps({'error': 'Missing url or appId parameter'})
             }
         
         app_id = extract_app_id(url_or_id)
@@ -261,30 +717,123 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Invalid Steam URL or App ID'})
+                'body': tracing.dumps({'error': 'Invalid Steam URL or App ID'})
             }
         
+        lang = query_params.get('lang', 'russian')
+        
         try:
-            game_data = fetch_steam_data(app_id)
+            game_data, cache_status = get_steam_cache().get(app_id, lang)
             
             return {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
+                    'Access-Control-Allow-Origin': '*',
+                    'X-Cache': cache_status
+                },
+                'isBase64Encoded': False,
+                'body': tracing.dumps(game_data, ensure_ascii=False)
+            }
+        except SteamAppUnavailable as e:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({'error': str(e)})
+            }
+        except SteamUnavailable as e:
+            # Circuit open or out of time: fail fast instead of waiting on Steam
+            return {
+                'statusCode': 503,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Retry-After': str(math.ceil(e.retry_after or 1))
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps(game_data, ensure_ascii=False)
+                'body': tracing.dumps({'error': str(e)})
             }
         except Exception as e:
             return {
-                'statusCode': 500,
+                'statusCode': 502,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': f'Failed to fetch Steam data: {str(e)}'})
+                'body': tracing.dumps({'error': f'Failed to fetch Steam data: {str(e)}'})
+            }
+    
+    try:
+        db = get_db()
+        store = Storage(db)
+    except FirebaseNotConfigured:
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': tracing.dumps({
+                'error': 'Firebase credentials not configured. Please add FIREBASE_CREDENTIALS secret.',
+                'hint': 'Add the JSON service account key from Firebase Console'
+            })
+        }
+    except json.JSONDecodeError as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': tracing.dumps({
+                'error': 'Invalid Firebase credentials JSON format',
+                'details': str(e)
+            })
+        }
+    
+    if requires_admin(action, method):
+        denied = check_admin(event, db)
+        if denied is not None:
+            return denied
+    
+    if action == 'migrate' and method == 'POST':
+        try:
+            # Imported here: the CSV/SQLite/pg_dump readers are of no use to other routes
+            import migration
+            
+            # Seed rows go through the same transforms and deterministic ids
+            # as the migration tool, so repeating the call overwrites them
+            migrator = migration.Migrator(
+                db, store, migration.RowsSource(migration.SEED_ROWS, 'seed'), log=lambda message: None
+            )
+            migrator.run(('categories', 'users', 'torrents'))
+            
+            seed = migration.SEED_ROWS
+            results = {
+                'categories': [{'name': row['name'], 'id': migration.document_id(row['id'])} for row in seed['categories']],
+                'users': [{'username': row['username'], 'id': migration.document_id(row['id'])} for row in seed['users']],
+                'torrents': [{'title': row['title'], 'id': migration.document_id(row['id'])} for row in seed['torrents']]
+            }
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({
+                    'success': True,
+                    'message': 'Миграция завершена успешно',
+                    'migrated': {
+                        'categories': len(results['categories']),
+                        'users': len(results['users']),
+                        'torrents': len(results['torrents'])
+                    },
+                    'details': results
+                }, ensure_ascii=False)
+            }
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({'error': f'Ошибка миграции: {str(e)}'})
             }
     
     try:
@@ -302,20 +851,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                         'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Все поля обязательны для заполнения'})
+                        'body': tracing.dumps({'error': 'Все поля обязательны для заполнения'})
                     }
                 
-                users_ref = db.collection('users')
-                existing_email = users_ref.where('email', '==', email).limit(1).get()
-                existing_username = users_ref.where('username', '==', username).limit(1).get()
-                
-                if len(list(existing_email)) > 0 or len(list(existing_username)) > 0:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Пользователь с таким email или username уже существует'})
-                    }
+                if store.users.is_taken(email, username):
+                    return user_exists()
                 
                 password_hash = hash_password(password)
                 avatar = f"https://api.dicebear.com/7.x/avataaars/svg?seed={username}"
@@ -330,14 +870,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'is_admin': False
                 }
                 
-                doc_ref = users_ref.add(user_data)
-                user_id = doc_ref[1].id
+                batch = store.batch()
+                user_id = store.users.register(user_data, batch)
+                counters.increment(db, counters.TOTALS, {'users': 1}, batch)
+                token = sessions.issue(user_id, False)
+                try:
+                    batch.commit()
+                except Exception as e:
+                    # Claimed by a concurrent registration since is_taken()
+                    if already_exists(e):
+                        return user_exists()
+                    raise
                 
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'isBase64Encoded': False,
-                    'body': json.dumps({
+                    'body': tracing.dumps({
                         'success': True,
                         'user': {
                             'id': user_id,
@@ -348,10 +897,22 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                             'created_at': user_data['created_at'],
                             'is_admin': False
                         },
-                        'token': f"user_{user_id}"
+                        'token': token
                     })
                 }
             
+            elif auth_action == 'logout':
+                claims = sessions.verify(db, sessions.bearer(get_header(event, 'Authorization')))
+                if claims is not None:
+                    sessions.revoke_token(db, claims)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'success': True})
+                }
+            
             elif auth_action == 'login':
                 email = body_data.get('email', '').strip()
                 password = body_data.get('password', '')
@@ -361,33 +922,29 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                         'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Email и пароль обязательны'})
+                        'body': tracing.dumps({'error': 'Email и пароль обязательны'})
                     }
                 
                 password_hash = hash_password(password)
                 
-                users_ref = db.collection('users')
-                users_query = users_ref.where('email', '==', email).where('password_hash', '==', password_hash).limit(1).get()
+                found = store.users.find_by_credentials(email, password_hash)
                 
-                users_list = list(users_query)
-                
-                if len(users_list) == 0:
+                if not found:
                     return {
                         'statusCode': 401,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                         'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Неверный email или пароль'})
+                        'body': tracing.dumps({'error': 'Неверный email или пароль'})
                     }
                 
-                user_doc = users_list[0]
-                user_data = user_doc.to_dict()
-                user_id = user_doc.id
+                user_id, user_data = found
+                token = sessions.issue(user_id, user_data.get('is_admin', False))
                 
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'isBase64Encoded': False,
-                    'body': json.dumps({
+                    'body': tracing.dumps({
                         'success': True,
                         'user': {
                             'id': user_id,
@@ -398,32 +955,55 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                             'created_at': user_data.get('created_at'),
                             'is_admin': user_data.get('is_admin', False)
                         },
-                        'token': f"user_{user_id}"
+                        'token': token
                     })
                 }
         
         elif action == 'users' and method == 'GET':
-            users_ref = db.collection('users').order_by('created_at', direction=firestore.Query.DESCENDING)
-            users_docs = users_ref.stream()
-            
-            users = []
-            for doc in users_docs:
-                user_data = doc.to_dict()
-                users.append({
-                    'id': doc.id,
-                    'username': user_data.get('username'),
-                    'email': user_data.get('email'),
-                    'avatar': user_data.get('avatar'),
-                    'first_name': user_data.get('first_name'),
-                    'created_at': user_data.get('created_at'),
-                    'is_admin': user_data.get('is_admin', False)
-                })
+            try:
+                limit = parse_limit(query_params.get('limit'), USERS_PAGE_SIZE)
+                cursor = decode_cursor(query_params['cursor']) if query_params.get('cursor') else None
+                fields = parse_user_fields(query_params.get('fields'))
+                is_admin = parse_bool(query_params.get('admin'), 'admin')
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': str(e)})
+                }
+            
+            prefix = normalize_username(query_params.get('q', ''))
+            if prefix:
+                users_docs, next_cursor = search_users(store, prefix, limit, cursor, is_admin, fields)
+            else:
+                users_docs, next_cursor = page_users(store, limit, cursor, is_admin, fields)
+            
+            users = [serialize_user(user_id, user_data, fields) for user_id, user_data in users_docs]
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({'users': users, 'nextCursor': next_cursor})
+            }
+        
+        elif action == 'dashboard' and method == 'GET':
+            try:
+                sections = parse_sections(query_params.get('sections'))
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': str(e)})
+                }
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'isBase64Encoded': False,
-                'body': json.dumps({'users': users})
+                'body': serialization.body(load_dashboard(db, store, sections))
             }
         
         elif action == 'users' and method == 'PUT':
@@ -433,48 +1013,62 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'User ID is required'})
+                    'body': tracing.dumps({'error': 'User ID is required'})
                 }
             
             body_data = json.loads(event.get('body', '{}'))
             is_admin = body_data.get('is_admin', False)
             
-            db.collection('users').document(user_id).update({'is_admin': is_admin})
+            # Tokens carry the admin flag: the user signs in again to get the new one
+            batch = store.batch()
+            store.users.update(user_id, {'is_admin': is_admin}, batch)
+            sessions.revoke_user(db, user_id, batch)
+            batch.commit()
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'isBase64Encoded': False,
-                'body': json.dumps({'success': True, 'message': 'User updated successfully'})
+                'body': tracing.dumps({'success': True, 'message': 'User updated successfully'})
             }
         
         elif action == 'categories' and method == 'GET':
-            categories_ref = db.collection('categories').order_by('name')
-            categories_docs = categories_ref.stream()
+            version = catalog.read_version(db)
+            tag = catalog.etag(version, query_params)
+            if catalog.matches(get_header(event, 'If-None-Match'), tag):
+                return not_modified(tag)
             
-            categories = []
-            for doc in categories_docs:
-                cat_data = doc.to_dict()
-                
-                torrents_ref = db.collection('torrents').where('category', 'array_contains', cat_data.get('slug')).stream()
-                count = len(list(torrents_ref))
-                
-                categories.append({
-                    'id': doc.id,
-                    'name': cat_data.get('name'),
-                    'slug': cat_data.get('slug'),
-                    'icon': cat_data.get('icon', 'Gamepad2'),
-                    'count': count
-                })
+            compressed = compression.cached(get_header(event, 'Accept-Encoding'), tag)
+            if compressed is not None:
+                return compressed
+            
+            meta = snapshot.load_meta(db, version)
+            if meta is not None:
+                source = 'snapshot'
+                category_docs = [(cat['id'], cat) for cat in meta['categories']]
+                category_counts = {cat.get('slug'): cat.get('count', 0) for cat in meta['categories']}
+            else:
+                source = 'live'
+                category_docs, category_counts = fanout.gather([
+                    store.categories.list,
+                    lambda: counters.read(db, counters.CATEGORY_COUNTS)
+                ])
+            
+            categories = [
+                serialize_category(category_id, cat_data, category_counts) for category_id, cat_data in category_docs
+            ]
             
             return {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'ETag',
+                    'X-Catalog-Source': source,
+                    **catalog.headers(tag)
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'categories': categories})
+                'body': tracing.dumps({'categories': categories})
             }
         
         elif action == 'categories' and method == 'POST':
@@ -483,12 +1077,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             slug = body_data.get('slug')
             icon = body_data.get('icon', 'Gamepad2')
             
-            doc_ref = db.collection('categories').add({
+            base_version = catalog.read_version(db)
+            batch = store.batch()
+            category_id = store.categories.create({
                 'name': name,
                 'slug': slug,
                 'icon': icon
-            })
-            category_id = doc_ref[1].id
+            }, batch)
+            catalog.bump(db, batch)
+            batch.commit()
+            snapshot.try_refresh(db, store, base_version)
             
             return {
                 'statusCode': 201,
@@ -497,7 +1095,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'success': True, 'id': category_id, 'message': 'Категория добавлена'})
+                'body': tracing.dumps({'success': True, 'id': category_id, 'message': 'Категория добавлена'})
             }
         
         elif action == 'categories' and method == 'PUT':
@@ -508,11 +1106,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 slug = body_data.get('slug')
                 icon = body_data.get('icon', 'Gamepad2')
                 
-                db.collection('categories').document(category_id).update({
+                base_version = catalog.read_version(db)
+                batch = store.batch()
+                store.categories.update(category_id, {
                     'name': name,
                     'slug': slug,
                     'icon': icon
-                })
+                }, batch)
+                catalog.bump(db, batch)
+                batch.commit()
+                snapshot.try_refresh(db, store, base_version)
                 
                 return {
                     'statusCode': 200,
@@ -521,7 +1124,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Access-Control-Allow-Origin': '*'
                     },
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True, 'message': 'Категория обновлена'})
+                    'body': tracing.dumps({'success': True, 'message': 'Категория обновлена'})
                 }
             else:
                 return {
@@ -531,13 +1134,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Access-Control-Allow-Origin': '*'
                     },
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Missing id parameter'})
+                    'body': tracing.dumps({'error': 'Missing id parameter'})
                 }
         
         elif action == 'categories' and method == 'DELETE':
             category_id = query_params.get('id')
             if category_id:
-                db.collection('categories').document(category_id).delete()
+                base_version = catalog.read_version(db)
+                batch = store.batch()
+                store.categories.delete(category_id, batch)
+                catalog.bump(db, batch)
+                batch.commit()
+                snapshot.try_refresh(db, store, base_version)
                 
                 return {
                     'statusCode': 200,
@@ -546,7 +1154,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Access-Control-Allow-Origin': '*'
                     },
                     'isBase64Encoded': False,
-                    'body': json.dumps({'success': True, 'message': 'Категория удалена'})
+                    'body': tracing.dumps({'success': True, 'message': 'Категория удалена'})
                 }
             else:
                 return {
@@ -556,20 +1164,350 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Access-Control-Allow-Origin': '*'
                     },
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Missing id parameter'})
+                    'body': tracing.dumps({'error': 'Missing id parameter'})
                 }
         
-        elif action == 'stats' and method == 'GET':
-            torrents_ref = db.collection('torrents').stream()
-            games_count = len(list(torrents_ref))
+        elif action == 'search' and method == 'GET':
+            query = (query_params.get('q') or '').strip()
+            
+            try:
+                fields = parse_fields(query_params.get('fields'))
+                limit = parse_limit(query_params.get('limit'))
+                cursor = decode_cursor(query_params['cursor']) if query_params.get('cursor') else None
+                search_index.check_cursor(cursor)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': str(e)})
+                }
+            
+            found = search_index.search(db, query, limit, cursor)
+            page_ids = [result['id'] for result in found['results']]
+            docs_by_id = store.torrents.get_many(page_ids)
+            
+            torrents = [
+                serialize_torrent(torrent_id, docs_by_id[torrent_id], fields)
+                for torrent_id in page_ids if torrent_id in docs_by_id
+            ]
+            
+            next_cursor = None
+            if found['cursor'] is not None:
+                next_cursor = encode_cursor(dict(found['cursor'], id=found['cursor'].get('id', '')))
+            
+            # total counts matches up to this page; it is the full count only
+            # when totalExact is true (every posting entry was examined)
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({
+                    'torrents': torrents,
+                    'total': found['served'],
+                    'totalExact': found['complete'],
+                    'nextCursor': next_cursor
+                })
+            }
+        
+        elif action == 'reindex' and method == 'POST':
+            indexed = search_index.rebuild(db, store.torrents.stream())
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({'success': True, 'indexed': indexed})
+            }
+        
+        elif action == 'bulk' and method == 'POST':
+            body_data = json.loads(event.get('body', '{}'))
+            operations = body_data.get('operations')
+            
+            existing = store.torrents.get_many(bulk.target_ids(operations))
+            planned, errors = bulk.plan(operations, existing, bulk_document)
+            if errors:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': 'Validation failed, nothing was written', 'errors': errors}, ensure_ascii=False)
+                }
+            
+            base_version = catalog.read_version(db)
+            results, changed_ids, commits = bulk.run(db, store, planned)
+            if commits:
+                snapshot.try_refresh(db, store, base_version, changed_ids, commits)
+            
+            failed = sum(1 for result in results if not result['ok'])
+            return {
+                'statusCode': 207 if failed else 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({
+                    'success': not failed,
+                    'committed': len(results) - failed,
+                    'failed': failed,
+                    'results': results
+                }, ensure_ascii=False)
+            }
+        
+        elif action == 'download' and method == 'POST':
+            body_data = json.loads(event.get('body') or '{}')
+            torrent_id = query_params.get('id') or body_data.get('id')
+            if not downloads.valid_id(torrent_id):
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': 'Некорректный id торрента'}, ensure_ascii=False)
+                }
+            
+            downloads.record(db, torrent_id)
             
-            users_ref = db.collection('users').stream()
-            users_count = len(list(users_ref))
+            # Counted by the next roll-up, not yet visible in listings
+            return {
+                'statusCode': 202,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({'success': True, 'id': torrent_id})
+            }
+        
+        elif action == 'downloads-rollup' and method == 'POST':
+            # Scheduled: fold closed download shards into torrents.downloads
+            downloads.flush(db)
+            state = catalog.read(db)
+            base_version = int(state.get('version', 0))
+            result = downloads.rollup(db, store, state.get('downloads_rolled_at'))
+            if result['commits']:
+                snapshot.try_refresh(db, store, base_version, result['changed_ids'], result['commits'])
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({
+                    'success': True,
+                    'shards': result['shards'],
+                    'downloads': result['downloads'],
+                    'dropped': result['dropped'],
+                    'torrents': len(result['changed_ids']),
+                    'commits': result['commits'],
+                    'skipped': result['skipped']
+                })
+            }
+        
+        elif action == 'changes' and method == 'GET':
+            try:
+                fields = parse_fields(query_params.get('fields'))
+                limit = parse_limit(query_params.get('limit'), changes.CHANGES_PAGE_SIZE, changes.MAX_CHANGES_PAGE_SIZE)
+                position = decode_cursor(query_params['since']) if query_params.get('since') else None
+                changes.check_position(position)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': str(e)})
+                }
+            
+            result = changes.fetch(db, store, position, limit)
+            
+            # resync: drop the local copy first. Then upsert torrents, drop
+            # deleted and pass since back, at once while hasMore is true.
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Cache-Control': 'no-store'
+                },
+                'isBase64Encoded': False,
+                'body': serialization.body({
+                    'resync': result['resync'],
+                    'torrents': serialization.array(result['upserts'], fields, serialize_torrent),
+                    'deleted': result['deleted'],
+                    'since': encode_cursor(result['position']),
+                    'hasMore': result['more']
+                })
+            }
+        
+        elif action == 'changes-compact' and method == 'POST':
+            # Scheduled: drop tombstones older than TOMBSTONE_TTL
+            result = changes.compact(db, store)
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({'success': True, 'purged': result['purged']})
+            }
+        
+        elif action == 'snapshot' and method == 'POST':
+            meta = snapshot.rebuild(db, store)
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({
+                    'success': True,
+                    'version': meta['version'],
+                    'total': meta['total'],
+                    'chunks': len(meta['chunks'])
+                })
+            }
+        
+        elif action == 'top' and method == 'GET':
+            version = catalog.read_version(db)
+            tag = catalog.etag(version, query_params)
+            if catalog.matches(get_header(event, 'If-None-Match'), tag):
+                return not_modified(tag)
+            
+            compressed = compression.cached(get_header(event, 'Accept-Encoding'), tag)
+            if compressed is not None:
+                return compressed
+            
+            meta = snapshot.load_meta(db, version)
+            if meta is not None:
+                source = 'snapshot'
+                top = meta['top']
+            else:
+                source = 'live'
+                
+                def top_of(category: Optional[str] = None) -> List[Dict[str, Any]]:
+                    return [dict(data, id=torrent_id) for torrent_id, data in store.torrents.list(
+                        category, fields=snapshot.CARD_FIELDS, limit=snapshot.TOP_SIZE
+                    )]
+                
+                popular, category_docs = fanout.gather([top_of, store.categories.list])
+                slugs = [cat_data.get('slug') for _, cat_data in category_docs]
+                per_category = fanout.gather([lambda slug=slug: top_of(slug) for slug in slugs])
+                top = {'popular': popular, 'categories': dict(zip(slugs, per_category))}
+            
+            def cards(rows: List[Dict[str, Any]]) -> bytes:
+                return serialization.array(((row['id'], row) for row in rows), FIELD_PRESETS['card'], serialize_torrent)
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'ETag',
+                    'X-Catalog-Source': source,
+                    **catalog.headers(tag)
+                },
+                'isBase64Encoded': False,
+                'body': serialization.body({
+                    'popular': cards(top['popular']),
+                    'categories': serialization.encode_object({slug: cards(rows) for slug, rows in top['categories'].items()})
+                })
+            }
+        
+        elif action == 'steam_import' and method == 'POST':
+            body_data = json.loads(event.get('body', '{}'))
+            items = body_data.get('items', [])
+            categories = body_data.get('categories', [])
+            job_id = body_data.get('jobId') or uuid.uuid4().hex
+            
+            try:
+                if not isinstance(items, list) or (not body_data.get('jobId') and not items):
+                    raise ValueError('items must be a non-empty list of Steam URLs or App IDs')
+                if len(items) > MAX_IMPORT_ITEMS:
+                    raise ValueError(f'At most {MAX_IMPORT_ITEMS} items per import')
+                validate_categories(categories)
+                for item in items:
+                    if isinstance(item, dict) and 'categories' in item:
+                        validate_categories(item['categories'])
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': str(e)})
+                }
+            
+            steam_cache = get_steam_cache()
+            # The Steam client already retries transient failures
+            upstream = rate_limited(fetch_steam_data, TokenBucket(STEAM_IMPORT_RATE, STEAM_IMPORT_BURST), retries=0)
+            
+            importer = SteamImport(
+                store,
+                lambda app_id, lang: steam_cache.get(app_id, lang, fetch=upstream)[0],
+                extract_app_id,
+                job_id,
+                workers=STEAM_IMPORT_WORKERS,
+                time_budget=STEAM_IMPORT_TIME_BUDGET,
+                lang=body_data.get('lang', 'russian')
+            )
+            base_version = catalog.read_version(db)
+            try:
+                report = importer.run(items, categories)
+            except ImportRejected as e:
+                # A resumed job runs what it was started with
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': str(e)})
+                }
+            if importer.commits:
+                snapshot.try_refresh(db, store, base_version, importer.imported_ids, importer.commits)
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps(report, ensure_ascii=False)
+            }
+        
+        elif action == 'user-index' and method == 'POST':
+            # Backfill email/username claims for users created before they existed
+            result = store.users.backfill_claims()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps(dict(result, success=True))
+            }
+        
+        elif action == 'recount' and method == 'POST':
+            # Rebuild maintained counters from scratch to repair drift, and
+            # give legacy torrents the created_at sort=newest orders on
+            backfilled = store.torrents.backfill_created_at()
+            category_counts, games, users, comments = fanout.gather([
+                lambda: counters.count_categories(data for _, data in store.torrents.stream(['category'])),
+                lambda: counters.count_collection(db, 'torrents'),
+                lambda: counters.count_collection(db, 'users'),
+                lambda: counters.count_collection(db, 'comments')
+            ])
+            counters.reset(db, counters.CATEGORY_COUNTS, category_counts)
+            
+            totals = {'games': games, 'users': users, 'comments': comments}
+            counters.reset(db, counters.TOTALS, totals)
+            catalog.bump(db)
+            snapshot.rebuild(db, store)
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': tracing.dumps({
+                    'success': True,
+                    'categories': category_counts,
+                    'totals': totals,
+                    'createdAtBackfilled': backfilled
+                })
+            }
+        
+        elif action == 'stats' and method == 'GET':
+            totals = counters.read_cached(db, counters.TOTALS, STATS_CACHE_TTL)
             
             stats = {
-                'games': games_count,
-                'users': users_count,
-                'comments': 0
+                'games': max(totals.get('games', 0), 0),
+                'users': max(totals.get('users', 0), 0),
+                'comments': max(totals.get('comments', 0), 0)
             }
             
             return {
@@ -579,12 +1517,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps(stats)
+                'body': tracing.dumps(stats)
             }
         
         elif action.startswith('users/') and method == 'DELETE':
             user_id = action.split('/')[-1]
-            db.collection('users').document(user_id).delete()
+            user_data = store.users.get(user_id)
+            if user_data is not None:
+                batch = store.batch()
+                store.users.delete(user_id, batch)
+                store.users.release(user_id, user_data, batch)
+                sessions.revoke_user(db, user_id, batch)
+                counters.increment(db, counters.TOTALS, {'users': -1}, batch)
+                batch.commit()
             
             return {
                 'statusCode': 200,
@@ -593,7 +1538,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'success': True, 'message': 'Пользователь удален'})
+                'body': tracing.dumps({'success': True, 'message': 'Пользователь удален'})
             }
         
         elif method == 'DELETE':
@@ -606,10 +1551,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'Access-Control-Allow-Origin': '*'
                     },
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Missing id parameter'})
+                    'body': tracing.dumps({'error': 'Missing id parameter'})
                 }
             
-            db.collection('torrents').document(torrent_id).delete()
+            old_data = store.torrents.get(torrent_id)
+            if old_data is None:
+                # Nothing to delete: no tombstone, no new catalog version
+                return {
+                    'statusCode': 404,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': 'Торрент не найден'}, ensure_ascii=False)
+                }
+            base_version = catalog.read_version(db)
+            
+            batch = store.batch()
+            store.torrents.delete(torrent_id, batch)
+            search_index.remove_torrent(db, torrent_id, batch)
+            counters.increment(db, counters.CATEGORY_COUNTS, counters.category_deltas(old_data.get('category'), []), batch)
+            counters.increment(db, counters.TOTALS, {'games': -1}, batch)
+            catalog.bump(db, batch)
+            batch.commit()
+            snapshot.try_refresh(db, store, base_version, [torrent_id])
             
             return {
                 'statusCode': 200,
@@ -618,40 +1584,46 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'success': True, 'message': 'Торрент удален'})
+                'body': tracing.dumps({'success': True, 'message': 'Торрент удален'})
             }
         
         elif action and method == 'PUT':
             torrent_id = action
             body_data = json.loads(event.get('body', '{}'))
             
-            print(f"PUT DEBUG: torrent_id={torrent_id}, body_data={body_data}")
+            if tracing.DEBUG:
+                tracing.debug(f"PUT torrent_id={torrent_id}, body_data={body_data}")
             
-            title = body_data.get('title')
-            poster = body_data.get('poster')
-            downloads = int(body_data.get('downloads', 0))
-            size = float(body_data.get('size'))
-            categories = body_data.get('categories', [])
-            description = body_data.get('description', '')
-            steam_deck = body_data.get('steamDeck', False)
-            steam_rating = body_data.get('steamRating')
-            metacritic_score = body_data.get('metacriticScore')
-            
-            print(f"PUT VALUES: title={title}, steam_deck={steam_deck}, categories={categories}")
-            
-            db.collection('torrents').document(torrent_id).update({
-                'title': title,
-                'poster': poster,
-                'downloads': downloads,
-                'size': size,
-                'category': categories,
-                'description': description,
-                'steam_deck': steam_deck,
-                'steam_rating': steam_rating,
-                'metacritic_score': metacritic_score
-            })
+            torrent_data = torrent_document(body_data)
+            categories = torrent_data['category']
             
-            print(f"PUT SUCCESS: updated torrent {torrent_id}")
+            if tracing.DEBUG:
+                tracing.debug(f"PUT values: title={torrent_data['title']}, steam_deck={torrent_data['steam_deck']}, categories={categories}")
+            
+            old_data = store.torrents.get(torrent_id)
+            if old_data is None:
+                return {
+                    'statusCode': 404,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': 'Торрент не найден'}, ensure_ascii=False)
+                }
+            old_categories = old_data.get('category')
+            base_version = catalog.read_version(db)
+            
+            batch = store.batch()
+            store.torrents.update(torrent_id, torrent_data, batch)
+            search_index.index_torrent(db, torrent_id, torrent_data, batch)
+            counters.increment(db, counters.CATEGORY_COUNTS, counters.category_deltas(old_categories, categories), batch)
+            catalog.bump(db, batch)
+            batch.commit()
+            snapshot.try_refresh(db, store, base_version, [torrent_id])
+            
+            if tracing.DEBUG:
+                tracing.debug(f"PUT updated torrent {torrent_id}")
             
             return {
                 'statusCode': 200,
@@ -660,70 +1632,95 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'success': True, 'message': 'Торрент обновлен'})
+                'body': tracing.dumps({'success': True, 'message': 'Торрент обновлен'})
             }
         
         elif method == 'GET':
-            category = event.get('queryStringParameters', {}).get('category') if event.get('queryStringParameters') else None
+            paginated = 'limit' in query_params or 'cursor' in query_params
             
-            if category:
-                torrents_ref = db.collection('torrents').where('category', 'array_contains', category).order_by('downloads', direction=firestore.Query.DESCENDING)
-            else:
-                torrents_ref = db.collection('torrents').order_by('downloads', direction=firestore.Query.DESCENDING)
-            
-            torrents_docs = torrents_ref.stream()
-            
-            torrents = []
-            for doc in torrents_docs:
-                torrent_data = doc.to_dict()
-                torrents.append({
-                    'id': doc.id,
-                    'title': torrent_data.get('title'),
-                    'poster': torrent_data.get('poster'),
-                    'downloads': torrent_data.get('downloads', 0),
-                    'size': float(torrent_data.get('size', 0)),
-                    'category': torrent_data.get('category', []),
-                    'description': torrent_data.get('description', ''),
-                    'steamDeck': bool(torrent_data.get('steam_deck', False)),
-                    'steamRating': torrent_data.get('steam_rating'),
-                    'metacriticScore': torrent_data.get('metacritic_score')
-                })
+            try:
+                fields = parse_fields(query_params.get('fields'))
+                limit = parse_limit(query_params.get('limit')) if paginated else None
+                cursor = decode_cursor(query_params['cursor']) if query_params.get('cursor') else None
+                query_plan = query_planner.plan(query_planner.parse(query_params))
+                query_planner.check_cursor(query_plan, cursor)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': tracing.dumps({'error': str(e)})
+                }
+            
+            if tracing.DEBUG:
+                tracing.debug(f"LIST plan: {query_planner.describe(query_plan)}")
+            
+            version = catalog.read_version(db)
+            tag = catalog.etag(version, query_params)
+            if catalog.matches(get_header(event, 'If-None-Match'), tag):
+                return not_modified(tag)
+            
+            compressed = compression.cached(get_header(event, 'Accept-Encoding'), tag)
+            if compressed is not None:
+                return compressed
+            
+            # Full listings come from the materialized snapshot; pages are cheaper live
+            torrents_docs = None
+            next_cursor = None
+            source = 'live'
+            if not paginated:
+                meta = snapshot.load_meta(db, version)
+                torrents_docs = snapshot.load_torrents(db, meta) if meta is not None else None
+                if torrents_docs is not None:
+                    source = 'snapshot'
+                    torrents_docs = query_planner.evaluate(torrents_docs, query_plan)
+            
+            if torrents_docs is None:
+                selected = None
+                if fields is not None:
+                    # Sort and residual fields are always selected for cursors and
+                    # filtering, updated_at for the fragment cache
+                    selected = sorted(
+                        {TORRENT_FIELDS[name] for name in fields} | set(query_planner.fields(query_plan)) | {'updated_at'}
+                    )
+                
+                torrents_docs, after = query_planner.run(store, query_plan, limit, cursor, selected)
+                if after is not None:
+                    next_cursor = encode_cursor(after)
+            
+            response_body = {'torrents': serialization.array(torrents_docs, fields, serialize_torrent)}
+            if paginated:
+                response_body['nextCursor'] = next_cursor
             
             return {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'ETag',
+                    'X-Catalog-Source': source,
+                    **catalog.headers(tag)
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({'torrents': torrents})
+                'body': serialization.body(response_body)
             }
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             
-            title = body_data.get('title')
-            poster = body_data.get('poster')
-            downloads = int(body_data.get('downloads', 0))
-            size = float(body_data.get('size'))
-            categories = body_data.get('categories', [])
-            description = body_data.get('description', '')
-            steam_deck = body_data.get('steamDeck', False)
-            steam_rating = body_data.get('steamRating')
-            metacritic_score = body_data.get('metacriticScore')
-            
-            doc_ref = db.collection('torrents').add({
-                'title': title,
-                'poster': poster,
-                'downloads': downloads,
-                'size': size,
-                'category': categories,
-                'description': description,
-                'steam_deck': steam_deck,
-                'steam_rating': steam_rating,
-                'metacritic_score': metacritic_score
-            })
-            torrent_id = doc_ref[1].id
+            torrent_data = torrent_document(body_data)
+            torrent_data['created_at'] = datetime.utcnow().isoformat()
+            categories = torrent_data['category']
+            
+            base_version = catalog.read_version(db)
+            batch = store.batch()
+            torrent_id = store.torrents.create(torrent_data, batch)
+            search_index.index_torrent(db, torrent_id, torrent_data, batch)
+            counters.increment(db, counters.CATEGORY_COUNTS, counters.category_deltas([], categories), batch)
+            counters.increment(db, counters.TOTALS, {'games': 1}, batch)
+            catalog.bump(db, batch)
+            batch.commit()
+            snapshot.try_refresh(db, store, base_version, [torrent_id])
             
             return {
                 'statusCode': 201,
@@ -732,7 +1729,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Access-Control-Allow-Origin': '*'
                 },
                 'isBase64Encoded': False,
-                'body': json.dumps({
+                'body': tracing.dumps({
                     'success': True,
                     'id': torrent_id,
                     'message': 'Торрент успешно добавлен'
@@ -746,9 +1743,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Access-Control-Allow-Origin': '*'
             },
             'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
+            'body': tracing.dumps({'error': 'Method not allowed'})
         }
     
+    except sessions.SessionSecretMissing:
+        return session_secret_missing()
+    except fanout.DeadlineExceeded as e:
+        print(f"ERROR: {str(e)}")
+        return {
+            'statusCode': 504,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': tracing.dumps({'error': str(e)})
+        }
     except Exception as e:
         print(f"ERROR: {str(e)}")
         return {
@@ -758,5 +1765,5 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Access-Control-Allow-Origin': '*'
             },
             'isBase64Encoded': False,
-            'body': json.dumps({'error': f'Internal server error: {str(e)}'})
+            'body': tracing.dumps({'error': f'Internal server error: {str(e)}'})
         }
\ No newline at end of file
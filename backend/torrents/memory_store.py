@@ -0,0 +1,540 @@
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+# In-process document store implementing the subset of the Firestore client
+# API used by this function (collections, subcollections, queries, batches,
+# get_all, count aggregation, Increment, DELETE_FIELD, SERVER_TIMESTAMP).
+# Used by STORAGE_ENGINE=memory to run, profile and load-test the handler
+# without a Firebase project.
+#
+# Query semantics follow Firestore: documents missing an order_by field are
+# excluded, ties are broken by document id in the direction of the last
+# ordering, values of different types order null < bool < number < timestamp < string.
+# Equality and array_contains filters are served from per-field hash indexes
+# and orderings from cached sorted id lists, so queries over 100k+ documents
+# touch only the rows they return.
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+_TYPE_RANK = {type(None): 0, bool: 1, int: 2, float: 2, datetime: 3, str: 4}
+
+
+def _sort_value(value: Any) -> Tuple[int, Any]:
+    rank = _TYPE_RANK.get(type(value), 5)
+    if rank == 5:
+        return rank, str(value)
+    return rank, value
+
+
+def _copy(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: list(value) if isinstance(value, list) else dict(value) if isinstance(value, dict) else value
+        for key, value in data.items()
+    }
+
+
+def _is_increment(value: Any) -> bool:
+    return type(value).__name__ == 'Increment' and hasattr(value, 'value')
+
+
+def _project(data: Optional[Dict[str, Any]], field_paths) -> Optional[Dict[str, Any]]:
+    if data is None or field_paths is None:
+        return data
+    return {field: data[field] for field in field_paths if field in data}
+
+
+class Sentinel:
+    """Field sentinel, matched by name and description like Firestore's own"""
+    
+    def __init__(self, description: str):
+        self.description = description
+    
+    def __repr__(self) -> str:
+        return f'Sentinel: {self.description}'
+
+
+class Increment:
+    def __init__(self, value: Any):
+        self.value = value
+
+
+DELETE_FIELD = Sentinel('Value used to delete a field in a document.')
+SERVER_TIMESTAMP = Sentinel('Value used to set a document field to the server timestamp.')
+
+# The engine's field values (storage.field_values), so writes never import firebase_admin
+FIELD_VALUES = SimpleNamespace(Increment=Increment, DELETE_FIELD=DELETE_FIELD, SERVER_TIMESTAMP=SERVER_TIMESTAMP)
+
+
+class Snapshot:
+    def __init__(self, reference: 'DocumentReference', data: Optional[Dict[str, Any]], update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+    
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return _copy(self._data) if self._data is not None else None
+    
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+class AggregationResult:
+    def __init__(self, alias: str, value: int):
+        self.alias = alias
+        self.value = value
+
+
+class _Collection:
+    """Storage of one collection path with its lazily built indexes"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.update_times: Dict[str, datetime] = {}
+        self.field_indexes: Dict[str, Dict[Any, Set[str]]] = {}
+        self.order_indexes: Dict[Tuple, List[str]] = {}
+    
+    def _index_add(self, doc_id: str, data: Dict[str, Any]) -> None:
+        for field, index in self.field_indexes.items():
+            for key in self._index_keys(data.get(field)):
+                index.setdefault(key, set()).add(doc_id)
+    
+    def _index_remove(self, doc_id: str, data: Dict[str, Any]) -> None:
+        for field, index in self.field_indexes.items():
+            for key in self._index_keys(data.get(field)):
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del index[key]
+    
+    @staticmethod
+    def _index_keys(value: Any) -> List[Any]:
+        # Arrays are indexed both as elements (array_contains) and as a whole (==)
+        keys = []
+        if isinstance(value, list):
+            keys = [('e', item) for item in value if isinstance(item, (str, int, float, bool, type(None)))]
+            try:
+                keys.append(('v', tuple(value)))
+            except TypeError:
+                pass
+        elif isinstance(value, (str, int, float, bool, type(None))):
+            keys.append(('v', value))
+        return keys
+    
+    def field_index(self, field: str) -> Dict[Any, Set[str]]:
+        index = self.field_indexes.get(field)
+        if index is None:
+            index = {}
+            for doc_id, data in self.docs.items():
+                for key in self._index_keys(data.get(field)):
+                    index.setdefault(key, set()).add(doc_id)
+            self.field_indexes[field] = index
+        return index
+    
+    def ordered_ids(self, orders: Tuple[Tuple[str, str], ...]) -> List[str]:
+        ids = self.order_indexes.get(orders)
+        if ids is None:
+            fields = [field for field, _ in orders if field != '__name__']
+            ids = [doc_id for doc_id, data in self.docs.items() if all(field in data for field in fields)]
+            for field, direction in reversed(orders):
+                if field == '__name__':
+                    ids.sort(reverse=direction == DESCENDING)
+                else:
+                    ids.sort(key=lambda doc_id: _sort_value(self.docs[doc_id].get(field)), reverse=direction == DESCENDING)
+            self.order_indexes[orders] = ids
+        return ids
+    
+    def write(self, doc_id: str, data: Optional[Dict[str, Any]]) -> None:
+        old = self.docs.get(doc_id)
+        if old is not None:
+            self._index_remove(doc_id, old)
+            del self.docs[doc_id]
+            self.update_times.pop(doc_id, None)
+        if data is not None:
+            self.docs[doc_id] = data
+            self.update_times[doc_id] = datetime.now(timezone.utc)
+            self._index_add(doc_id, data)
+        self.order_indexes.clear()
+
+
+class Query:
+    def __init__(self, client: 'MemoryClient', path: str, filters=(), orders=(), limit_to=None,
+                 cursor=None, projection=None, offset_by=0):
+        self._client = client
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_to
+        self._cursor = cursor
+        self._projection = projection
+        self._offset = offset_by
+    
+    def _copy_with(self, **changes) -> 'Query':
+        params = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit_to': self._limit,
+            'cursor': self._cursor,
+            'projection': self._projection,
+            'offset_by': self._offset
+        }
+        params.update(changes)
+        return Query(self._client, self._path, **params)
+    
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None, filter=None) -> 'Query':
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy_with(filters=self._filters + ((field_path, op_string, value),))
+    
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> 'Query':
+        return self._copy_with(orders=self._orders + ((field_path, str(direction)),))
+    
+    def limit(self, count: int) -> 'Query':
+        return self._copy_with(limit_to=count)
+    
+    def offset(self, count: int) -> 'Query':
+        return self._copy_with(offset_by=count)
+    
+    def select(self, field_paths: Iterable[str]) -> 'Query':
+        return self._copy_with(projection=list(field_paths))
+    
+    def start_after(self, document_fields) -> 'Query':
+        return self._copy_with(cursor=document_fields)
+    
+    def _effective_orders(self) -> Tuple[Tuple[str, str], ...]:
+        orders = self._orders
+        if not orders or orders[-1][0] != '__name__':
+            direction = orders[-1][1] if orders else ASCENDING
+            orders = orders + (('__name__', direction),)
+        return orders
+    
+    def _cursor_values(self, orders) -> Optional[List[Any]]:
+        if self._cursor is None:
+            return None
+        cursor = self._cursor
+        if isinstance(cursor, Snapshot):
+            values = dict(cursor._data or {})
+            values['__name__'] = cursor.id
+            cursor = values
+        if isinstance(cursor, dict):
+            result = []
+            for field, _ in orders:
+                if field not in cursor:
+                    break
+                value = cursor[field]
+                result.append(value.id if hasattr(value, 'id') and field == '__name__' else value)
+            return result
+        return list(cursor)
+    
+    @staticmethod
+    def _matches(doc_id: str, data: Dict[str, Any], field: str, op: str, value: Any) -> bool:
+        if field != '__name__' and field not in data:
+            return False
+        actual = doc_id if field == '__name__' else data.get(field)
+        if field == '__name__' and isinstance(value, DocumentReference):
+            value = value.id
+        if op == '==':
+            return actual == value
+        if op == '!=':
+            return actual != value and actual is not None
+        if op == 'array_contains':
+            return isinstance(actual, list) and value in actual
+        if op == 'array_contains_any':
+            return isinstance(actual, list) and any(item in actual for item in value)
+        if op == 'in':
+            return actual in value
+        if op == 'not-in':
+            return actual is not None and actual not in value
+        if op in ('<', '<=', '>', '>='):
+            if _sort_value(actual)[0] != _sort_value(value)[0]:
+                return False
+            left, right = _sort_value(actual), _sort_value(value)
+            return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[op]
+        raise ValueError(f'Unsupported operator {op}')
+    
+    def _candidates(self, collection: _Collection) -> Optional[Set[str]]:
+        """Intersect hash-index postings of equality-style filters, None means no restriction"""
+        candidates = None
+        for field, op, value in self._filters:
+            if field == '__name__':
+                continue
+            if op == '==':
+                keys = _Collection._index_keys(value)[-1:]
+            elif op == 'array_contains':
+                keys = [('e', value)]
+            elif op == 'array_contains_any':
+                keys = [('e', item) for item in value]
+            elif op == 'in':
+                keys = [key for item in value for key in _Collection._index_keys(item)[-1:]]
+            else:
+                continue
+            index = collection.field_index(field)
+            ids = set()
+            for key in keys:
+                ids |= index.get(key, set())
+            candidates = ids if candidates is None else candidates & ids
+        return candidates
+    
+    def _compare_to_cursor(self, collection: _Collection, doc_id: str, orders, cursor_values) -> int:
+        data = collection.docs[doc_id]
+        for (field, direction), cursor_value in zip(orders, cursor_values):
+            actual = doc_id if field == '__name__' else data.get(field)
+            left, right = _sort_value(actual), _sort_value(cursor_value)
+            if left != right:
+                result = -1 if left < right else 1
+                return -result if direction == DESCENDING else result
+        return 0
+    
+    def _run(self) -> List[Tuple[str, Dict[str, Any], datetime]]:
+        with self._client._lock:
+            return list(self._scan())
+    
+    def _scan(self) -> Iterator[Tuple[str, Dict[str, Any], datetime]]:
+        collection = self._client._collection(self._path)
+        orders = self._effective_orders()
+        candidates = self._candidates(collection)
+        cursor_values = self._cursor_values(orders)
+        
+        if candidates is not None and (len(candidates) < 64 or not self._orders):
+            ids = sorted(
+                (doc_id for doc_id in candidates if all(field in collection.docs[doc_id] for field, _ in orders if field != '__name__')),
+                key=lambda doc_id: doc_id,
+                reverse=orders[-1][1] == DESCENDING
+            )
+            for field, direction in reversed(orders[:-1]):
+                ids.sort(key=lambda doc_id: _sort_value(collection.docs[doc_id].get(field)), reverse=direction == DESCENDING)
+        else:
+            ids = collection.ordered_ids(orders)
+        
+        skipped = 0
+        returned = 0
+        for doc_id in ids:
+            if candidates is not None and doc_id not in candidates:
+                continue
+            data = collection.docs[doc_id]
+            if not all(self._matches(doc_id, data, field, op, value) for field, op, value in self._filters):
+                continue
+            if cursor_values and self._compare_to_cursor(collection, doc_id, orders, cursor_values) <= 0:
+                continue
+            if skipped < self._offset:
+                skipped += 1
+                continue
+            if self._limit is not None and returned >= self._limit:
+                break
+            returned += 1
+            yield doc_id, data, collection.update_times.get(doc_id)
+    
+    def stream(self, transaction=None) -> Iterator[Snapshot]:
+        # Firestore bills one read per returned document, and one for a query with no results
+        returned = 0
+        for doc_id, data, update_time in self._run():
+            self._client.reads += 1
+            returned += 1
+            data = _project(data, self._projection)
+            yield Snapshot(DocumentReference(self._client, self._path, doc_id), _copy(data), update_time)
+        if not returned:
+            self._client.reads += 1
+    
+    def get(self, transaction=None) -> List[Snapshot]:
+        return list(self.stream())
+    
+    def count(self, alias: str = 'count') -> 'CountQuery':
+        return CountQuery(self, alias)
+
+
+class CountQuery:
+    def __init__(self, query: Query, alias: str):
+        self._query = query
+        self._alias = alias
+    
+    def get(self, transaction=None) -> List[List[AggregationResult]]:
+        count = sum(1 for _ in self._query._run())
+        # Firestore bills one read per batch of up to 1000 index entries
+        self._query._client.reads += max(1, (count + 999) // 1000)
+        return [[AggregationResult(self._alias, count)]]
+
+
+class CollectionReference(Query):
+    def __init__(self, client: 'MemoryClient', path: str):
+        super().__init__(client, path)
+        self.id = path.split('/')[-1]
+    
+    def document(self, document_id: Optional[str] = None) -> 'DocumentReference':
+        return DocumentReference(self._client, self._path, document_id or uuid.uuid4().hex[:20])
+    
+    def add(self, document_data: Dict[str, Any], document_id: Optional[str] = None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return datetime.now(timezone.utc), ref
+    
+    def list_documents(self) -> List['DocumentReference']:
+        collection = self._client._collection(self._path)
+        return [DocumentReference(self._client, self._path, doc_id) for doc_id in list(collection.docs)]
+
+
+class DocumentReference:
+    def __init__(self, client: 'MemoryClient', collection_path: str, document_id: str):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = document_id
+        self.path = f'{collection_path}/{document_id}'
+    
+    def collection(self, collection_id: str) -> CollectionReference:
+        return CollectionReference(self._client, f'{self.path}/{collection_id}')
+    
+    def get(self, field_paths=None, transaction=None) -> Snapshot:
+        collection = self._client._collection(self._collection_path)
+        self._client.reads += 1
+        data = _project(collection.docs.get(self.id), field_paths)
+        return Snapshot(self, _copy(data) if data is not None else None, collection.update_times.get(self.id))
+    
+    def _apply(
+        self,
+        data: Dict[str, Any],
+        merge: bool,
+        must_exist: bool = False,
+        must_not_exist: bool = False,
+        commit_time: Optional[datetime] = None
+    ) -> None:
+        with self._client._lock:
+            collection = self._client._collection(self._collection_path)
+            current = collection.docs.get(self.id)
+            if must_exist and current is None:
+                raise NotFound(f'No document to update: {self.path}')
+            if must_not_exist and current is not None:
+                raise AlreadyExists(f'Document already exists: {self.path}')
+            
+            result = _copy(current) if (merge and current is not None) else {}
+            for field, value in data.items():
+                if _is_increment(value):
+                    base = result.get(field, 0)
+                    result[field] = (base if isinstance(base, (int, float)) else 0) + value.value
+                elif type(value).__name__ == 'Sentinel' and 'delete' in repr(value).lower():
+                    result.pop(field, None)
+                elif type(value).__name__ == 'Sentinel' and 'server timestamp' in repr(value).lower():
+                    result[field] = commit_time or self._client._commit_time()
+                else:
+                    result[field] = value
+            collection.write(self.id, _copy(result))
+            self._client.writes += 1
+    
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._apply(document_data, merge)
+    
+    def create(self, document_data: Dict[str, Any]) -> None:
+        self._apply(document_data, False, must_not_exist=True)
+    
+    def update(self, field_updates: Dict[str, Any]) -> None:
+        self._apply(field_updates, True, must_exist=True)
+    
+    def delete(self) -> None:
+        with self._client._lock:
+            self._client._collection(self._collection_path).write(self.id, None)
+            self._client.writes += 1
+
+
+class NotFound(Exception):
+    """Update of a missing document, mirrors google.api_core.exceptions.NotFound"""
+
+
+class AlreadyExists(Exception):
+    """Create of an existing document, mirrors google.api_core.exceptions.AlreadyExists"""
+
+
+class WriteBatch:
+    MAX_OPERATIONS = 500
+    
+    def __init__(self, client: 'MemoryClient'):
+        self._client = client
+        self._operations: List[Tuple[str, DocumentReference, Optional[Dict[str, Any]], bool]] = []
+    
+    def __len__(self) -> int:
+        return len(self._operations)
+    
+    def set(self, reference: DocumentReference, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._operations.append(('set', reference, document_data, merge))
+    
+    def create(self, reference: DocumentReference, document_data: Dict[str, Any]) -> None:
+        self._operations.append(('create', reference, document_data, False))
+    
+    def update(self, reference: DocumentReference, field_updates: Dict[str, Any]) -> None:
+        self._operations.append(('update', reference, field_updates, True))
+    
+    def delete(self, reference: DocumentReference) -> None:
+        self._operations.append(('delete', reference, None, False))
+    
+    def commit(self) -> List[Any]:
+        if len(self._operations) > self.MAX_OPERATIONS:
+            raise ValueError(f'A batch can contain at most {self.MAX_OPERATIONS} operations')
+        
+        with self._client._lock:
+            # Check create/update preconditions up front so a failing batch writes nothing
+            exists: Dict[str, bool] = {}
+            for kind, reference, _, _ in self._operations:
+                if reference.path not in exists:
+                    exists[reference.path] = reference.id in self._client._collection(reference._collection_path).docs
+                if kind == 'create' and exists[reference.path]:
+                    raise AlreadyExists(f'Document already exists: {reference.path}')
+                if kind == 'update' and not exists[reference.path]:
+                    raise NotFound(f'No document to update: {reference.path}')
+                exists[reference.path] = kind != 'delete'
+            
+            # One commit time for every SERVER_TIMESTAMP in the batch, as in Firestore
+            commit_time = self._client._commit_time()
+            for kind, reference, data, merge in self._operations:
+                if kind == 'delete':
+                    reference.delete()
+                else:
+                    reference._apply(data, merge, commit_time=commit_time)
+        
+        self._client.commits += 1
+        return []
+
+
+class MemoryClient:
+    """Firestore-compatible in-process client"""
+    
+    field_values = FIELD_VALUES
+    
+    def __init__(self):
+        self._collections: Dict[str, _Collection] = {}
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+        self._last_commit_time = datetime.fromtimestamp(0, timezone.utc)
+    
+    def _commit_time(self) -> datetime:
+        """Strictly increasing commit timestamps, the value of SERVER_TIMESTAMP fields"""
+        with self._lock:
+            now = datetime.now(timezone.utc)
+            self._last_commit_time = max(now, self._last_commit_time + timedelta(microseconds=1))
+            return self._last_commit_time
+    
+    def _collection(self, path: str) -> _Collection:
+        collection = self._collections.get(path)
+        if collection is None:
+            collection = self._collections.setdefault(path, _Collection(path))
+        return collection
+    
+    def collection(self, collection_id: str) -> CollectionReference:
+        return CollectionReference(self, collection_id)
+    
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+    
+    def get_all(self, references: Iterable[DocumentReference], field_paths=None, transaction=None) -> Iterator[Snapshot]:
+        for reference in references:
+            yield reference.get(field_paths)
+    
+    def reset_stats(self) -> None:
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
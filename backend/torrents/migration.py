@@ -0,0 +1,536 @@
+import csv
+import gzip
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+import catalog
+import counters
+import search_index
+import snapshot
+from storage import LEGACY_CREATED_AT
+
+# PostgreSQL -> Firestore migration (schema of db_migrations/V0001-V0011).
+# Rows are streamed from a pg_dump plain-text file (COPY blocks, optionally
+# gzipped), a directory of CSV exports (<table>.csv with a header row) or a
+# local SQLite copy, transformed into the documents the handler reads and
+# written in WriteBatches by a small thread pool.
+# Document ids are derived from the PostgreSQL primary keys (pg_<id>), so
+# re-running a migration overwrites instead of duplicating, and a checkpoint
+# file records how far each table got: an interrupted run resumes after the
+# last batch whose predecessors were all committed. Only a bounded window of
+# batches is in flight, so memory does not grow with the table size.
+# Counters are recounted from the migrated collections at the end instead of
+# incremented per batch (a resumed batch would count twice), then the
+# catalog version is bumped once and the snapshot rebuilt.
+
+TABLES = ('categories', 'users', 'torrents', 'comments')
+
+MAX_BATCH_WRITES = 500
+
+# Torrents also write their search index entry, users their email and
+# username claims
+WRITES_PER_ROW = {'torrents': 2, 'users': 3}
+
+SQLITE_PAGE_SIZE = 1000
+COMMIT_ATTEMPTS = 3
+PROGRESS_INTERVAL = 5.0
+
+# Rows as the PostgreSQL tables held them; action=migrate and --seed
+SEED_ROWS = {
+    'categories': [
+        {'id': 1, 'name': 'RPG', 'slug': 'RPG', 'icon': 'Sword'},
+        {'id': 2, 'name': 'Экшен', 'slug': 'Action', 'icon': 'Zap'},
+        {'id': 3, 'name': 'Гонки', 'slug': 'Racing', 'icon': 'Car'}
+    ],
+    'users': [
+        {
+            'id': 1,
+            'username': 'Kot',
+            'email': 'igorkochetkow@yandex.ru',
+            'password_hash': '497c0f6767166ad2242e9266d9ce34409ac43cd2a9e22b548aa7b1a6329a68d7',
+            'avatar': 'https://api.dicebear.com/7.x/avataaars/svg?seed=Kot',
+            'first_name': 'Kot',
+            'created_at': '2025-11-05 16:27:55.463905',
+            'is_admin': False
+        }
+    ],
+    'torrents': [
+        {
+            'id': 1,
+            'title': 'Counter-Strike 2',
+            'poster': 'https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/730/ss_0f8cf82d019c614760fd20801f2bb4001da7ea77.1920x1080.jpg?t=1749053861',
+            'downloads': 0,
+            'size': 16.0,
+            'category': ['action', 'RPG'],
+            'description': 'Более двух десятилетий Counter-Strike служит примером первоклассной соревновательной игры, путь развития которой определяют миллионы игроков со всего мира. Теперь пришло время нового этапа — Counter-Strike 2.',
+            'steam_deck': True,
+            'steam_rating': 4755307,
+            'metacritic_score': None
+        }
+    ],
+    'comments': []
+}
+
+Row = Dict[str, Any]
+
+
+def document_id(pk: Any) -> str:
+    """Deterministic document id for a PostgreSQL primary key"""
+    return f'pg_{pk}'
+
+
+# Value conversions. CSV and COPY sources hand over strings, SQLite and seed
+# rows native values; every converter accepts both.
+
+def _text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _optional_text(value: Any) -> Optional[str]:
+    # CSV exports write NULL as an empty field
+    return None if value is None or value == '' else str(value)
+
+
+def _int(value: Any) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _float(value: Any) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def _bool(value: Any) -> Optional[bool]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return value.strip().lower() in ('t', 'true', '1', 'y', 'yes', 'on')
+    return bool(value)
+
+
+def _timestamp(value: Any) -> Optional[str]:
+    """PostgreSQL timestamp text to the isoformat strings the handler writes"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).strip().replace(' ', 'T', 1)
+
+
+def parse_text_array(value: Any) -> List[str]:
+    """
+    text[] value: a PostgreSQL array literal ({a,"b c"}), a JSON array (as
+    SQLite copies often store it) or a single pre-V0006 category string.
+    """
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value if item is not None]
+    
+    value = str(value).strip()
+    if value.startswith('['):
+        return [str(item) for item in json.loads(value) if item is not None]
+    if not value.startswith('{'):
+        return [value]
+    
+    items: List[Optional[str]] = []
+    current: List[str] = []
+    quoted = in_quotes = False
+    
+    def element() -> Optional[str]:
+        text = ''.join(current)
+        if quoted:
+            return text
+        text = text.strip()
+        return None if text == 'NULL' else text
+    
+    body = value[1:-1]
+    i = 0
+    while i < len(body):
+        char = body[i]
+        if in_quotes:
+            if char == '\\':
+                i += 1
+                current.append(body[i])
+            elif char == '"':
+                in_quotes = False
+            else:
+                current.append(char)
+        elif char == '"':
+            in_quotes = quoted = True
+        elif char == ',':
+            items.append(element())
+            current, quoted = [], False
+        else:
+            current.append(char)
+        i += 1
+    if body:
+        items.append(element())
+    return [item for item in items if item is not None]
+
+
+def transform_category(row: Row) -> Dict[str, Any]:
+    return {
+        'name': _text(row.get('name')),
+        'slug': _text(row.get('slug')),
+        'icon': _text(row.get('icon')) or 'Gamepad2'
+    }
+
+
+def transform_user(row: Row) -> Dict[str, Any]:
+    return {
+        'username': _text(row.get('username')),
+        'email': _optional_text(row.get('email')),
+        'password_hash': _optional_text(row.get('password_hash')),
+        'avatar': _optional_text(row.get('avatar')),
+        'first_name': _optional_text(row.get('first_name')),
+        'created_at': _timestamp(row.get('created_at')),
+        'is_admin': bool(_bool(row.get('is_admin')))
+    }
+
+
+def transform_torrent(row: Row) -> Dict[str, Any]:
+    document = {
+        'title': _text(row.get('title')),
+        'poster': _text(row.get('poster')),
+        'downloads': _int(row.get('downloads')) or 0,
+        'size': _float(row.get('size')) or 0.0,
+        'category': parse_text_array(row.get('category')),
+        'description': _text(row.get('description')) or '',
+        'steam_deck': bool(_bool(row.get('steam_deck'))),
+        'steam_rating': _int(row.get('steam_rating')),
+        'metacritic_score': _int(row.get('metacritic_score'))
+    }
+    # sort=newest only lists torrents that have created_at
+    document['created_at'] = _timestamp(row.get('created_at')) or LEGACY_CREATED_AT
+    return document
+
+
+def transform_comment(row: Row) -> Dict[str, Any]:
+    torrent_id = _int(row.get('torrent_id'))
+    user_id = _int(row.get('user_id'))
+    return {
+        'torrent_id': document_id(torrent_id) if torrent_id is not None else None,
+        'user_id': document_id(user_id) if user_id is not None else None,
+        'content': _text(row.get('content')) or '',
+        'created_at': _timestamp(row.get('created_at'))
+    }
+
+
+TRANSFORMS: Dict[str, Callable[[Row], Dict[str, Any]]] = {
+    'categories': transform_category,
+    'users': transform_user,
+    'torrents': transform_torrent,
+    'comments': transform_comment
+}
+
+
+# Sources. rows(table, position) yields (row, position) pairs, where
+# position is what the checkpoint stores to resume right after that row.
+
+class RowsSource:
+    """In-memory rows per table (seed data, tests)"""
+    
+    def __init__(self, rows: Dict[str, List[Row]], name: str = 'rows'):
+        self.tables = rows
+        self.name = name
+    
+    def rows(self, table: str, position: Any) -> Iterator[Tuple[Row, Any]]:
+        skip = position or 0
+        for offset, row in enumerate(self.tables.get(table, [])[skip:], skip + 1):
+            yield row, offset
+
+
+class CsvSource:
+    """<directory>/<table>.csv, as written by \\copy ... TO ... WITH CSV HEADER"""
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.name = f'csv:{os.path.abspath(directory)}'
+    
+    def rows(self, table: str, position: Any) -> Iterator[Tuple[Row, Any]]:
+        path = os.path.join(self.directory, f'{table}.csv')
+        if not os.path.exists(path):
+            return
+        skip = position or 0
+        with open(path, newline='', encoding='utf-8') as f:
+            for offset, row in enumerate(csv.DictReader(f), 1):
+                if offset > skip:
+                    yield row, offset
+
+
+_COPY_RE = re.compile(r'^COPY\s+(?:"?[\w$]+"?\.)?"?(\w+)"?\s*\(([^)]*)\)\s+FROM\s+stdin;', re.IGNORECASE)
+_COPY_ESCAPE_RE = re.compile(r'\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)')
+_COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+
+
+def _copy_unescape(match) -> str:
+    escape = match.group(1)
+    if escape[0] == 'x' and len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    if escape[0] in '01234567':
+        return chr(int(escape, 8))
+    return _COPY_ESCAPES.get(escape, escape)
+
+
+def parse_copy_line(line: str, columns: List[str]) -> Row:
+    """One line of COPY text format: tab-separated, \\N for NULL, backslash escapes"""
+    values = line.rstrip('\n').split('\t')
+    return {
+        column: None if value == '\\N' else _COPY_ESCAPE_RE.sub(_copy_unescape, value)
+        for column, value in zip(columns, values)
+    }
+
+
+class PgDumpSource:
+    """COPY ... FROM stdin blocks of a plain-format pg_dump (.sql or .sql.gz)"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.name = f'pg_dump:{os.path.abspath(path)}'
+    
+    def _open(self):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, 'rt', encoding='utf-8')
+        return open(self.path, encoding='utf-8')
+    
+    def rows(self, table: str, position: Any) -> Iterator[Tuple[Row, Any]]:
+        skip = position or 0
+        with self._open() as f:
+            columns = None
+            offset = 0
+            for line in f:
+                if columns is None:
+                    match = _COPY_RE.match(line)
+                    if match and match.group(1) == table:
+                        columns = [column.strip().strip('"') for column in match.group(2).split(',')]
+                    continue
+                if line.startswith('\\.'):
+                    return
+                offset += 1
+                if offset > skip:
+                    yield parse_copy_line(line, columns), offset
+
+
+class SqliteSource:
+    """Local SQLite copy of the database, read in primary key order by keyset pages"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.name = f'sqlite:{os.path.abspath(path)}'
+    
+    def rows(self, table: str, position: Any) -> Iterator[Tuple[Row, Any]]:
+        connection = sqlite3.connect(self.path)
+        connection.row_factory = sqlite3.Row
+        try:
+            exists = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            if not exists:
+                return
+            last_id = position
+            while True:
+                if last_id is None:
+                    page = connection.execute(f'SELECT * FROM "{table}" ORDER BY id LIMIT ?', (SQLITE_PAGE_SIZE,))
+                else:
+                    page = connection.execute(
+                        f'SELECT * FROM "{table}" WHERE id > ? ORDER BY id LIMIT ?', (last_id, SQLITE_PAGE_SIZE)
+                    )
+                rows = page.fetchall()
+                if not rows:
+                    return
+                for row in rows:
+                    last_id = row['id']
+                    yield dict(row), last_id
+        finally:
+            connection.close()
+
+
+class Checkpoint:
+    """Per-table resume positions, persisted atomically as JSON"""
+    
+    def __init__(self, path: Optional[str], source_name: str, restart: bool = False):
+        self.path = path
+        self.state: Dict[str, Any] = {'source': source_name, 'tables': {}}
+        if path and os.path.exists(path) and not restart:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('source') != source_name:
+                raise ValueError(
+                    f"Checkpoint {path} belongs to {saved.get('source')}, not {source_name}; "
+                    'pass --restart to discard it'
+                )
+            self.state = saved
+    
+    def table(self, table: str) -> Dict[str, Any]:
+        return self.state['tables'].setdefault(table, {'position': None, 'rows': 0, 'done': False})
+    
+    def save(self) -> None:
+        if not self.path:
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(temporary, self.path)
+
+
+class Migrator:
+    """One migration run from a source into the Firestore collections"""
+    
+    def __init__(
+        self,
+        db,
+        store,
+        source,
+        checkpoint: Optional[Checkpoint] = None,
+        workers: int = 4,
+        log: Callable[[str], None] = print
+    ):
+        self.db = db
+        self.store = store
+        self.source = source
+        self.checkpoint = checkpoint or Checkpoint(None, source.name)
+        self.workers = max(1, workers)
+        self.log = log
+        self.stats: Dict[str, Dict[str, Any]] = {}
+    
+    def _write_row(self, table: str, batch, row: Row) -> None:
+        doc_id = document_id(row['id'])
+        document = TRANSFORMS[table](row)
+        if table == 'torrents':
+            self.store.torrents.create(document, batch, doc_id)
+            search_index.index_torrent(self.db, doc_id, document, batch)
+        elif table == 'users':
+            self.store.users.create(document, batch, doc_id)
+            self.store.users.claim(doc_id, document, batch)
+        elif table == 'categories':
+            self.store.categories.create(document, batch, doc_id)
+        else:
+            batch.set(self.db.collection('comments').document(doc_id), document)
+    
+    def _commit(self, table: str, rows: List[Row]) -> int:
+        # Every write is a set() of a deterministic id, so retrying is safe
+        for attempt in range(COMMIT_ATTEMPTS):
+            batch = self.store.batch()
+            for row in rows:
+                self._write_row(table, batch, row)
+            try:
+                batch.commit()
+                return len(rows)
+            except Exception:
+                if attempt == COMMIT_ATTEMPTS - 1:
+                    raise
+                time.sleep(2 ** attempt)
+        return 0
+    
+    def migrate_table(self, table: str) -> Dict[str, Any]:
+        progress = self.checkpoint.table(table)
+        stats = self.stats.setdefault(table, {'rows': progress['rows'], 'migrated': 0, 'seconds': 0.0})
+        if progress['done']:
+            self.log(f'  {table}: already migrated ({progress["rows"]} rows)')
+            return stats
+        
+        rows_per_batch = MAX_BATCH_WRITES // WRITES_PER_ROW.get(table, 1)
+        max_in_flight = self.workers * 2
+        started = time.monotonic()
+        reported = started
+        # (future, position after the batch) in submission order
+        pending: deque = deque()
+        
+        def record(count: int, position: Any) -> None:
+            progress['position'] = position
+            progress['rows'] += count
+            stats['rows'] += count
+            stats['migrated'] += count
+            self.checkpoint.save()
+        
+        def settle(block: bool) -> None:
+            # Advance the checkpoint over the committed prefix only; a failed
+            # batch stays at the head of the window while its error propagates
+            while pending and (block or pending[0][0].done()):
+                count = pending[0][0].result()
+                record(count, pending.popleft()[1])
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                rows: List[Row] = []
+                position = progress['position']
+                for row, position in self.source.rows(table, progress['position']):
+                    rows.append(row)
+                    if len(rows) < rows_per_batch:
+                        continue
+                    pending.append((executor.submit(self._commit, table, rows), position))
+                    rows = []
+                    settle(block=len(pending) >= max_in_flight)
+                    
+                    now = time.monotonic()
+                    if now - reported >= PROGRESS_INTERVAL:
+                        reported = now
+                        rate = stats['migrated'] / (now - started)
+                        self.log(f'  {table}: {stats["rows"]} rows, {rate:.0f} rows/s')
+                if rows:
+                    pending.append((executor.submit(self._commit, table, rows), position))
+                settle(block=True)
+            except BaseException:
+                # Batches that have not started are dropped; the checkpoint
+                # keeps whatever committed in order before the failure
+                for future, _ in pending:
+                    future.cancel()
+                while pending and not pending[0][0].cancelled() and pending[0][0].exception() is None:
+                    future, position = pending.popleft()
+                    record(future.result(), position)
+                raise
+        
+        progress['done'] = True
+        self.checkpoint.save()
+        stats['seconds'] = time.monotonic() - started
+        return stats
+    
+    def finish(self, rebuild_snapshot: bool = True) -> Dict[str, Any]:
+        """Recount counters from the migrated collections, bump the catalog, rebuild the snapshot"""
+        category_counts = counters.count_categories(data for _, data in self.store.torrents.stream(['category']))
+        counters.reset(self.db, counters.CATEGORY_COUNTS, category_counts)
+        totals = {
+            'games': counters.count_collection(self.db, 'torrents'),
+            'users': counters.count_collection(self.db, 'users'),
+            'comments': counters.count_collection(self.db, 'comments')
+        }
+        counters.reset(self.db, counters.TOTALS, totals)
+        catalog.bump(self.db)
+        if rebuild_snapshot:
+            snapshot.rebuild(self.db, self.store)
+        return totals
+    
+    def run(self, tables: Tuple[str, ...] = TABLES, rebuild_snapshot: bool = True) -> Dict[str, Any]:
+        started = time.monotonic()
+        for table in tables:
+            self.log(f'Migrating {table}...')
+            stats = self.migrate_table(table)
+            if stats['migrated']:
+                rate = stats['migrated'] / max(stats['seconds'], 1e-9)
+                self.log(f'  {table}: {stats["migrated"]} rows in {stats["seconds"]:.1f}s ({rate:.0f} rows/s)')
+        totals = self.finish(rebuild_snapshot)
+        elapsed = time.monotonic() - started
+        migrated = sum(stats['migrated'] for stats in self.stats.values())
+        self.log(f'Migrated {migrated} rows in {elapsed:.1f}s ({migrated / max(elapsed, 1e-9):.0f} rows/s)')
+        return {'tables': self.stats, 'totals': totals, 'seconds': elapsed}
+
+
+def open_source(dump: Optional[str] = None, csv_dir: Optional[str] = None, sqlite: Optional[str] = None):
+    if dump:
+        return PgDumpSource(dump)
+    if csv_dir:
+        return CsvSource(csv_dir)
+    if sqlite:
+        return SqliteSource(sqlite)
+    return RowsSource(SEED_ROWS, 'seed')
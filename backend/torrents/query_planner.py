@@ -0,0 +1,293 @@
+import json
+import os
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+# Catalog listing queries: multi-category, Steam Deck and range filters with
+# a choice of sort key.
+# plan() turns a parsed query into a Firestore query the declared composite
+# indexes can serve plus residual predicates: category (array_contains or
+# array_contains_any), steam_deck equality and ranges on the sort field are
+# pushed down, every other range is applied while streaming the ordered
+# results. A page stops once it has enough matches or has scanned
+# LISTING_MAX_SCAN documents; in the latter case the cursor points at the
+# last scanned document, so a sparse filter returns short pages instead of
+# reading the whole catalog in one request.
+# The same plan evaluates in memory over snapshot rows with identical
+# results, including Firestore's rule that documents missing the sort field
+# are not listed.
+# firestore.indexes.json at the repository root is generated from
+# composite_indexes(): python3 query_planner.py > ../../firestore.indexes.json
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+# sort= key -> Firestore field
+SORT_FIELDS = {
+    'downloads': 'downloads',
+    'steam_rating': 'steam_rating',
+    'metacritic_score': 'metacritic_score',
+    'size': 'size',
+    'newest': 'created_at'
+}
+DEFAULT_SORT = 'downloads'
+
+# min<Name>/max<Name> query parameters -> Firestore field
+RANGE_FIELDS = {
+    'Size': 'size',
+    'Metacritic': 'metacritic_score',
+    'SteamRating': 'steam_rating'
+}
+
+# Firestore limit for array_contains_any
+MAX_CATEGORIES = 30
+
+LISTING_MAX_SCAN = int(os.environ.get('LISTING_MAX_SCAN', '1000'))
+
+# Documents fetched per round-trip while residual predicates drop rows
+MIN_SCAN_PAGE = 100
+
+_TYPE_RANK = {type(None): 0, bool: 1, int: 2, float: 2, str: 3}
+
+Document = Tuple[str, Dict[str, Any]]
+Predicate = Tuple[str, str, Any]
+
+
+def _number(raw: str, name: str) -> float:
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+    if value != value or value in (float('inf'), float('-inf')):
+        raise ValueError(f'{name} must be a number')
+    return int(value) if value.is_integer() else value
+
+
+def parse(query_params: Dict[str, Any]) -> Dict[str, Any]:
+    """Listing query from request parameters; raises ValueError for invalid ones"""
+    raw_categories = query_params.get('categories') or query_params.get('category') or ''
+    categories = []
+    for slug in raw_categories.split(','):
+        slug = slug.strip()
+        if slug and slug not in categories:
+            categories.append(slug)
+    if len(categories) > MAX_CATEGORIES:
+        raise ValueError(f'At most {MAX_CATEGORIES} categories')
+    
+    steam_deck = None
+    raw_deck = query_params.get('steamDeck')
+    if raw_deck:
+        if raw_deck.lower() not in ('true', '1', 'false', '0'):
+            raise ValueError('steamDeck must be true or false')
+        steam_deck = raw_deck.lower() in ('true', '1')
+    
+    ranges: Dict[str, List[Optional[float]]] = {}
+    for suffix, field in RANGE_FIELDS.items():
+        low, high = query_params.get(f'min{suffix}'), query_params.get(f'max{suffix}')
+        bounds = [
+            _number(low, f'min{suffix}') if low else None,
+            _number(high, f'max{suffix}') if high else None
+        ]
+        if bounds[0] is not None and bounds[1] is not None and bounds[0] > bounds[1]:
+            raise ValueError(f'min{suffix} must not exceed max{suffix}')
+        if bounds != [None, None]:
+            ranges[field] = bounds
+    
+    sort = query_params.get('sort') or DEFAULT_SORT
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+    order = (query_params.get('order') or 'desc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    
+    return {
+        'categories': categories,
+        'steam_deck': steam_deck,
+        'ranges': ranges,
+        'sort': SORT_FIELDS[sort],
+        'direction': ASCENDING if order == 'asc' else DESCENDING
+    }
+
+
+def plan(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Split a listing query into indexed Firestore filters and residual predicates"""
+    filters: List[Predicate] = []
+    residual: List[Predicate] = []
+    
+    categories = query['categories']
+    if len(categories) == 1:
+        filters.append(('category', 'array_contains', categories[0]))
+    elif categories:
+        filters.append(('category', 'array_contains_any', categories))
+    
+    if query['steam_deck'] is not None:
+        filters.append(('steam_deck', '==', query['steam_deck']))
+    
+    # Firestore serves a range filter from the index only on the first
+    # ordered field; ranges on other fields become residual predicates
+    for field, (low, high) in sorted(query['ranges'].items()):
+        target = filters if field == query['sort'] else residual
+        if low is not None:
+            target.append((field, '>=', low))
+        if high is not None:
+            target.append((field, '<=', high))
+    
+    return {
+        'filters': filters,
+        'residual': residual,
+        'order': query['sort'],
+        'direction': query['direction']
+    }
+
+
+def describe(query_plan: Dict[str, Any]) -> str:
+    """One-line summary of a plan for debug logs"""
+    pushed = ', '.join(f'{field} {op} {value}' for field, op, value in query_plan['filters']) or '-'
+    residual = ', '.join(f'{field} {op} {value}' for field, op, value in query_plan['residual']) or '-'
+    return f"index: {pushed}; order: {query_plan['order']} {query_plan['direction']}; residual: {residual}"
+
+
+def fields(query_plan: Dict[str, Any]) -> List[str]:
+    """Firestore fields a projection must keep to evaluate the plan and build cursors"""
+    return sorted({query_plan['order']} | {field for field, _, _ in query_plan['residual']})
+
+
+def _sort_value(value: Any) -> Tuple[int, Any]:
+    """Firestore cross-type ordering: null < bool < number < string"""
+    rank = _TYPE_RANK.get(type(value), 4)
+    return (rank, str(value)) if rank == 4 else (rank, value)
+
+
+def _matches(data: Dict[str, Any], predicate: Predicate) -> bool:
+    field, op, value = predicate
+    actual = data.get(field)
+    if op == '==':
+        return field in data and actual == value
+    if op == 'array_contains':
+        return isinstance(actual, list) and value in actual
+    if op == 'array_contains_any':
+        return isinstance(actual, list) and any(item in actual for item in value)
+    # Range filters only match values of the same type, so null never does
+    if field not in data or _sort_value(actual)[0] != _sort_value(value)[0]:
+        return False
+    return actual >= value if op == '>=' else actual <= value
+
+
+def matches(data: Dict[str, Any], predicates: Iterable[Predicate]) -> bool:
+    return all(_matches(data, predicate) for predicate in predicates)
+
+
+def evaluate(torrents: Iterable[Document], query_plan: Dict[str, Any]) -> List[Document]:
+    """Run a plan over in-memory documents (snapshot rows), same results as run()"""
+    order = query_plan['order']
+    predicates = query_plan['filters'] + query_plan['residual']
+    rows = [(torrent_id, data) for torrent_id, data in torrents if order in data and matches(data, predicates)]
+    # Ties broken by document id in the direction of the sort, as Firestore does
+    rows.sort(key=lambda row: (_sort_value(row[1][order]), row[0]), reverse=query_plan['direction'] == DESCENDING)
+    return rows
+
+
+def cursor(query_plan: Dict[str, Any], document: Document) -> Dict[str, Any]:
+    """Cursor values of the last row of a page"""
+    torrent_id, data = document
+    return {query_plan['order']: data.get(query_plan['order']), 'id': torrent_id}
+
+
+def check_cursor(query_plan: Dict[str, Any], after: Optional[Dict[str, Any]]) -> None:
+    """Reject cursors issued for another sort key"""
+    if after is not None and query_plan['order'] not in after:
+        raise ValueError('Invalid cursor')
+
+
+def run(
+    store,
+    query_plan: Dict[str, Any],
+    limit: Optional[int] = None,
+    after: Optional[Dict[str, Any]] = None,
+    select: Optional[List[str]] = None,
+    max_scan: int = LISTING_MAX_SCAN
+) -> Tuple[List[Document], Optional[Dict[str, Any]]]:
+    """
+    Stream the indexed query, applying residual predicates.
+    Without limit returns every match. With limit returns up to limit
+    matches and the cursor of the next page (None on the last page).
+    """
+    def fetch(page_size: Optional[int], start: Optional[Dict[str, Any]]) -> List[Document]:
+        return store.torrents.query(
+            query_plan['filters'],
+            query_plan['order'],
+            query_plan['direction'],
+            fields=select,
+            limit=page_size,
+            after=start
+        )
+    
+    residual = query_plan['residual']
+    if limit is None:
+        return [document for document in fetch(None, None) if matches(document[1], residual)], None
+    
+    if not residual:
+        documents = fetch(limit + 1, after)
+        if len(documents) > limit:
+            return documents[:limit], cursor(query_plan, documents[limit - 1])
+        return documents, None
+    
+    found: List[Document] = []
+    scanned = 0
+    while True:
+        page_size = min(max(2 * (limit + 1), MIN_SCAN_PAGE), max(max_scan - scanned, 1))
+        documents = fetch(page_size, after)
+        for document in documents:
+            scanned += 1
+            after = cursor(query_plan, document)
+            if not matches(document[1], residual):
+                continue
+            found.append(document)
+            if len(found) > limit:
+                return found[:limit], cursor(query_plan, found[limit - 1])
+        if len(documents) < page_size:
+            return found, None
+        if scanned >= max_scan:
+            # Scan budget spent: a short page, resumed after the last scanned row
+            return found, after
+
+
+def composite_indexes() -> List[Dict[str, Any]]:
+    """Composite indexes plan() can require, in firestore.indexes.json format"""
+    indexes = []
+    for field in sorted(set(SORT_FIELDS.values())):
+        for direction in (DESCENDING, ASCENDING):
+            for equality in (['category'], ['steam_deck'], ['category', 'steam_deck']):
+                index_fields = []
+                for name in equality:
+                    if name == 'category':
+                        index_fields.append({'fieldPath': 'category', 'arrayConfig': 'CONTAINS'})
+                    else:
+                        index_fields.append({'fieldPath': name, 'order': ASCENDING})
+                index_fields.append({'fieldPath': field, 'order': direction})
+                indexes.append({'collectionGroup': 'torrents', 'queryScope': 'COLLECTION', 'fields': index_fields})
+    
+    # Search posting lists in downloads order (search_index.search)
+    for field in ('title_words', 'prefixes', 'words', 'trigrams'):
+        indexes.append({
+            'collectionGroup': 'search_index',
+            'queryScope': 'COLLECTION',
+            'fields': [
+                {'fieldPath': field, 'arrayConfig': 'CONTAINS'},
+                {'fieldPath': 'downloads', 'order': DESCENDING}
+            ]
+        })
+    
+    # Admin user listing filtered by role (UserRepository.page)
+    indexes.append({
+        'collectionGroup': 'users',
+        'queryScope': 'COLLECTION',
+        'fields': [
+            {'fieldPath': 'is_admin', 'order': ASCENDING},
+            {'fieldPath': 'created_at', 'order': DESCENDING}
+        ]
+    })
+    return indexes
+
+
+if __name__ == '__main__':
+    print(json.dumps({'indexes': composite_indexes(), 'fieldOverrides': []}, indent=2))
@@ -0,0 +1,315 @@
+import re
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+# Inverted search index kept in the `search_index` collection.
+# One document per torrent (same id) holding its normalized terms; Firestore's
+# array-contains index over these fields acts as the posting lists, so a
+# search reads only matching entries instead of the whole catalog.
+# A match is ranked by the first tier every query token satisfies: all are
+# title words (exact), title words or title word prefixes (prefix), words
+# of the title or description (description), or the title is trigram
+# similar (fuzzy). Each tier is read from one posting list that holds every
+# entry of the tier: the longest token must be in title_words, prefixes or
+# words respectively.
+# Posting lists are read in downloads order, tier by tier, and only as far
+# as a page needs: a page of exact matches never touches the fuzzy tier, and
+# the cursor resumes where the previous page stopped instead of ranking the
+# whole result set again. The fuzzy tier ranks the MAX_CANDIDATES most
+# downloaded trigram matches; when there are more, search reports the total
+# as incomplete.
+
+SEARCH_COLLECTION = 'search_index'
+
+TIER_EXACT = 4
+TIER_PREFIX = 3
+TIER_DESCRIPTION = 2
+TIER_FUZZY = 1
+
+# Posting list of each word tier
+TIER_FIELDS = {TIER_EXACT: 'title_words', TIER_PREFIX: 'prefixes', TIER_DESCRIPTION: 'words'}
+
+DESCENDING = 'DESCENDING'
+
+# Entry fields ranking reads; trigrams are only queried, never read back
+RANKING_FIELDS = ['downloads', 'words', 'prefixes', 'title_words']
+
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_SIMILARITY = 0.3
+# Fuzzy candidates ranked per request, the most downloaded first
+MAX_CANDIDATES = 300
+# Posting entries a word tier page may examine before returning short
+MAX_SCAN = 1000
+MIN_SCAN_PAGE = 50
+# Firestore limit for array_contains_any
+MAX_ANY_VALUES = 30
+
+_WORD_RE = re.compile(r'[0-9a-zа-я]+')
+
+
+def normalize(text: str) -> str:
+    """Case-fold Cyrillic and Latin text and unify ё with е"""
+    return (text or '').casefold().replace('ё', 'е')
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into normalized words, preserving order"""
+    return _WORD_RE.findall(normalize(text))
+
+
+def trigrams(word: str) -> Set[str]:
+    """Padded character trigrams of a single word"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_entry(torrent_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build search index document for a torrent"""
+    title_words = tokenize(torrent_data.get('title') or '')
+    words = set(title_words) | set(tokenize(torrent_data.get('description') or ''))
+    
+    prefixes = set()
+    grams = set()
+    for word in title_words:
+        grams |= trigrams(word)
+        for i in range(MIN_PREFIX_LENGTH, len(word) + 1):
+            prefixes.add(word[:i])
+    
+    return {
+        'title': torrent_data.get('title') or '',
+        'downloads': torrent_data.get('downloads', 0) or 0,
+        'title_words': sorted(set(title_words)),
+        'words': sorted(words),
+        'prefixes': sorted(prefixes),
+        'trigrams': sorted(grams)
+    }
+
+
+def index_torrent(db, torrent_id: str, torrent_data: Dict[str, Any], batch=None) -> None:
+    """Create or replace the search index entry of a torrent"""
+    ref = db.collection(SEARCH_COLLECTION).document(torrent_id)
+    entry = build_entry(torrent_data)
+    if batch is not None:
+        batch.set(ref, entry)
+    else:
+        ref.set(entry)
+
+
+def remove_torrent(db, torrent_id: str, batch=None) -> None:
+    """Drop the search index entry of a deleted torrent"""
+    ref = db.collection(SEARCH_COLLECTION).document(torrent_id)
+    if batch is not None:
+        batch.delete(ref)
+    else:
+        ref.delete()
+
+
+def rebuild(db, torrents: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    """Reindex (torrent_id, data) pairs, returns number of indexed documents"""
+    count = 0
+    batch = db.batch()
+    pending = 0
+    
+    for torrent_id, torrent_data in torrents:
+        index_torrent(db, torrent_id, torrent_data, batch)
+        count += 1
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    
+    if pending:
+        batch.commit()
+    
+    return count
+
+
+def _similarity(tokens: List[str], title_words: List[str]) -> float:
+    """Average over query tokens of the best trigram Jaccard score against a title word"""
+    if not tokens or not title_words:
+        return 0.0
+    
+    word_grams = [trigrams(word) for word in title_words]
+    total = 0.0
+    for token in tokens:
+        token_grams = trigrams(token)
+        total += max(len(token_grams & grams) / len(token_grams | grams) for grams in word_grams)
+    
+    return total / len(tokens)
+
+
+def _tier(tokens: List[str], entry: Dict[str, Any]) -> Tuple[int, float]:
+    title_words = set(entry.get('title_words', []))
+    prefixes = set(entry.get('prefixes', []))
+    
+    if all(token in title_words for token in tokens):
+        return TIER_EXACT, 1.0
+    
+    if all(token in title_words or token in prefixes for token in tokens):
+        return TIER_PREFIX, 1.0
+    
+    words = set(entry.get('words', []))
+    if all(token in words for token in tokens):
+        return TIER_DESCRIPTION, 1.0
+    
+    similarity = _similarity(tokens, entry.get('title_words', []))
+    if similarity >= MIN_FUZZY_SIMILARITY:
+        return TIER_FUZZY, similarity
+    
+    return 0, 0.0
+
+
+def _posting_query(db, tier: int, anchor: str, grams: List[str]):
+    """Posting list of a tier in downloads order (composite indexes in query_planner.composite_indexes)"""
+    index_ref = db.collection(SEARCH_COLLECTION)
+    if tier in TIER_FIELDS:
+        query = index_ref.where(TIER_FIELDS[tier], 'array_contains', anchor)
+    else:
+        query = index_ref.where('trigrams', 'array_contains_any', grams)
+    query = query.order_by('downloads', direction=DESCENDING).order_by('__name__', direction=DESCENDING)
+    return query.select(RANKING_FIELDS)
+
+
+def _is_count(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def check_cursor(cursor: Optional[Dict[str, Any]]) -> None:
+    """Reject cursors search() did not produce: every value it reads back is checked"""
+    if cursor is None:
+        return
+    valid = (
+        cursor.get('t') in (TIER_EXACT, TIER_PREFIX, TIER_DESCRIPTION, TIER_FUZZY)
+        and not isinstance(cursor.get('t'), bool)
+        and _is_count(cursor.get('n', 0))
+        and _is_count(cursor.get('o', 0))
+        and isinstance(cursor.get('id', ''), str)
+    )
+    if valid and cursor.get('id'):
+        downloads = cursor.get('d')
+        valid = isinstance(downloads, (int, float)) and not isinstance(downloads, bool)
+    if not valid:
+        raise ValueError('Invalid cursor')
+
+
+def _result(doc_id: str, entry: Dict[str, Any], tier: int, similarity: float) -> Dict[str, Any]:
+    return {'id': doc_id, 'tier': tier, 'similarity': similarity, 'downloads': entry.get('downloads', 0)}
+
+
+def _stream_tier(
+    query,
+    tokens: List[str],
+    tier: int,
+    want: int,
+    after: Optional[Dict[str, Any]],
+    max_scan: int
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], bool]:
+    """
+    Up to want entries of a word tier, read in downloads order.
+    Returns (results, cursor, exhausted): the cursor resumes after the last
+    entry examined when the scan budget ran out or more matches are left.
+    """
+    results: List[Dict[str, Any]] = []
+    scanned = 0
+    while True:
+        page_size = max(min(max(want + 1, MIN_SCAN_PAGE), max_scan - scanned), 1)
+        page = query
+        if after is not None:
+            page = page.start_after({'downloads': after['d'], '__name__': after['id']})
+        docs = list(page.limit(page_size).stream())
+        for doc in docs:
+            scanned += 1
+            entry = doc.to_dict()
+            if _tier(tokens, entry)[0] == tier:
+                if len(results) == want:
+                    # One more match exists: the next page starts after the last one served
+                    return results, after, False
+                results.append(_result(doc.id, entry, tier, 1.0))
+            after = {'t': tier, 'd': entry.get('downloads', 0), 'id': doc.id}
+        if len(docs) < page_size:
+            return results, None, True
+        if scanned >= max_scan:
+            return results, after, False
+
+
+def _fuzzy_tier(query, tokens: List[str], offset: int, want: int) -> Tuple[List[Dict[str, Any]], bool, bool]:
+    """
+    Page of the fuzzy tier: the MAX_CANDIDATES most downloaded trigram matches
+    ranked by similarity. Returns (results, more, truncated).
+    """
+    docs = list(query.limit(MAX_CANDIDATES).stream())
+    ranked = []
+    for doc in docs:
+        entry = doc.to_dict()
+        tier, similarity = _tier(tokens, entry)
+        if tier == TIER_FUZZY:
+            ranked.append(_result(doc.id, entry, tier, similarity))
+    ranked.sort(key=lambda r: (-r['similarity'], -r['downloads'], r['id']))
+    return ranked[offset:offset + want], offset + want < len(ranked), len(docs) == MAX_CANDIDATES
+
+
+def search(
+    db,
+    query: str,
+    limit: int,
+    cursor: Optional[Dict[str, Any]] = None,
+    max_scan: int = MAX_SCAN
+) -> Dict[str, Any]:
+    """
+    One page of torrents matching query: title words > title word prefixes >
+    title or description words > trigram fuzzy; downloads orders the word
+    tiers and similarity then downloads the fuzzy tier. A tier is only read
+    when the ones above it did not fill the page.
+    Returns {'results': [{'id', 'tier', 'similarity', 'downloads'}],
+    'cursor': next page or None, 'served': matches up to this page,
+    'complete': whether every match was examined (served is the total)}.
+    """
+    tokens = tokenize(query)
+    position = dict(cursor or {'t': TIER_EXACT})
+    served = int(position.get('n', 0))
+    if not tokens:
+        return {'results': [], 'cursor': None, 'served': 0, 'complete': True}
+    
+    query_grams = set()
+    for token in tokens:
+        query_grams |= trigrams(token)
+    grams = sorted(query_grams)[:MAX_ANY_VALUES]
+    
+    # The longest token is usually the most selective posting list
+    anchor = max(tokens, key=len)
+    # A one-letter anchor has no prefixes: the prefix tier would equal the exact one
+    tiers = [TIER_EXACT] + ([TIER_PREFIX] if len(anchor) >= MIN_PREFIX_LENGTH else []) + [TIER_DESCRIPTION, TIER_FUZZY]
+    tiers = [tier for tier in tiers if tier <= position['t']]
+    
+    results: List[Dict[str, Any]] = []
+    complete = True
+    next_cursor = None
+    for n, tier in enumerate(tiers):
+        want = limit - len(results)
+        resume = position if tier == position['t'] else {}
+        if want == 0:
+            next_cursor = {'t': tier}
+            break
+        tier_query = _posting_query(db, tier, anchor, grams)
+        
+        if tier == TIER_FUZZY:
+            offset = int(resume.get('o', 0))
+            rows, more, truncated = _fuzzy_tier(tier_query, tokens, offset, want)
+            results.extend(rows)
+            complete = not truncated
+            if more:
+                next_cursor = {'t': tier, 'o': offset + len(rows)}
+            break
+        
+        after = resume if resume.get('id') else None
+        rows, after, exhausted = _stream_tier(tier_query, tokens, tier, want, after, max_scan)
+        results.extend(rows)
+        if not exhausted:
+            next_cursor = after if after is not None else {'t': tier}
+            break
+    
+    served += len(results)
+    if next_cursor is not None:
+        next_cursor = dict(next_cursor, n=served)
+        complete = False
+    return {'results': results, 'cursor': next_cursor, 'served': served, 'complete': complete}
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+import tracing
+
+# Pre-serialized torrent fragments for listing responses.
+# Each torrent's API JSON is encoded once and kept in an in-process LRU
+# keyed by (document id, updated_at, projected fields); listings and top
+# lists are assembled by joining the cached bytes instead of building a
+# dict per document and encoding the whole list again. updated_at is
+# stamped by TorrentRepository on every create and update, so a changed
+# torrent never hits an old fragment; documents without it (written before
+# the stamp existed) are encoded on every request.
+# Encoding uses orjson when it is installed and the stdlib json module
+# otherwise (JSON_ENCODER=json forces the fallback); both emit compact UTF-8
+# JSON, so responses are identical either way.
+# backend/benchmark_serialization.py compares the paths.
+
+FRAGMENT_CACHE_BYTES = int(os.environ.get('FRAGMENT_CACHE_BYTES', str(16 * 1024 * 1024)))
+
+Serializer = Callable[[str, Dict[str, Any], Optional[List[str]]], Dict[str, Any]]
+
+_orjson = None
+if os.environ.get('JSON_ENCODER', 'orjson') == 'orjson':
+    try:
+        import orjson as _orjson
+    except ImportError:
+        _orjson = None
+
+ENCODER = 'orjson' if _orjson is not None else 'json'
+
+_cache: 'OrderedDict[Tuple[str, str, Optional[Tuple[str, ...]]], bytes]' = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def encode(value: Any) -> bytes:
+    """Compact UTF-8 JSON with the fastest available encoder"""
+    if _orjson is not None:
+        return _orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _key(doc_id: str, data: Dict[str, Any], fields: Optional[Tuple[str, ...]]):
+    stamp = data.get('updated_at')
+    return (doc_id, stamp, fields) if stamp else None
+
+
+def _remember(entries: List[Tuple[Any, bytes]]) -> None:
+    global _cache_bytes
+    with _cache_lock:
+        for key, encoded in entries:
+            if key in _cache:
+                continue
+            _cache[key] = encoded
+            _cache_bytes += len(encoded)
+        while _cache_bytes > FRAGMENT_CACHE_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def array(rows: Iterable[Tuple[str, Dict[str, Any]]], fields: Optional[List[str]], serialize: Serializer) -> bytes:
+    """JSON array of torrent fragments, cached ones reused while their updated_at is unchanged"""
+    with tracing.span('serialize'):
+        projection = tuple(fields) if fields is not None else None
+        rows = list(rows)
+        keys = [_key(doc_id, data, projection) for doc_id, data in rows]
+        
+        # One lock round-trip for the lookups and one for the new entries
+        with _cache_lock:
+            parts = [_cache.get(key) if key is not None else None for key in keys]
+            for key, part in zip(keys, parts):
+                if part is not None:
+                    _cache.move_to_end(key)
+        
+        fresh = []
+        for position, part in enumerate(parts):
+            if part is None:
+                doc_id, data = rows[position]
+                parts[position] = encode(serialize(doc_id, data, fields))
+                if keys[position] is not None:
+                    fresh.append((keys[position], parts[position]))
+        if fresh:
+            _remember(fresh)
+        
+        return b'[' + b','.join(parts) + b']'
+
+
+def encode_object(members: Dict[str, Any]) -> bytes:
+    """JSON object whose members are plain values or bytes already encoded as JSON"""
+    with tracing.span('serialize'):
+        parts = []
+        for name, value in members.items():
+            encoded = value if isinstance(value, bytes) else encode(value)
+            parts.append(encode(name) + b':' + encoded)
+        return b'{' + b','.join(parts) + b'}'
+
+
+def body(members: Dict[str, Any]) -> str:
+    """Response body from encode_object()"""
+    return encode_object(members).decode('utf-8')
+
+
+def clear() -> None:
+    """Drop every cached fragment"""
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
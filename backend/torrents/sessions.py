@@ -0,0 +1,155 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+from storage import field_values
+
+# Stateless session tokens: base64url(claims).base64url(HMAC-SHA256(claims)).
+# Claims carry the user id, the admin flag, issue/expiry times and a token
+# id, so authorizing a request is a signature check in-process instead of a
+# user document read. Revocations (logout, user deletion, admin flag
+# changes) live in a single meta/revocations document of flat fields,
+# t_<token id> -> expiry and u_<user id> -> revoked-before time, read at
+# most once per REVOCATION_CACHE_TTL seconds per warm instance; entries are
+# pruned once every token they could match has expired anyway.
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+SESSION_TTL = int(os.environ.get('SESSION_TTL', str(7 * 24 * 3600)))
+REVOCATION_CACHE_TTL = float(os.environ.get('REVOCATION_CACHE_TTL', '30'))
+
+META_COLLECTION = 'meta'
+REVOCATIONS_DOC = 'revocations'
+
+_revocations: Optional[Dict[str, float]] = None
+_revocations_expire = 0.0
+_revocations_lock = threading.Lock()
+
+
+class SessionSecretMissing(Exception):
+    """SESSION_SECRET secret is missing"""
+
+
+def _secret() -> bytes:
+    if not SESSION_SECRET:
+        raise SessionSecretMissing('SESSION_SECRET is not set')
+    return SESSION_SECRET.encode('utf-8')
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret(), payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue(user_id: str, is_admin: bool, now: Optional[float] = None) -> str:
+    now = time.time() if now is None else now
+    claims = {
+        'uid': user_id,
+        'adm': bool(is_admin),
+        'iat': round(now, 3),
+        'exp': int(now + SESSION_TTL),
+        'jti': uuid.uuid4().hex
+    }
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f'{payload}.{_sign(payload)}'
+
+
+def bearer(authorization: Optional[str]) -> Optional[str]:
+    """Token of an 'Authorization: Bearer <token>' header"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.strip().partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return token.strip() or None
+
+
+def _ref(db):
+    return db.collection(META_COLLECTION).document(REVOCATIONS_DOC)
+
+
+def revocations(db) -> Dict[str, float]:
+    """Revocation entries, cached in-process for REVOCATION_CACHE_TTL seconds"""
+    global _revocations, _revocations_expire
+    now = time.monotonic()
+    with _revocations_lock:
+        if _revocations is not None and now < _revocations_expire:
+            return _revocations
+    
+    doc = _ref(db).get()
+    entries = (doc.to_dict() or {}) if doc.exists else {}
+    with _revocations_lock:
+        _revocations = entries
+        _revocations_expire = now + REVOCATION_CACHE_TTL
+    return entries
+
+
+def verify(db, token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Claims of a valid, unexpired, unrevoked token, otherwise None"""
+    if not token or token.count('.') != 1:
+        return None
+    payload, signature = token.split('.')
+    try:
+        if not hmac.compare_digest(signature.encode('ascii'), _sign(payload).encode('ascii')):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        # Not ASCII, not base64 or not JSON: never issued by us
+        return None
+    if not isinstance(claims, dict) or claims.get('exp', 0) <= time.time():
+        return None
+    
+    revoked = revocations(db)
+    if f"t_{claims.get('jti')}" in revoked:
+        return None
+    if revoked.get(f"u_{claims.get('uid')}", -1) >= claims.get('iat', 0):
+        return None
+    return claims
+
+
+def _revoke(db, entries: Dict[str, float], batch=None) -> None:
+    global _revocations
+    
+    now = time.time()
+    data: Dict[str, Any] = dict(entries)
+    # Drop entries no live token can match: token entries past their expiry,
+    # user entries older than the longest a token lives
+    with _revocations_lock:
+        cached = dict(_revocations or {})
+    for key, value in cached.items():
+        expires = value if key.startswith('t_') else value + SESSION_TTL
+        if expires <= now and key not in data:
+            data[key] = field_values(db).DELETE_FIELD
+    
+    if batch is not None:
+        batch.set(_ref(db), data, merge=True)
+    else:
+        _ref(db).set(data, merge=True)
+    
+    with _revocations_lock:
+        # Effective at once on this instance, other instances within the cache TTL
+        if _revocations is not None:
+            _revocations = {key: value for key, value in _revocations.items() if key not in data}
+            _revocations.update(entries)
+
+
+def revoke_token(db, claims: Dict[str, Any]) -> None:
+    """Logout: revoke a single token"""
+    _revoke(db, {f"t_{claims['jti']}": claims['exp']})
+
+
+def revoke_user(db, user_id: str, batch=None) -> None:
+    """Revoke every token issued to a user so far (deletion, admin flag change)"""
+    _revoke(db, {f'u_{user_id}': round(time.time(), 3)}, batch)
@@ -0,0 +1,240 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import catalog
+import counters
+
+# Materialized catalog: catalog_snapshot/meta plus catalog_snapshot/c_{hash} chunks.
+# meta holds the catalog version the snapshot was built from, categories
+# with their torrent counts, top lists and the ids of the chunks; chunks hold
+# every torrent ordered by downloads DESC as a JSON string (one unindexed
+# value instead of thousands of nested fields), sized to stay well under
+# Firestore's 1 MiB document limit.
+# Chunks are filled to at least half of MAX_CHUNK_BYTES and then end after
+# a row whose id hashes to a boundary, and chunk ids are hashes of their
+# payload: the chunk count grows with catalog bytes, and a write that
+# changes a few torrents leaves most chunks byte-identical, so a patch
+# rewrites only the chunks the changed rows left or entered, plus meta.
+# Readers use the snapshot only when its version equals the current catalog
+# version, so a failed or raced rebuild falls back to live queries instead
+# of serving stale data.
+# Write paths read the version before writing and call refresh() with it,
+# the torrents they touched and the number of batches they committed: when
+# the current version is exactly base + commits (no other writer got in
+# between) and the snapshot at base exists, it is patched from its own
+# chunks plus those documents; otherwise the catalog is streamed again.
+
+SNAPSHOT_COLLECTION = 'catalog_snapshot'
+META_DOC = 'meta'
+
+MAX_CHUNK_BYTES = 900_000
+
+# About one row in CHUNK_BOUNDARY_ROWS may end a chunk that is half full
+CHUNK_BOUNDARY_ROWS = 32
+
+# Chunks per commit, keeps a single commit under Firestore's request size limit
+CHUNKS_PER_BATCH = 8
+
+MAX_BATCH_WRITES = 500
+
+TOP_SIZE = 8
+
+# Firestore field names of the card projection kept in top lists;
+# updated_at keys their cached fragments
+CARD_FIELDS = ['title', 'poster', 'downloads', 'size', 'category', 'updated_at']
+
+Document = Tuple[str, Dict[str, Any]]
+
+
+def _collection(db):
+    return db.collection(SNAPSHOT_COLLECTION)
+
+
+def _ends_chunk(row_id: str) -> bool:
+    digest = hashlib.sha1(row_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % CHUNK_BOUNDARY_ROWS == 0
+
+
+def chunk_id(payload: str) -> str:
+    return 'c_' + hashlib.sha1(payload.encode('utf-8')).hexdigest()[:24]
+
+
+def chunk(rows: List[Dict[str, Any]], max_bytes: int = MAX_CHUNK_BYTES) -> List[str]:
+    """
+    Split rows (each with an 'id') into JSON array strings of at most
+    max_bytes UTF-8 bytes each, ending chunks at content-defined boundaries
+    once they hold half of max_bytes.
+    """
+    min_bytes = max_bytes // 2
+    chunks = []
+    current: List[str] = []
+    size = 2
+    for row in rows:
+        encoded = json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+        row_size = len(encoded.encode('utf-8')) + 1
+        if current and size + row_size > max_bytes:
+            chunks.append('[' + ','.join(current) + ']')
+            current = []
+            size = 2
+        current.append(encoded)
+        size += row_size
+        if size >= min_bytes and _ends_chunk(row['id']):
+            chunks.append('[' + ','.join(current) + ']')
+            current = []
+            size = 2
+    if current or not chunks:
+        chunks.append('[' + ','.join(current) + ']')
+    return chunks
+
+
+def top_lists(torrents: List[Document], slugs: List[str]) -> Dict[str, Any]:
+    """Most downloaded torrents overall and per category, as card rows"""
+    def card(torrent_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return dict({field: data.get(field) for field in CARD_FIELDS}, id=torrent_id)
+    
+    by_category: Dict[str, List[Dict[str, Any]]] = {slug: [] for slug in slugs}
+    for torrent_id, data in torrents:
+        for slug in data.get('category') or []:
+            if slug in by_category and len(by_category[slug]) < TOP_SIZE:
+                by_category[slug].append(card(torrent_id, data))
+    
+    return {
+        'popular': [card(torrent_id, data) for torrent_id, data in torrents[:TOP_SIZE]],
+        'categories': by_category
+    }
+
+
+def _order_key(torrent: Document) -> Tuple[Any, str]:
+    """Same order as the live listing: downloads DESC, then document id DESC"""
+    torrent_id, data = torrent
+    return data.get('downloads') or 0, torrent_id
+
+
+def rebuild(db, store) -> Dict[str, Any]:
+    """Materialize the current catalog from a full stream, returns the new meta document"""
+    # Read the version first: a write committed while streaming advances it,
+    # leaving this snapshot marked stale rather than silently incomplete
+    version = catalog.read_version(db)
+    return _write(db, version, store.torrents.list(), store.categories.list())
+
+
+def refresh(
+    db,
+    store,
+    base_version: Optional[int],
+    changed_ids: Iterable[str] = (),
+    commits: int = 1
+) -> Dict[str, Any]:
+    """
+    Materialize the catalog after a write that started at base_version,
+    committed `commits` version bumps and touched changed_ids (created,
+    updated or deleted torrents; empty for category-only writes).
+    """
+    version = catalog.read_version(db)
+    previous = None
+    if base_version is not None and version == base_version + commits:
+        previous = load_meta(db, base_version)
+    torrents = load_torrents(db, previous) if previous is not None else None
+    if torrents is None:
+        return _write(db, version, store.torrents.list(), store.categories.list())
+    
+    changed_ids = set(changed_ids)
+    if changed_ids:
+        changed = store.torrents.get_many(list(changed_ids))
+        torrents = [torrent for torrent in torrents if torrent[0] not in changed_ids] + list(changed.items())
+        torrents.sort(key=_order_key, reverse=True)
+    # Every chunk of the previous snapshot was just read, so unchanged ones are not rewritten
+    return _write(db, version, torrents, store.categories.list(), set(previous['chunks']))
+
+
+def _write(
+    db,
+    version: int,
+    torrents: List[Document],
+    categories: List[Document],
+    existing_chunks: Iterable[str] = ()
+) -> Dict[str, Any]:
+    """Write the chunks not in existing_chunks, then meta; returns meta"""
+    category_counts = counters.count_categories(data for _, data in torrents)
+    # revision is a commit timestamp, only the change feed reads it
+    rows = [dict({k: v for k, v in data.items() if k != 'revision'}, id=torrent_id) for torrent_id, data in torrents]
+    chunks = chunk(rows)
+    chunk_ids = [chunk_id(payload) for payload in chunks]
+    existing_chunks = set(existing_chunks)
+    written = [(cid, payload) for cid, payload in zip(chunk_ids, chunks) if cid not in existing_chunks]
+    
+    for start in range(0, len(written), CHUNKS_PER_BATCH):
+        batch = db.batch()
+        for cid, payload in written[start:start + CHUNKS_PER_BATCH]:
+            batch.set(_collection(db).document(cid), {'payload': payload})
+        batch.commit()
+    
+    previous = _collection(db).document(META_DOC).get().to_dict() or {}
+    if previous.get('version', -1) > version:
+        # A concurrent rebuild already materialized a newer catalog; keep the chunks it shares
+        _delete_chunks(db, [cid for cid, _ in written if cid not in previous.get('chunks', [])])
+        return previous
+    stale_chunks = [cid for cid in previous.get('chunks', []) if cid not in chunk_ids]
+    
+    meta = {
+        'version': version,
+        'chunks': chunk_ids,
+        'total': len(rows),
+        'categories': [dict(data, id=category_id, count=category_counts.get(data.get('slug'), 0)) for category_id, data in categories],
+        'top': top_lists(torrents, [data.get('slug') for _, data in categories]),
+        'built_at': datetime.utcnow().isoformat()
+    }
+    
+    _collection(db).document(META_DOC).set(meta)
+    _delete_chunks(db, stale_chunks)
+    
+    return meta
+
+
+def _delete_chunks(db, chunk_ids: List[str]) -> None:
+    for start in range(0, len(chunk_ids), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for cid in chunk_ids[start:start + MAX_BATCH_WRITES]:
+            batch.delete(_collection(db).document(cid))
+        batch.commit()
+
+
+def try_refresh(
+    db,
+    store,
+    base_version: Optional[int],
+    changed_ids: Iterable[str] = (),
+    commits: int = 1
+) -> Optional[Dict[str, Any]]:
+    """refresh() for write paths: a failure only costs readers the live-query fallback"""
+    try:
+        return refresh(db, store, base_version, changed_ids, commits)
+    except Exception as e:
+        print(f"SNAPSHOT: rebuild failed: {str(e)}")
+        return None
+
+
+def load_meta(db, version: int) -> Optional[Dict[str, Any]]:
+    """Snapshot meta if it was built from this catalog version"""
+    doc = _collection(db).document(META_DOC).get()
+    if not doc.exists:
+        return None
+    meta = doc.to_dict()
+    return meta if meta.get('version') == version else None
+
+
+def load_torrents(db, meta: Dict[str, Any]) -> Optional[List[Document]]:
+    """All torrents of the snapshot in downloads order, None if a chunk is missing"""
+    refs = [_collection(db).document(chunk_id) for chunk_id in meta['chunks']]
+    payloads = {doc.id: doc.to_dict()['payload'] for doc in db.get_all(refs) if doc.exists}
+    if len(payloads) != len(refs):
+        return None
+    
+    torrents = []
+    for chunk_id in meta['chunks']:
+        for row in json.loads(payloads[chunk_id]):
+            torrent_id = row.pop('id')
+            torrents.append((torrent_id, row))
+    return torrents
@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+# Two-tier cache for Steam appdetails keyed by (app_id, language):
+# an in-process LRU in front of a persistent store (Firestore `steam_cache`
+# collection in production, a JSON file for offline runs).
+#
+# Entry lifecycle, measured from fetched_at:
+#   age < ttl                 -> fresh, served as is
+#   ttl <= age < ttl + stale  -> stale, served while one background refresh runs
+#   older                     -> expired, fetched synchronously
+# Apps Steam reports as success: false are cached for negative_ttl.
+
+STEAM_CACHE_COLLECTION = 'steam_cache'
+
+
+class SteamAppUnavailable(ValueError):
+    """Steam answered success: false for the app"""
+
+
+class FirestoreStore:
+    """Persistent tier backed by a Firestore collection, client resolved on first use"""
+    
+    def __init__(self, get_db: Callable[[], Any], collection: str = STEAM_CACHE_COLLECTION):
+        self.get_db = get_db
+        self.collection_name = collection
+    
+    def _collection(self):
+        return self.get_db().collection(self.collection_name)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        doc = self._collection().document(key).get()
+        return doc.to_dict() if doc.exists else None
+    
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        self._collection().document(key).set(entry)
+
+
+class FileStore:
+    """Persistent tier backed by a local JSON file, for tests and offline runs"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+    
+    def _load(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load().get(key)
+    
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            entries = self._load()
+            entries[key] = entry
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+class SteamCache:
+    """Cache in front of an upstream fetch(app_id, lang) -> game dict"""
+    
+    def __init__(
+        self,
+        fetch: Callable[[str, str], Dict[str, Any]],
+        store=None,
+        ttl: float = 6 * 3600,
+        stale_ttl: float = 24 * 3600,
+        negative_ttl: float = 3600,
+        max_entries: int = 256,
+        clock: Callable[[], float] = time.time
+    ):
+        self.fetch = fetch
+        self.store = store
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.stats = {
+            'memory_hits': 0,
+            'store_hits': 0,
+            'stale_hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'errors': 0
+        }
+        self._lru: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+    
+    @staticmethod
+    def key(app_id: str, lang: str) -> str:
+        return f'{app_id}_{lang}'
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+    
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+    
+    def _state(self, entry: Dict[str, Any]) -> str:
+        age = self.clock() - entry.get('fetched_at', 0)
+        if not entry.get('ok'):
+            return 'fresh' if age < self.negative_ttl else 'expired'
+        if age < self.ttl:
+            return 'fresh'
+        if age < self.ttl + self.stale_ttl:
+            return 'stale'
+        return 'expired'
+    
+    def _load(self, app_id: str, lang: str, fetch=None) -> Dict[str, Any]:
+        """Fetch from upstream and write through both tiers"""
+        key = self.key(app_id, lang)
+        fetch = fetch or self.fetch
+        try:
+            entry = {'ok': True, 'data': fetch(app_id, lang), 'fetched_at': self.clock()}
+        except SteamAppUnavailable as e:
+            entry = {'ok': False, 'error': str(e), 'fetched_at': self.clock()}
+        
+        self._remember(key, entry)
+        if self.store is not None:
+            try:
+                self.store.set(key, entry)
+            except Exception as e:
+                self._count('errors')
+                print(f"STEAM CACHE: store write failed for {key}: {str(e)}")
+        return entry
+    
+    def _refresh_async(self, app_id: str, lang: str) -> None:
+        key = self.key(app_id, lang)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        
+        def run():
+            try:
+                self._load(app_id, lang)
+                self._count('refreshes')
+            except Exception as e:
+                self._count('errors')
+                print(f"STEAM CACHE: background refresh failed for {key}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+        if entry is not None and self._state(entry) != 'expired':
+            self._count('memory_hits')
+            return entry
+        
+        if self.store is None:
+            return None
+        
+        try:
+            entry = self.store.get(key)
+        except Exception as e:
+            self._count('errors')
+            print(f"STEAM CACHE: store read failed for {key}: {str(e)}")
+            return None
+        
+        if entry is not None and self._state(entry) != 'expired':
+            self._count('store_hits')
+            self._remember(key, entry)
+            return entry
+        return None
+    
+    def get(self, app_id: str, lang: str = 'russian', fetch=None) -> Tuple[Dict[str, Any], str]:
+        """
+        Returns (game data, cache status) where status is HIT, STALE or MISS.
+        Raises SteamAppUnavailable for apps Steam reports as unavailable.
+        fetch overrides the upstream for a synchronous miss, e.g. a rate-limited one.
+        """
+        key = self.key(app_id, lang)
+        entry = self._lookup(key)
+        
+        if entry is None:
+            self._count('misses')
+            status = 'MISS'
+            entry = self._load(app_id, lang, fetch)
+        elif self._state(entry) == 'stale':
+            self._count('stale_hits')
+            status = 'STALE'
+            self._refresh_async(app_id, lang)
+        else:
+            status = 'HIT'
+        
+        if not entry.get('ok'):
+            if status != 'MISS':
+                self._count('negative_hits')
+            raise SteamAppUnavailable(entry.get('error') or 'Game not found or data unavailable')
+        
+        return entry['data'], status
@@ -0,0 +1,304 @@
+import gzip
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+# Client for the Steam store API (appdetails).
+# Requests reuse keep-alive connections from a small per-instance pool
+# instead of opening a TCP/TLS connection per lookup. Concurrent lookups of
+# the same (app_id, lang) are coalesced into one upstream request whose
+# result every caller shares. Transient failures (429, 5xx, timeouts,
+# connection errors) are retried with full-jitter backoff, honouring
+# Retry-After, as long as the lookup stays within STEAM_DEADLINE.
+# A circuit breaker opens after STEAM_BREAKER_THRESHOLD consecutive transient
+# failures: lookups then fail at once with SteamUnavailable for
+# STEAM_BREAKER_COOLDOWN seconds, after which a single probe request decides
+# whether it closes again.
+# Point STEAM_API_URL at a local stub server to run it offline; see
+# backend/benchmark_steam_client.py.
+
+STEAM_TIMEOUT = float(os.environ.get('STEAM_TIMEOUT', '4'))
+STEAM_DEADLINE = float(os.environ.get('STEAM_DEADLINE', '8'))
+STEAM_RETRIES = int(os.environ.get('STEAM_RETRIES', '2'))
+STEAM_POOL_SIZE = int(os.environ.get('STEAM_POOL_SIZE', '4'))
+STEAM_BREAKER_THRESHOLD = int(os.environ.get('STEAM_BREAKER_THRESHOLD', '5'))
+STEAM_BREAKER_COOLDOWN = float(os.environ.get('STEAM_BREAKER_COOLDOWN', '30'))
+
+USER_AGENT = 'Mozilla/5.0'
+
+
+class SteamUnavailable(Exception):
+    """Steam is not being called: the circuit is open or the lookup ran out of time"""
+    
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error: Exception) -> bool:
+    """429 and 5xx responses, connection errors, timeouts and broken responses are worth retrying"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+def retry_delay(error: Exception, attempt: int, base_delay: float, max_delay: float) -> float:
+    """Retry-After when the upstream sends it, otherwise full-jitter exponential backoff"""
+    if isinstance(error, urllib.error.HTTPError) and error.headers is not None:
+        retry_after = error.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), max_delay)
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed or open"""
+    
+    def __init__(self, threshold: int, cooldown: float, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+    
+    def acquire(self) -> None:
+        """Raise SteamUnavailable unless a request may go upstream now"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._probing:
+                self._probing = True
+                return
+            retry_after = max(self.cooldown - (self.clock() - self.opened_at), 1)
+        raise SteamUnavailable('Steam API is unavailable, try again later', retry_after)
+    
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+    
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self._probing = False
+
+
+class ConnectionPool:
+    """Keep-alive connections to one HTTP(S) host; idle ones are reused most recent first"""
+    
+    def __init__(self, base_url: str, size: int, timeout: float):
+        parts = urllib.parse.urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.size = size
+        self.timeout = timeout
+        self.created = 0
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """A connection and whether it was reused"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+            self.created += 1
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout), False
+    
+    def release(self, connection: http.client.HTTPConnection, reusable: bool) -> None:
+        if reusable:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(connection)
+                    return
+        connection.close()
+    
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class _Flight:
+    """One upstream lookup shared by every caller that asked for the same key meanwhile"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+    
+    def wait(self, timeout: float) -> Any:
+        if not self.done.wait(timeout):
+            raise SteamUnavailable('Steam API request timed out')
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SteamClient:
+    """appdetails lookups with pooling, coalescing, retries and a circuit breaker"""
+    
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = STEAM_POOL_SIZE,
+        timeout: float = STEAM_TIMEOUT,
+        deadline: float = STEAM_DEADLINE,
+        retries: int = STEAM_RETRIES,
+        base_delay: float = 0.25,
+        max_delay: float = 2.0,
+        breaker: Optional[CircuitBreaker] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.pool = ConnectionPool(base_url, pool_size, timeout)
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker(STEAM_BREAKER_THRESHOLD, STEAM_BREAKER_COOLDOWN, clock)
+        self.clock = clock
+        self.sleep = sleep
+        self.counts = {
+            'requests': 0,
+            'reused': 0,
+            'coalesced': 0,
+            'retries': 0,
+            'failures': 0,
+            'rejected': 0
+        }
+        self._flights: Dict[Tuple[str, str], _Flight] = {}
+        self._lock = threading.Lock()
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        return dict(counts, connections=self.pool.created, circuit=self.breaker.state)
+    
+    def appdetails(self, app_id: str, lang: str) -> Dict[str, Any]:
+        """Decoded appdetails response; concurrent calls for the same app share one request"""
+        key = (app_id, lang)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.counts['coalesced'] += 1
+        
+        if not leader:
+            return flight.wait(self.deadline)
+        
+        try:
+            flight.result = self._fetch(app_id, lang)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+    
+    def _fetch(self, app_id: str, lang: str) -> Dict[str, Any]:
+        query = urllib.parse.urlencode({'appids': app_id, 'l': lang})
+        path = f'{self.pool.prefix}/appdetails?{query}'
+        started = self.clock()
+        attempt = 0
+        while True:
+            try:
+                self.breaker.acquire()
+            except SteamUnavailable:
+                self._count('rejected')
+                raise
+            
+            try:
+                payload = self._request(path, self.deadline - (self.clock() - started))
+            except Exception as e:
+                if not is_retryable(e):
+                    # Steam answered (e.g. 404): the upstream itself is healthy
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                self._count('failures')
+                delay = retry_delay(e, attempt, self.base_delay, self.max_delay)
+                if attempt >= self.retries or self.clock() - started + delay >= self.deadline:
+                    raise
+                self._count('retries')
+                self.sleep(delay)
+                attempt += 1
+                continue
+            
+            self.breaker.success()
+            return payload
+    
+    def _request(self, path: str, remaining: float) -> Dict[str, Any]:
+        headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'}
+        timeout = max(min(self.timeout, remaining), 0.1)
+        
+        for retry_stale in (True, False):
+            connection, reused = self.pool.acquire()
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused and retry_stale:
+                    # The server closed the idle keep-alive connection; not a failure
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            
+            self.pool.release(connection, not response.will_close)
+            self._count('requests')
+            if reused:
+                self._count('reused')
+            break
+        
+        if response.status != 200:
+            url = f"{'https' if self.pool.https else 'http'}://{self.pool.host}{path}"
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return json.loads(body.decode('utf-8'))
+    
+    def close(self) -> None:
+        self.pool.close()
@@ -0,0 +1,282 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Dict, Any, Callable, List, Optional
+
+import catalog
+import counters
+import search_index
+from steam_cache import SteamAppUnavailable
+from steam_client import is_retryable, retry_delay
+
+# Bulk import of Steam apps as torrent documents.
+# Items are fetched by a bounded worker pool behind a shared token bucket,
+# transient upstream failures (429/5xx/timeouts) are retried with jittered
+# exponential backoff, and results are committed in batched writes. Progress
+# is kept in import_jobs/{job_id} so a run cut short by the function timeout
+# can be resumed by posting the same jobId again, with the same items or none.
+
+IMPORT_JOBS_COLLECTION = 'import_jobs'
+
+# Torrent doc + search entry + a share of counter writes stay well under 500 ops
+ITEMS_PER_BATCH = 100
+
+
+class ImportRejected(ValueError):
+    """The request cannot start or resume the job it names"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens per second, bursts up to capacity"""
+    
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def rate_limited(
+    fetch: Callable[[str, str], Dict[str, Any]],
+    bucket: TokenBucket,
+    retries: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 8.0
+) -> Callable[[str, str], Dict[str, Any]]:
+    """Wrap an upstream fetch with the token bucket and retry/backoff"""
+    
+    def limited_fetch(app_id: str, lang: str) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                return fetch(app_id, lang)
+            except SteamAppUnavailable:
+                raise
+            except Exception as e:
+                if attempt >= retries or not is_retryable(e):
+                    raise
+                time.sleep(retry_delay(e, attempt, base_delay, max_delay))
+                attempt += 1
+    
+    return limited_fetch
+
+
+def parse_item(item: Any) -> Dict[str, Any]:
+    """Normalize a request item (URL, app id or object with url/appId) to a dict"""
+    if isinstance(item, dict):
+        source = str(item.get('url') or item.get('appId') or '')
+        options = item
+    else:
+        source = str(item)
+        options = {}
+    return {'source': source, 'options': options}
+
+
+def torrent_id_for(app_id: str) -> str:
+    """Deterministic torrent id so re-importing an app never duplicates it"""
+    return f'steam_{app_id}'
+
+
+def build_torrent(game_data: Dict[str, Any], options: Dict[str, Any], default_categories: List[str]) -> Dict[str, Any]:
+    """Torrent document for an imported Steam app"""
+    return {
+        'title': game_data.get('name', ''),
+        'poster': options.get('poster') or game_data.get('headerImage', ''),
+        'downloads': 0,
+        'size': float(options.get('size', 0) or 0),
+        'category': options.get('categories', default_categories),
+        'description': game_data.get('description', ''),
+        'steam_deck': bool(options.get('steamDeck', False)),
+        'steam_rating': game_data.get('steamRating'),
+        'metacritic_score': game_data.get('metacriticScore'),
+        'steam_app_id': game_data.get('appId'),
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+
+class SteamImport:
+    """One resumable bulk import run"""
+    
+    def __init__(
+        self,
+        store,
+        fetch: Callable[[str, str], Dict[str, Any]],
+        extract_app_id: Callable[[str], Optional[str]],
+        job_id: str,
+        workers: int = 8,
+        time_budget: float = 20.0,
+        lang: str = 'russian'
+    ):
+        self.store = store
+        self.db = store.db
+        self.fetch = fetch
+        self.extract_app_id = extract_app_id
+        self.job_ref = self.db.collection(IMPORT_JOBS_COLLECTION).document(job_id)
+        self.job_id = job_id
+        self.workers = workers
+        self.time_budget = time_budget
+        self.lang = lang
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.imported_ids: List[str] = []
+        self.commits = 0
+        self._pending: List[Dict[str, Any]] = []
+    
+    def _load_job(self, items: List[Any], default_categories: List[str]) -> Dict[str, Any]:
+        """
+        The stored job, or a new one for items. Resuming takes items and
+        categories from the job: a request that sends different ones is
+        rejected rather than silently ignored.
+        """
+        job_doc = self.job_ref.get()
+        if job_doc.exists:
+            job = job_doc.to_dict()
+            if items and items != job['items']:
+                raise ImportRejected(f'Job {self.job_id} was started with different items')
+            if default_categories and default_categories != job.get('categories', []):
+                raise ImportRejected(f'Job {self.job_id} was started with different categories')
+            return job
+        
+        if not items:
+            raise ImportRejected(f'Job {self.job_id} does not exist; items are required to start it')
+        
+        job = {
+            'items': items,
+            'categories': default_categories,
+            'results': {},
+            'complete': False,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        self.job_ref.set(job)
+        return job
+    
+    def _flush(self) -> None:
+        """Commit pending torrents with their index entries, counters and job progress"""
+        if not self._pending:
+            return
+        
+        batch = self.db.batch()
+        category_deltas: Dict[str, int] = {}
+        for entry in self._pending:
+            self.store.torrents.create(entry['torrent'], batch, torrent_id=entry['id'])
+            search_index.index_torrent(self.db, entry['id'], entry['torrent'], batch)
+            for slug, delta in counters.category_deltas([], entry['torrent']['category']).items():
+                category_deltas[slug] = category_deltas.get(slug, 0) + delta
+        
+        counters.increment(self.db, counters.CATEGORY_COUNTS, category_deltas, batch)
+        counters.increment(self.db, counters.TOTALS, {'games': len(self._pending)}, batch)
+        catalog.bump(self.db, batch)
+        batch.set(self.job_ref, {'results': self.results}, merge=True)
+        batch.commit()
+        self.commits += 1
+        self.imported_ids.extend(entry['id'] for entry in self._pending)
+        self._pending = []
+    
+    def _fetch_one(self, source: str) -> Dict[str, Any]:
+        app_id = self.extract_app_id(source)
+        if not app_id:
+            return {'ok': False, 'error': 'Invalid Steam URL or App ID'}
+        try:
+            return {'ok': True, 'appId': app_id, 'data': self.fetch(app_id, self.lang)}
+        except Exception as e:
+            return {'ok': False, 'appId': app_id, 'error': str(e)}
+    
+    def run(self, items: List[Any], default_categories: List[str]) -> Dict[str, Any]:
+        started = time.monotonic()
+        job = self._load_job(items, default_categories)
+        items = job['items']
+        default_categories = job.get('categories', default_categories)
+        self.results = dict(job.get('results', {}))
+        
+        parsed = [parse_item(item) for item in items]
+        todo = [i for i in range(len(parsed)) if str(i) not in self.results]
+        
+        # Apps already in the catalog are reported instead of rewritten
+        app_ids = {i: self.extract_app_id(parsed[i]['source']) for i in todo}
+        existing = set(self.store.torrents.get_many([torrent_id_for(a) for a in set(app_ids.values()) if a]))
+        
+        # Repeats of an app in this run wait for its first occurrence and
+        # share the outcome: skipped once it is imported, failed with it
+        duplicates: Dict[str, List[int]] = {}
+        queue = []
+        for i in todo:
+            app_id = app_ids[i]
+            torrent_id = torrent_id_for(app_id) if app_id else None
+            if torrent_id and torrent_id in existing:
+                self.results[str(i)] = {'ok': True, 'id': torrent_id, 'skipped': 'already imported'}
+            elif torrent_id and torrent_id in duplicates:
+                duplicates[torrent_id].append(i)
+            else:
+                if torrent_id:
+                    duplicates[torrent_id] = []
+                queue.append(i)
+        
+        timed_out = False
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = {}
+            while queue or in_flight:
+                while queue and len(in_flight) < self.workers:
+                    if time.monotonic() - started > self.time_budget:
+                        timed_out = True
+                        break
+                    i = queue.pop(0)
+                    in_flight[pool.submit(self._fetch_one, parsed[i]['source'])] = i
+                
+                if timed_out:
+                    queue = []
+                if not in_flight:
+                    break
+                
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = in_flight.pop(future)
+                    outcome = future.result()
+                    if outcome['ok']:
+                        torrent_id = torrent_id_for(outcome['appId'])
+                        torrent = build_torrent(outcome['data'], parsed[i]['options'], default_categories)
+                        self._pending.append({'id': torrent_id, 'torrent': torrent})
+                        self.results[str(i)] = {'ok': True, 'id': torrent_id, 'title': torrent['title']}
+                        repeated = {'ok': True, 'id': torrent_id, 'skipped': 'already imported'}
+                    else:
+                        self.results[str(i)] = {'ok': False, 'error': outcome['error']}
+                        repeated = self.results[str(i)]
+                    if outcome.get('appId'):
+                        for duplicate in duplicates.get(torrent_id_for(outcome['appId']), []):
+                            self.results[str(duplicate)] = dict(repeated)
+                    
+                    if len(self._pending) >= ITEMS_PER_BATCH:
+                        self._flush()
+        
+        complete = len(self.results) == len(parsed)
+        self._flush()
+        self.job_ref.set({'results': self.results, 'complete': complete}, merge=True)
+        
+        report = []
+        for i, item in enumerate(parsed):
+            result = self.results.get(str(i), {'ok': False, 'error': 'pending'})
+            report.append(dict(result, source=item['source']))
+        
+        return {
+            'jobId': self.job_id,
+            'complete': complete,
+            'imported': sum(1 for r in report if r['ok'] and not r.get('skipped')),
+            'skipped': sum(1 for r in report if r.get('skipped')),
+            'failed': sum(1 for r in report if not r['ok'] and r['error'] != 'pending'),
+            'pending': sum(1 for r in report if r.get('error') == 'pending'),
+            'items': report
+        }
@@ -0,0 +1,470 @@
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# Repositories for the torrents, users and categories collections.
+# The handler goes through these instead of calling db.collection(...) itself,
+# so every query shape lives in one place. They work on any client exposing
+# the Firestore API: the real Firestore client or memory_store.MemoryClient,
+# selected by the STORAGE_ENGINE environment variable.
+#
+# Users are unique by email and username through claim documents
+# emails/{normalized email} and usernames/{lowercased username} holding the
+# user id. Registration creates them with create() in the same commit as the
+# user, so a concurrent signup with the same email fails as a whole, and
+# lookups by email or username are direct document gets.
+
+DESCENDING = 'DESCENDING'
+
+TOMBSTONES_COLLECTION = 'torrent_tombstones'
+EMAILS_COLLECTION = 'emails'
+USERNAMES_COLLECTION = 'usernames'
+
+# Users written before claims existed get theirs from action=user-index (run
+# it once after deploying; the migration writes claims itself). Until then
+# USER_INDEX_FALLBACK=1 also queries users by field when a claim is missing,
+# which costs two extra queries on every signup and login.
+USER_INDEX_FALLBACK = os.environ.get('USER_INDEX_FALLBACK', '0') == '1'
+
+# created_at of torrents written before it was stamped: sort=newest lists
+# them last instead of leaving them out
+LEGACY_CREATED_AT = '1970-01-01T00:00:00'
+
+Document = Tuple[str, Dict[str, Any]]
+
+
+class FirebaseNotConfigured(Exception):
+    """FIREBASE_CREDENTIALS secret is missing"""
+
+
+def _claim_key(value: str) -> str:
+    # Document ids cannot contain '/'
+    return (value or '').strip().lower().replace('/', '%2F')
+
+
+def normalize_email(email: str) -> str:
+    return _claim_key(email)
+
+
+def normalize_username(username: str) -> str:
+    return _claim_key(username)
+
+
+def already_exists(error: Exception) -> bool:
+    """Commit failed because a create() target exists (AlreadyExists from Firestore or the memory engine)"""
+    return type(error).__name__ == 'AlreadyExists'
+
+
+def field_values(db):
+    """
+    Increment, DELETE_FIELD and SERVER_TIMESTAMP for the engine behind db:
+    the memory engine supplies its own, Firestore's come from firebase_admin.
+    """
+    values = getattr(db, 'field_values', None)
+    if values is not None:
+        return values
+    from firebase_admin import firestore
+    return firestore
+
+
+def _stamped(db, data: Dict[str, Any]) -> Dict[str, Any]:
+    # updated_at keys cached response fragments (serialization.py); revision,
+    # the commit timestamp, orders the change feed (changes.py)
+    return dict(data, updated_at=datetime.utcnow().isoformat(), revision=field_values(db).SERVER_TIMESTAMP)
+
+
+def _set(reference, data: Dict[str, Any], batch=None) -> None:
+    if batch is not None:
+        batch.set(reference, data)
+    else:
+        reference.set(data)
+
+
+def _update(reference, data: Dict[str, Any], batch=None) -> None:
+    if batch is not None:
+        batch.update(reference, data)
+    else:
+        reference.update(data)
+
+
+def _delete(reference, batch=None) -> None:
+    if batch is not None:
+        batch.delete(reference)
+    else:
+        reference.delete()
+
+
+class TorrentRepository:
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.collection('torrents')
+        self.tombstones = db.collection(TOMBSTONES_COLLECTION)
+    
+    def ref(self, torrent_id: Optional[str] = None):
+        return self.collection.document(torrent_id) if torrent_id else self.collection.document()
+    
+    def get(self, torrent_id: str) -> Optional[Dict[str, Any]]:
+        doc = self.collection.document(torrent_id).get()
+        return doc.to_dict() if doc.exists else None
+    
+    def get_many(self, torrent_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not torrent_ids:
+            return {}
+        docs = self.db.get_all([self.collection.document(torrent_id) for torrent_id in torrent_ids])
+        return {doc.id: doc.to_dict() for doc in docs if doc.exists}
+    
+    def list(
+        self,
+        category: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        after: Optional[Dict[str, Any]] = None
+    ) -> List[Document]:
+        """Torrents by downloads DESC; with limit, ties are broken by id for stable pages"""
+        query = self.collection
+        if category:
+            query = query.where('category', 'array_contains', category)
+        query = query.order_by('downloads', direction=DESCENDING)
+        
+        if fields is not None:
+            query = query.select(fields)
+        
+        if limit is not None:
+            query = query.order_by('__name__', direction=DESCENDING)
+            if after:
+                query = query.start_after({'downloads': after.get('downloads', 0), '__name__': after['id']})
+            query = query.limit(limit)
+        
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+    
+    def query(
+        self,
+        filters: List[Tuple[str, str, Any]],
+        order: str,
+        direction: str = DESCENDING,
+        fields: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        after: Optional[Dict[str, Any]] = None
+    ) -> List[Document]:
+        """Filtered torrents ordered by one field, ties broken by id; see query_planner for the indexes"""
+        query = self.collection
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        query = query.order_by(order, direction=direction).order_by('__name__', direction=direction)
+        
+        if fields is not None:
+            query = query.select(fields)
+        if after:
+            query = query.start_after({order: after.get(order), '__name__': after['id']})
+        if limit is not None:
+            query = query.limit(limit)
+        
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+    
+    def stream(self, fields: Optional[List[str]] = None) -> Iterator[Document]:
+        query = self.collection.select(fields) if fields is not None else self.collection
+        for doc in query.stream():
+            yield doc.id, doc.to_dict()
+    
+    def create(self, data: Dict[str, Any], batch=None, torrent_id: Optional[str] = None) -> str:
+        reference = self.ref(torrent_id)
+        _set(reference, _stamped(self.db, data), batch)
+        return reference.id
+    
+    def update(self, torrent_id: str, data: Dict[str, Any], batch=None) -> None:
+        _update(self.ref(torrent_id), _stamped(self.db, data), batch)
+    
+    def delete(self, torrent_id: str, batch=None) -> None:
+        """Delete a torrent, leaving a tombstone for the change feed"""
+        _delete(self.ref(torrent_id), batch)
+        _set(self.tombstones.document(torrent_id), {'revision': field_values(self.db).SERVER_TIMESTAMP}, batch)
+    
+    def backfill_created_at(self, chunk_size: int = 400) -> int:
+        """Stamp LEGACY_CREATED_AT on torrents without created_at; returns how many were stamped"""
+        missing = [torrent_id for torrent_id, data in self.stream(['created_at']) if not data.get('created_at')]
+        for start in range(0, len(missing), chunk_size):
+            batch = self.db.batch()
+            for torrent_id in missing[start:start + chunk_size]:
+                self.update(torrent_id, {'created_at': LEGACY_CREATED_AT}, batch)
+            batch.commit()
+        return len(missing)
+    
+    def by_id(self, after: Optional[str], limit: int) -> List[Document]:
+        """Torrents in document id order after the id `after`, for paged full copies"""
+        query = self.collection.order_by('__name__')
+        if after:
+            query = query.start_after({'__name__': after})
+        return [(doc.id, doc.to_dict()) for doc in query.limit(limit).stream()]
+    
+    def changed_since(self, after: Optional[Dict[str, Any]], limit: int) -> List[Document]:
+        """Torrents by (revision, id) after a change feed position"""
+        return self._since(self.collection, after, limit)
+    
+    def deleted_since(self, after: Optional[Dict[str, Any]], limit: int) -> List[Document]:
+        """Tombstones by (revision, id) after a change feed position"""
+        return self._since(self.tombstones, after, limit)
+    
+    def _since(self, collection, after: Optional[Dict[str, Any]], limit: int) -> List[Document]:
+        # A position with an id resumes right after that document; a bare
+        # revision (a watermark) resumes at everything stamped from then on
+        query = collection
+        if after and not after.get('id'):
+            query = query.where('revision', '>=', after['revision'])
+        query = query.order_by('revision').order_by('__name__')
+        if after and after.get('id'):
+            query = query.start_after({'revision': after['revision'], '__name__': after['id']})
+        return [(doc.id, doc.to_dict()) for doc in query.limit(limit).stream()]
+    
+    def expired_tombstones(self, before: datetime, limit: int) -> List[str]:
+        query = self.tombstones.where('revision', '<', before).order_by('revision').limit(limit)
+        return [doc.id for doc in query.select([]).stream()]
+    
+    def purge_tombstone(self, torrent_id: str, batch=None) -> None:
+        _delete(self.tombstones.document(torrent_id), batch)
+
+
+class UserRepository:
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.collection('users')
+        self.emails = db.collection(EMAILS_COLLECTION)
+        self.usernames = db.collection(USERNAMES_COLLECTION)
+    
+    def ref(self, user_id: Optional[str] = None):
+        return self.collection.document(user_id) if user_id else self.collection.document()
+    
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = self.collection.document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+    
+    def _find_one(self, *filters: Tuple[str, str, Any]) -> Optional[Document]:
+        query = self.collection
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        docs = list(query.limit(1).get())
+        return (docs[0].id, docs[0].to_dict()) if docs else None
+    
+    def _claim_refs(self, data: Dict[str, Any]) -> List[Any]:
+        refs = []
+        if normalize_email(data.get('email')):
+            refs.append(self.emails.document(normalize_email(data.get('email'))))
+        if normalize_username(data.get('username')):
+            refs.append(self.usernames.document(normalize_username(data.get('username'))))
+        return refs
+    
+    def find_by_email(self, email: str) -> Optional[Document]:
+        claim = self.emails.document(normalize_email(email)).get()
+        if not claim.exists:
+            return self._find_one(('email', '==', email)) if USER_INDEX_FALLBACK else None
+        
+        user_id = claim.to_dict().get('user_id')
+        data = self.get(user_id) if user_id else None
+        return (user_id, data) if data is not None else None
+    
+    def find_by_username(self, username: str) -> Optional[Document]:
+        claim = self.usernames.document(normalize_username(username)).get()
+        if not claim.exists:
+            return self._find_one(('username', '==', username)) if USER_INDEX_FALLBACK else None
+        
+        user_id = claim.to_dict().get('user_id')
+        data = self.get(user_id) if user_id else None
+        return (user_id, data) if data is not None else None
+    
+    def find_by_credentials(self, email: str, password_hash: str) -> Optional[Document]:
+        found = self.find_by_email(email)
+        return found if found is not None and found[1].get('password_hash') == password_hash else None
+    
+    def is_taken(self, email: str, username: str) -> bool:
+        """Email or username already claimed, both claims read in one round-trip"""
+        claims = self.db.get_all(self._claim_refs({'email': email, 'username': username}))
+        if any(doc.exists for doc in claims):
+            return True
+        if USER_INDEX_FALLBACK:
+            return bool(self._find_one(('email', '==', email)) or self._find_one(('username', '==', username)))
+        return False
+    
+    def page(
+        self,
+        limit: int,
+        after: Optional[Dict[str, Any]] = None,
+        is_admin: Optional[bool] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[Document]:
+        """Newest users first, ties broken by id; after is the last row of the previous page"""
+        query = self.collection
+        if is_admin is not None:
+            # Composite index: is_admin ASC, created_at DESC
+            query = query.where('is_admin', '==', is_admin)
+        query = query.order_by('created_at', direction=DESCENDING).order_by('__name__', direction=DESCENDING)
+        
+        if fields is not None:
+            # created_at is always selected so the cursor can be built from the last row
+            query = query.select(sorted(set(fields) | {'created_at'}))
+        if after:
+            query = query.start_after({'created_at': after.get('created_at'), '__name__': after['id']})
+        
+        return [(doc.id, doc.to_dict()) for doc in query.limit(limit).stream()]
+    
+    def claims_with_prefix(self, kind: str, prefix: str, after: Optional[str], limit: int) -> List[Tuple[str, str]]:
+        """
+        (claim key, user id) of 'emails' or 'usernames' claims whose key starts
+        with prefix (already normalized), in key order after the key `after`.
+        Served by the built-in document id index: reads only matching claims.
+        """
+        collection = self.emails if kind == 'emails' else self.usernames
+        query = collection.where('__name__', '>=', collection.document(prefix)) \
+            .where('__name__', '<', collection.document(prefix + '\uf8ff')) \
+            .order_by('__name__')
+        if after:
+            query = query.start_after({'__name__': after})
+        return [(doc.id, doc.to_dict().get('user_id')) for doc in query.limit(limit).stream()]
+    
+    def get_many(self, user_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        if not user_ids:
+            return {}
+        docs = self.db.get_all([self.collection.document(user_id) for user_id in user_ids], field_paths=fields)
+        return {doc.id: doc.to_dict() for doc in docs if doc.exists}
+    
+    def stream(self) -> Iterator[Document]:
+        for doc in self.collection.stream():
+            yield doc.id, doc.to_dict()
+    
+    def create(self, data: Dict[str, Any], batch=None, user_id: Optional[str] = None) -> str:
+        reference = self.ref(user_id)
+        _set(reference, data, batch)
+        return reference.id
+    
+    def register(self, data: Dict[str, Any], batch) -> str:
+        """
+        Add a new user and its email/username claims to batch.
+        The claims are create()s: committing fails as a whole when either is
+        taken (see already_exists()).
+        """
+        reference = self.ref()
+        batch.set(reference, data)
+        for claim in self._claim_refs(data):
+            batch.create(claim, {'user_id': reference.id})
+        return reference.id
+    
+    def claim(self, user_id: str, data: Dict[str, Any], batch) -> None:
+        """Point the user's email/username claims at user_id (migration, backfill)"""
+        for claim in self._claim_refs(data):
+            batch.set(claim, {'user_id': user_id})
+    
+    def release(self, user_id: str, data: Dict[str, Any], batch) -> None:
+        """Delete the claims of a user being deleted, leaving claims held by others"""
+        for doc in self.db.get_all(self._claim_refs(data)):
+            if doc.exists and doc.to_dict().get('user_id') == user_id:
+                batch.delete(doc.reference)
+    
+    def backfill_claims(self, chunk_size: int = 200) -> Dict[str, Any]:
+        """
+        Create missing claims for users written before claims existed.
+        A claim already held by another user is left alone and reported.
+        """
+        users = 0
+        claimed = 0
+        conflicts: List[Dict[str, str]] = []
+        chunk: List[Document] = []
+        
+        def flush() -> None:
+            nonlocal claimed
+            refs = {ref.path: ref for _, data in chunk for ref in self._claim_refs(data)}
+            holders = {
+                doc.reference.path: doc.to_dict().get('user_id')
+                for doc in self.db.get_all(list(refs.values())) if doc.exists
+            }
+            batch = self.db.batch()
+            writes = 0
+            for user_id, data in chunk:
+                for ref in self._claim_refs(data):
+                    holder = holders.get(ref.path)
+                    if holder is None:
+                        batch.set(ref, {'user_id': user_id})
+                        holders[ref.path] = user_id
+                        writes += 1
+                    elif holder != user_id:
+                        conflicts.append({'id': user_id, 'claim': ref.path, 'heldBy': holder})
+            if writes:
+                batch.commit()
+            claimed += writes
+            chunk.clear()
+        
+        # Two claims per user: chunk_size users stay within one batch
+        for user in self.stream():
+            users += 1
+            chunk.append(user)
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+        
+        return {'users': users, 'claimed': claimed, 'conflicts': conflicts}
+    
+    def update(self, user_id: str, data: Dict[str, Any], batch=None) -> None:
+        _update(self.ref(user_id), data, batch)
+    
+    def delete(self, user_id: str, batch=None) -> None:
+        _delete(self.ref(user_id), batch)
+
+
+class CategoryRepository:
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.collection('categories')
+    
+    def list(self) -> List[Document]:
+        return [(doc.id, doc.to_dict()) for doc in self.collection.order_by('name').stream()]
+    
+    def create(self, data: Dict[str, Any], batch=None, category_id: Optional[str] = None) -> str:
+        reference = self.collection.document(category_id) if category_id else self.collection.document()
+        _set(reference, data, batch)
+        return reference.id
+    
+    def update(self, category_id: str, data: Dict[str, Any], batch=None) -> None:
+        _update(self.collection.document(category_id), data, batch)
+    
+    def delete(self, category_id: str, batch=None) -> None:
+        _delete(self.collection.document(category_id), batch)
+
+
+class Storage:
+    """Repositories bound to one client, plus the client for counters/indexes"""
+    
+    def __init__(self, db):
+        self.db = db
+        self.torrents = TorrentRepository(db)
+        self.users = UserRepository(db)
+        self.categories = CategoryRepository(db)
+    
+    def batch(self):
+        return self.db.batch()
+
+
+def create_client(engine: Optional[str] = None):
+    """
+    Client for STORAGE_ENGINE: 'firestore' (default) or 'memory'.
+    Raises FirebaseNotConfigured without credentials, json.JSONDecodeError on malformed ones.
+    """
+    engine = engine or os.environ.get('STORAGE_ENGINE', 'firestore')
+    
+    if engine == 'memory':
+        from memory_store import MemoryClient
+        return MemoryClient()
+    
+    if engine != 'firestore':
+        raise ValueError(f'Unknown STORAGE_ENGINE: {engine}')
+    
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    
+    if not firebase_admin._apps:
+        cred_json = os.environ.get('FIREBASE_CREDENTIALS', '')
+        if not cred_json or cred_json.strip() == '':
+            raise FirebaseNotConfigured('FIREBASE_CREDENTIALS is not set')
+        
+        cred_dict = json.loads(cred_json)
+        cred = credentials.Certificate(cred_dict)
+        firebase_admin.initialize_app(cred)
+    
+    return firestore.client()
@@ -0,0 +1,244 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+
+# Per-request instrumentation: wall time per span (db, steam, serialize),
+# documents read/written, emitted as one JSON log line and a Server-Timing
+# header. The storage client is wrapped by traced() so every Firestore call
+# is attributed to the request without touching the repositories.
+# Code running outside a request (background refresh threads, worker pools)
+# has no current trace and is not recorded.
+
+# LOG_LEVEL=debug enables payload logging; call sites guard with `if DEBUG:`
+# so disabled debug lines never format their arguments.
+DEBUG = os.environ.get('LOG_LEVEL', '').lower() == 'debug'
+
+_current: contextvars.ContextVar[Optional['RequestTrace']] = contextvars.ContextVar('request_trace', default=None)
+
+
+class RequestTrace:
+    def __init__(self, method: str, action: str, request_id: Optional[str] = None):
+        self.method = method
+        self.action = action
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.reads = 0
+        self.writes = 0
+        self.duration: Optional[float] = None
+        self._token = None
+        # Fan-out reads (fanout.py) record from worker threads; their db time
+        # is summed, so it can exceed the wall time of the fan-out
+        self._lock = threading.Lock()
+    
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+    
+    def count(self, reads: int = 0, writes: int = 0) -> None:
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+    
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started
+    
+    def route_time(self) -> float:
+        """Handler time not covered by any span: routing, validation, business logic"""
+        return max(0.0, (self.duration or 0.0) - sum(self.spans.values()))
+    
+    def server_timing(self) -> str:
+        metrics = [f'route;dur={self.route_time() * 1000:.2f}']
+        for name, seconds in self.spans.items():
+            metrics.append(f'{name};dur={seconds * 1000:.2f}')
+        metrics.append(f'total;dur={(self.duration or 0.0) * 1000:.2f}')
+        metrics.append(f'reads;desc="{self.reads}"')
+        metrics.append(f'writes;desc="{self.writes}"')
+        return ', '.join(metrics)
+    
+    def log_record(self, status: int) -> Dict[str, Any]:
+        return {
+            'requestId': self.request_id,
+            'method': self.method,
+            'action': self.action,
+            'status': status,
+            'durationMs': round((self.duration or 0.0) * 1000, 2),
+            'spans': {'route': round(self.route_time() * 1000, 2), **{
+                name: round(seconds * 1000, 2) for name, seconds in self.spans.items()
+            }},
+            'calls': self.calls,
+            'reads': self.reads,
+            'writes': self.writes
+        }
+
+
+def start(method: str, action: str, request_id: Optional[str] = None) -> RequestTrace:
+    trace = RequestTrace(method, action, request_id)
+    trace._token = _current.set(trace)
+    return trace
+
+
+def finish(trace: RequestTrace, response: Dict[str, Any]) -> Dict[str, Any]:
+    """Close the trace, log it and attach Server-Timing to the response"""
+    trace.finish()
+    _current.reset(trace._token)
+    
+    headers = dict(response.get('headers') or {})
+    headers['Server-Timing'] = trace.server_timing()
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, Server-Timing' if exposed else 'Server-Timing'
+    response['headers'] = headers
+    
+    print(json.dumps(trace.log_record(response.get('statusCode', 0)), separators=(',', ':')))
+    return response
+
+
+def discard(trace: RequestTrace) -> None:
+    """Drop the trace of a request that raised"""
+    _current.reset(trace._token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+def count(reads: int = 0, writes: int = 0) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.count(reads, writes)
+
+
+def elapsed() -> float:
+    """Seconds since the current request started, 0 outside a request"""
+    trace = _current.get()
+    return time.perf_counter() - trace.started if trace is not None else 0.0
+
+
+def debug(message: str) -> None:
+    print(f'DEBUG: {message}')
+
+
+def dumps(value: Any, **kwargs) -> str:
+    """json.dumps timed as the serialize span"""
+    with span('serialize'):
+        return json.dumps(value, **kwargs)
+
+
+# --- Firestore client wrapper ---
+
+_WRITE_METHODS = {'set', 'create', 'update', 'delete'}
+
+
+def _unwrap(value: Any) -> Any:
+    if isinstance(value, _Traced):
+        return value._target
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(item) for item in value)
+    return value
+
+
+def _is_snapshot(value: Any) -> bool:
+    return hasattr(value, 'to_dict') and hasattr(value, 'exists')
+
+
+class _Traced:
+    """
+    Proxy over a Firestore client, reference, query or batch.
+    Calls returning other Firestore objects return proxies; stream/get/commit
+    and direct writes are timed under the db span and counted.
+    """
+    
+    def __init__(self, target: Any, pending_writes: int = 0):
+        self._target = target
+        self._pending_writes = pending_writes
+    
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+        
+        def call(*args, **kwargs):
+            args = tuple(_unwrap(arg) for arg in args)
+            kwargs = {key: _unwrap(value) for key, value in kwargs.items()}
+            
+            if name == 'stream' or (name == 'get_all' and hasattr(self._target, 'batch')):
+                return self._stream(attribute(*args, **kwargs))
+            
+            if name == 'get':
+                with span('db'):
+                    result = attribute(*args, **kwargs)
+                count(reads=max(1, len(result)) if isinstance(result, list) else 1)
+                return result
+            
+            if name == 'commit':
+                with span('db'):
+                    result = attribute(*args, **kwargs)
+                count(writes=self._pending_writes)
+                self._pending_writes = 0
+                return result
+            
+            if name in _WRITE_METHODS and hasattr(self._target, 'commit'):
+                # Batched write: counted when the batch commits
+                attribute(*args, **kwargs)
+                self._pending_writes += 1
+                return self
+            
+            if name in _WRITE_METHODS or name == 'add':
+                with span('db'):
+                    result = attribute(*args, **kwargs)
+                count(writes=1)
+                return result
+            
+            result = attribute(*args, **kwargs)
+            if result is None or _is_snapshot(result) or isinstance(result, (str, int, float, bool, list, dict, tuple)):
+                return result
+            return _Traced(result)
+        
+        return call
+    
+    @staticmethod
+    def _stream(iterator: Iterator[Any]) -> Iterator[Any]:
+        # Time only spent inside the backend iterator, recorded once when the stream ends
+        trace = _current.get()
+        elapsed = 0.0
+        returned = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                returned += 1
+                yield item
+        finally:
+            if trace is not None:
+                trace.add('db', elapsed)
+                trace.count(reads=max(1, returned))
+    
+    def __len__(self) -> int:
+        return len(self._target)
+    
+    def __bool__(self) -> bool:
+        return True
+
+
+def traced(client: Any) -> Any:
+    return _Traced(client)
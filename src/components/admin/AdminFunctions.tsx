@@ -5,6 +5,7 @@ import { Button } from "@/components/ui/button";
 import { Label } from "@/components/ui/label";
 import Icon from "@/components/ui/icon";
 import { useToast } from "@/hooks/use-toast";
+import { authHeaders } from "@/lib/auth";
 import {
   Table,
   TableBody,
@@ -61,7 +62,7 @@ const AdminFunctions = () => {
       try {
         const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=categories', {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
+          headers: authHeaders({ 'Content-Type': 'application/json' }),
           body: JSON.stringify(newCategory)
         });
 
@@ -92,6 +93,7 @@ const AdminFunctions = () => {
     try {
       const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=categories&id=${id}`, {
         method: 'DELETE',
+        headers: authHeaders(),
       });
 
       if (response.ok) {
@@ -117,7 +119,7 @@ const AdminFunctions = () => {
     try {
       const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=categories&id=${editingCategory.id}`, {
         method: 'PUT',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           name: editingCategory.name,
           slug: editingCategory.slug,
@@ -1,9 +1,12 @@
+import { useState } from "react";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
+import { Input } from "@/components/ui/input";
 import { Badge } from "@/components/ui/badge";
 import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar";
 import Icon from "@/components/ui/icon";
 import { useToast } from "@/hooks/use-toast";
+import { authHeaders } from "@/lib/auth";
 import {
   Table,
   TableBody,
@@ -17,16 +20,20 @@ interface UsersTableProps {
   users: any[];
   onDelete: (id: string) => void;
   onRefresh: () => void;
+  hasMore?: boolean;
+  onLoadMore?: () => void;
+  onSearch?: (query: string) => void;
 }
 
-const UsersTable = ({ users, onDelete, onRefresh }: UsersTableProps) => {
+const UsersTable = ({ users, onDelete, onRefresh, hasMore, onLoadMore, onSearch }: UsersTableProps) => {
   const { toast } = useToast();
+  const [query, setQuery] = useState("");
 
   const toggleAdmin = async (userId: number, currentStatus: boolean) => {
     try {
       const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=users&id=${userId}`, {
         method: 'PUT',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           is_admin: !currentStatus
         })
@@ -56,6 +63,25 @@ const UsersTable = ({ users, onDelete, onRefresh }: UsersTableProps) => {
         </CardTitle>
       </CardHeader>
       <CardContent>
+        {onSearch && (
+          <form
+            className="flex gap-2 mb-4"
+            onSubmit={(e) => {
+              e.preventDefault();
+              onSearch(query.trim());
+            }}
+          >
+            <Input
+              placeholder="Поиск по имени пользователя или email"
+              value={query}
+              onChange={(e) => setQuery(e.target.value)}
+              className="bg-secondary border-border"
+            />
+            <Button type="submit" variant="outline">
+              <Icon name="Search" size={16} />
+            </Button>
+          </form>
+        )}
         <div className="rounded-md border border-border overflow-x-auto">
           <Table>
             <TableHeader>
@@ -133,6 +159,13 @@ const UsersTable = ({ users, onDelete, onRefresh }: UsersTableProps) => {
             </TableBody>
           </Table>
         </div>
+        {hasMore && onLoadMore && (
+          <div className="flex justify-center mt-4">
+            <Button variant="outline" onClick={onLoadMore}>
+              Показать еще
+            </Button>
+          </div>
+        )}
       </CardContent>
     </Card>
   );
@@ -0,0 +1,6 @@
+export const ADMIN_TOKEN_KEY = "adminToken";
+
+export function authHeaders(headers: Record<string, string> = {}): Record<string, string> {
+  const token = localStorage.getItem(ADMIN_TOKEN_KEY);
+  return token ? { ...headers, Authorization: `Bearer ${token}` } : headers;
+}
@@ -0,0 +1,61 @@
+const API_URL = "https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae";
+const CACHE_KEY = "catalogCache";
+
+interface CachedCatalog<T> {
+  since: string;
+  torrents: T[];
+}
+
+interface ChangesResponse<T> {
+  resync: boolean;
+  torrents: T[];
+  deleted: string[];
+  since: string;
+  hasMore: boolean;
+}
+
+function load<T>(): CachedCatalog<T> | null {
+  try {
+    const raw = localStorage.getItem(CACHE_KEY);
+    return raw ? JSON.parse(raw) : null;
+  } catch {
+    return null;
+  }
+}
+
+function save<T>(catalog: CachedCatalog<T>) {
+  try {
+    localStorage.setItem(CACHE_KEY, JSON.stringify(catalog));
+  } catch {
+    // Quota exceeded: the next visit starts with a full sync again
+    localStorage.removeItem(CACHE_KEY);
+  }
+}
+
+// Local copy of the whole catalog, brought up to date through action=changes:
+// only torrents changed since the last visit are downloaded.
+export async function syncCatalog<T extends { id: string | number; downloads: number }>(): Promise<T[]> {
+  const cached = load<T>();
+  const byId = new Map<string, T>((cached?.torrents || []).map((t) => [String(t.id), t]));
+  let since = cached?.since;
+
+  for (;;) {
+    const params = new URLSearchParams({ action: "changes" });
+    if (since) params.set("since", since);
+    const response = await fetch(`${API_URL}?${params}`);
+    if (!response.ok) throw new Error(`changes: ${response.status}`);
+    const data: ChangesResponse<T> = await response.json();
+
+    if (data.resync) byId.clear();
+    data.torrents.forEach((t) => byId.set(String(t.id), t));
+    data.deleted.forEach((id) => byId.delete(id));
+    since = data.since;
+    if (!data.hasMore) break;
+  }
+
+  const torrents = [...byId.values()].sort(
+    (a, b) => (b.downloads || 0) - (a.downloads || 0) || String(b.id).localeCompare(String(a.id))
+  );
+  save({ since, torrents });
+  return torrents;
+}
@@ -1,6 +1,7 @@
 import { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import { useToast } from "@/hooks/use-toast";
+import { ADMIN_TOKEN_KEY, authHeaders } from "@/lib/auth";
 import AdminSidebar from "@/components/admin/AdminSidebar";
 import StatsCards from "@/components/admin/StatsCards";
 import AddTorrentForm from "@/components/admin/AddTorrentForm";
@@ -31,6 +32,8 @@ const AdminDashboard = () => {
   });
   const [torrents, setTorrents] = useState<any[]>([]);
   const [users, setUsers] = useState<any[]>([]);
+  const [usersCursor, setUsersCursor] = useState<string | null>(null);
+  const [usersQuery, setUsersQuery] = useState("");
   const [categories, setCategories] = useState<any[]>([]);
   const [editingTorrent, setEditingTorrent] = useState<any>(null);
   const [deleteId, setDeleteId] = useState<string | null>(null);
@@ -44,21 +47,39 @@ const AdminDashboard = () => {
     if (isAuth !== "true") {
       navigate("/admin");
     }
-    fetchStats();
-    fetchTorrents();
-    fetchUsers();
-    fetchCategories();
+    fetchDashboard();
   }, [navigate]);
 
+  const applyStats = (data: any) => {
+    setStats({
+      games: data.games.toLocaleString('ru-RU'),
+      users: data.users.toLocaleString('ru-RU'),
+      comments: data.comments.toLocaleString('ru-RU')
+    });
+  };
+
+  // Stats, torrents, first users page and categories in one request
+  const fetchDashboard = async () => {
+    try {
+      const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=dashboard', {
+        headers: authHeaders(),
+      });
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.error);
+      applyStats(data.stats);
+      setTorrents(data.torrents || []);
+      setUsers(data.users || []);
+      setUsersCursor(data.usersNextCursor || null);
+      setCategories(data.categories || []);
+    } catch (error) {
+      console.error('Failed to fetch dashboard:', error);
+    }
+  };
+
   const fetchStats = async () => {
     try {
       const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=stats');
-      const data = await response.json();
-      setStats({
-        games: data.games.toLocaleString('ru-RU'),
-        users: data.users.toLocaleString('ru-RU'),
-        comments: data.comments.toLocaleString('ru-RU')
-      });
+      applyStats(await response.json());
     } catch (error) {
       console.error('Ошибка загрузки статистики:', error);
     }
@@ -74,30 +95,32 @@ const AdminDashboard = () => {
     }
   };
 
-  const fetchUsers = async () => {
+  const fetchUsers = async (cursor: string | null = null, query: string = usersQuery) => {
     try {
-      const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=users');
+      const params = new URLSearchParams({ action: 'users' });
+      if (query) params.set('q', query);
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?${params}`, {
+        headers: authHeaders(),
+      });
       const data = await response.json();
-      setUsers(data.users || []);
+      setUsers((prev) => (cursor ? [...prev, ...(data.users || [])] : data.users || []));
+      setUsersCursor(data.nextCursor || null);
     } catch (error) {
       console.error('Failed to fetch users:', error);
     }
   };
 
-  const fetchCategories = async () => {
-    try {
-      const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=categories');
-      const data = await response.json();
-      setCategories(data.categories || []);
-    } catch (error) {
-      console.error('Failed to fetch categories:', error);
-    }
+  const searchUsers = (query: string) => {
+    setUsersQuery(query);
+    fetchUsers(null, query);
   };
 
   const handleDeleteTorrent = async (id: string) => {
     try {
       const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?id=${id}`, {
         method: 'DELETE',
+        headers: authHeaders(),
       });
 
       if (response.ok) {
@@ -124,6 +147,7 @@ const AdminDashboard = () => {
     try {
       const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae/users/${id}`, {
         method: 'DELETE',
+        headers: authHeaders(),
       });
 
       if (response.ok) {
@@ -152,9 +176,9 @@ const AdminDashboard = () => {
     try {
       const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=${editingTorrent.id}`, {
         method: 'PUT',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({
           title: editingTorrent.title,
           poster: editingTorrent.poster,
@@ -189,6 +213,7 @@ const AdminDashboard = () => {
 
   const handleLogout = () => {
     localStorage.removeItem("adminAuth");
+    localStorage.removeItem(ADMIN_TOKEN_KEY);
     toast({
       title: "Выход выполнен",
       description: "До свидания!",
@@ -202,9 +227,9 @@ const AdminDashboard = () => {
     try {
       const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae', {
         method: 'POST',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({
           title: formData.title,
           poster: formData.poster,
@@ -368,7 +393,10 @@ const AdminDashboard = () => {
               <UsersTable 
                 users={users}
                 onDelete={handleUserDelete}
-                onRefresh={fetchUsers}
+                onRefresh={() => fetchUsers()}
+                hasMore={usersCursor !== null}
+                onLoadMore={() => fetchUsers(usersCursor)}
+                onSearch={searchUsers}
               />
             )}
 
@@ -6,30 +6,48 @@ import { Button } from "@/components/ui/button";
 import { Label } from "@/components/ui/label";
 import Icon from "@/components/ui/icon";
 import { useToast } from "@/hooks/use-toast";
+import { ADMIN_TOKEN_KEY } from "@/lib/auth";
 
 const AdminLogin = () => {
-  const [username, setUsername] = useState("");
+  const [email, setEmail] = useState("");
   const [password, setPassword] = useState("");
   const navigate = useNavigate();
   const { toast } = useToast();
 
-  const handleLogin = (e: React.FormEvent) => {
+  const handleLogin = async (e: React.FormEvent) => {
     e.preventDefault();
     
-    if (username === "admin" && password === "admin") {
-      localStorage.setItem("adminAuth", "true");
-      toast({
-        title: "Успешный вход",
-        description: "Добро пожаловать в панель управления",
-      });
-      navigate("/admin/dashboard");
-    } else {
-      toast({
-        title: "Ошибка входа",
-        description: "Неверный логин или пароль",
-        variant: "destructive",
+    try {
+      const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=auth', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          action: 'login',
+          email,
+          password
+        })
       });
+      const data = await response.json();
+
+      if (response.ok && data.user?.is_admin) {
+        localStorage.setItem("adminAuth", "true");
+        localStorage.setItem(ADMIN_TOKEN_KEY, data.token);
+        toast({
+          title: "Успешный вход",
+          description: "Добро пожаловать в панель управления",
+        });
+        navigate("/admin/dashboard");
+        return;
+      }
+    } catch (error) {
+      console.error('Admin login failed:', error);
     }
+
+    toast({
+      title: "Ошибка входа",
+      description: "Неверный логин или пароль",
+      variant: "destructive",
+    });
   };
 
   return (
@@ -40,18 +58,18 @@ const AdminLogin = () => {
             <Icon name="Shield" className="text-primary" size={28} />
             <CardTitle className="text-2xl font-bold">Админ-панель</CardTitle>
           </div>
-          <CardDescription>Введите логин и пароль для входа</CardDescription>
+          <CardDescription>Войдите учетной записью администратора</CardDescription>
         </CardHeader>
         <CardContent>
           <form onSubmit={handleLogin} className="space-y-4">
             <div className="space-y-2">
-              <Label htmlFor="username">Логин</Label>
+              <Label htmlFor="email">Email</Label>
               <Input
-                id="username"
-                type="text"
-                placeholder="admin"
-                value={username}
-                onChange={(e) => setUsername(e.target.value)}
+                id="email"
+                type="email"
+                placeholder="admin@example.com"
+                value={email}
+                onChange={(e) => setEmail(e.target.value)}
                 className="bg-secondary border-border"
                 required
               />
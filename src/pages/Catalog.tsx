@@ -6,6 +6,7 @@ import { Button } from "@/components/ui/button";
 import Header from "@/components/Header";
 import AuthModal from "@/components/AuthModal";
 import TorrentGrid from "@/components/TorrentGrid";
+import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
 
 interface TorrentCard {
   id: number;
@@ -18,10 +19,21 @@ interface TorrentCard {
   steamDeck?: boolean;
 }
 
+const SORT_OPTIONS = [
+  { value: "downloads", label: "По загрузкам" },
+  { value: "newest", label: "Сначала новые" },
+  { value: "steam_rating", label: "По рейтингу Steam" },
+  { value: "metacritic_score", label: "По Metacritic" },
+  { value: "size", label: "По размеру" },
+];
+
+// Filters passed through to the listing endpoint as they are
+const RANGE_PARAMS = ["minSize", "maxSize", "minMetacritic", "maxMetacritic", "minSteamRating", "maxSteamRating"];
+
 const Catalog = () => {
   const navigate = useNavigate();
-  const [searchParams] = useSearchParams();
-  const [allTorrents, setAllTorrents] = useState<TorrentCard[]>([]);
+  const [searchParams, setSearchParams] = useSearchParams();
+  const [torrents, setTorrents] = useState<TorrentCard[]>([]);
   const [categories, setCategories] = useState<any[]>([]);
   const [loading, setLoading] = useState(true);
   const [user, setUser] = useState<any>(null);
@@ -29,9 +41,13 @@ const Catalog = () => {
 
   const selectedCategories = searchParams.get('categories')?.split(',').filter(Boolean) || [];
   const steamDeckOnly = searchParams.get('steamDeck') === 'true';
+  const sort = searchParams.get('sort') || 'downloads';
 
   useEffect(() => {
     fetchTorrents();
+  }, [searchParams.toString()]);
+
+  useEffect(() => {
     fetchCategories();
     
     const savedUser = localStorage.getItem('user');
@@ -62,9 +78,16 @@ const Catalog = () => {
 
   const fetchTorrents = async () => {
     try {
-      const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae');
+      const params = new URLSearchParams({ fields: 'card,steamDeck', sort });
+      if (selectedCategories.length > 0) params.set('categories', selectedCategories.join(','));
+      if (steamDeckOnly) params.set('steamDeck', 'true');
+      for (const name of RANGE_PARAMS) {
+        const value = searchParams.get(name);
+        if (value) params.set(name, value);
+      }
+      const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?${params}`);
       const data = await response.json();
-      setAllTorrents(data.torrents || []);
+      setTorrents(data.torrents || []);
     } catch (error) {
       console.error('Ошибка загрузки торрентов:', error);
     } finally {
@@ -72,19 +95,11 @@ const Catalog = () => {
     }
   };
 
-  const filteredTorrents = allTorrents.filter(t => {
-    let matches = true;
-    
-    if (selectedCategories.length > 0) {
-      matches = selectedCategories.some(cat => t.category && t.category.includes(cat));
-    }
-    
-    if (steamDeckOnly) {
-      matches = matches && t.steamDeck === true;
-    }
-    
-    return matches;
-  });
+  const changeSort = (value: string) => {
+    const next = new URLSearchParams(searchParams);
+    next.set('sort', value);
+    setSearchParams(next);
+  };
 
   const formatDownloads = (num: number) => {
     return num.toLocaleString('ru-RU');
@@ -161,14 +176,28 @@ const Catalog = () => {
             )}
           </div>
 
-          <p className="text-muted-foreground">
-            Найдено игр: <span className="font-semibold text-foreground">{filteredTorrents.length}</span>
-          </p>
+          <div className="flex flex-wrap items-center justify-between gap-4">
+            <p className="text-muted-foreground">
+              Найдено игр: <span className="font-semibold text-foreground">{torrents.length}</span>
+            </p>
+            <Select value={sort} onValueChange={changeSort}>
+              <SelectTrigger className="w-[220px]">
+                <SelectValue />
+              </SelectTrigger>
+              <SelectContent>
+                {SORT_OPTIONS.map(option => (
+                  <SelectItem key={option.value} value={option.value}>
+                    {option.label}
+                  </SelectItem>
+                ))}
+              </SelectContent>
+            </Select>
+          </div>
         </div>
 
-        {filteredTorrents.length > 0 ? (
+        {torrents.length > 0 ? (
           <TorrentGrid 
-            torrents={filteredTorrents}
+            torrents={torrents}
             formatDownloads={formatDownloads}
             getCategoryIcon={getCategoryIcon}
           />
@@ -8,6 +8,7 @@ import AuthModal from "@/components/AuthModal";
 import FilterSection from "@/components/FilterSection";
 import StatsSection from "@/components/StatsSection";
 import TorrentGrid from "@/components/TorrentGrid";
+import { syncCatalog } from "@/lib/catalogCache";
 
 interface TorrentCard {
   id: number;
@@ -83,9 +84,7 @@ const Index = () => {
 
   const fetchTorrents = async () => {
     try {
-      const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae');
-      const data = await response.json();
-      setAllTorrents(data.torrents || []);
+      setAllTorrents(await syncCatalog<TorrentCard>());
     } catch (error) {
       console.error('Ошибка загрузки торрентов:', error);
     } finally {
@@ -12,14 +12,15 @@ const SearchResults = () => {
   const navigate = useNavigate();
   const query = searchParams.get('q') || '';
   
-  const [allTorrents, setAllTorrents] = useState<any[]>([]);
+  const [searchResults, setSearchResults] = useState<any[]>([]);
+  const [total, setTotal] = useState(0);
+  const [totalExact, setTotalExact] = useState(true);
   const [categories, setCategories] = useState<any[]>([]);
   const [loading, setLoading] = useState(true);
   const [user, setUser] = useState<any>(null);
   const [showAuthModal, setShowAuthModal] = useState(false);
 
   useEffect(() => {
-    fetchTorrents();
     fetchCategories();
     const savedUser = localStorage.getItem('user');
     if (savedUser) {
@@ -27,11 +28,18 @@ const SearchResults = () => {
     }
   }, []);
 
+  useEffect(() => {
+    fetchTorrents();
+  }, [query]);
+
   const fetchTorrents = async () => {
+    setLoading(true);
     try {
-      const response = await fetch('https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae');
+      const response = await fetch(`https://functions.poehali.dev/666e4a26-f33a-4f88-b3b1-d9aaa5b427ae?action=search&limit=100&q=${encodeURIComponent(query)}`);
       const data = await response.json();
-      setAllTorrents(data.torrents || []);
+      setSearchResults(data.torrents || []);
+      setTotal(data.total || 0);
+      setTotalExact(data.totalExact !== false);
     } catch (error) {
       console.error('Ошибка загрузки торрентов:', error);
     } finally {
@@ -73,10 +81,6 @@ const SearchResults = () => {
     return downloads.toString();
   };
 
-  const searchResults = allTorrents.filter(torrent =>
-    torrent.title.toLowerCase().includes(query.toLowerCase())
-  );
-
   if (loading) {
     return (
       <div className="min-h-screen bg-background flex items-center justify-center">
@@ -124,7 +128,7 @@ const SearchResults = () => {
               {query}
             </Badge>
             <span>•</span>
-            <span>{searchResults.length} игр найдено</span>
+            <span>{total}{totalExact ? '' : '+'} игр найдено</span>
           </div>
         </div>
 